@@ -0,0 +1,131 @@
+"""Per-turn client overhead of DeepSeekClient.run against an instant fake model.
+
+Each run is a tool-call turn followed by a final-answer turn, so the timing is
+the client's own work (request building, history handling, tool dispatch) and
+not the model's. `before` replays the per-turn work that compile_agent and
+copy-on-write history removed: tools rebuilt with function_to_json on every turn,
+deep copies of the history and context, and the model_dump_json round trip.
+
+Run from src/backend:  python -m apps.agent.deepseek.bench
+"""
+import copy
+import json
+import time
+import argparse
+import statistics
+from typing import Any, Dict, List
+
+from openai.types.chat import ChatCompletion
+
+from .core import DeepSeekClient
+from .types import Agent, Result
+
+
+def _completion(content=None, tool_calls=None) -> ChatCompletion:
+    return ChatCompletion.model_validate({
+        "id": "bench", "object": "chat.completion", "created": 0, "model": "bench",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content, "tool_calls": tool_calls}}],
+    })
+
+
+_ANSWER = _completion(content="好的，" * 40)
+_TOOL_CALL = _completion(tool_calls=[{
+    "id": "call-1", "type": "function",
+    "function": {"name": "call_mcp", "arguments": json.dumps(
+        {"tool_name": "search_medias", "parameters": {"query": {"genre": "科幻"}}})},
+}])
+
+
+class _InstantModel:
+    """OpenAI client stand-in: asks for one tool call, then answers."""
+
+    class chat:
+        class completions:
+            @staticmethod
+            def create(**params):
+                return _TOOL_CALL if params["messages"][-1]["role"] == "user" else _ANSWER
+
+
+def call_mcp(tool_name: str, parameters: dict, context_variables: dict = {}):
+    """Call a tool on the MCP server"""
+    return Result(value=json.dumps({"data": {"result": ["星际穿越"] * 20}}, ensure_ascii=False))
+
+
+def search_people(query: str, limit: int = 10, context_variables: dict = {}):
+    """Search directors and actors"""
+
+
+def media_detail(name: str, year: int, region: str = "", context_variables: dict = {}):
+    """Look up one title"""
+
+
+class LegacyClient(DeepSeekClient):
+    """DeepSeekClient with the removed per-turn work added back, for comparison."""
+
+    def run(self, agent: Agent, messages: List, context_variables: dict = {}, **kwargs):
+        return super().run(agent, copy.deepcopy(messages), copy.deepcopy(context_variables), **kwargs)
+
+    def completion_params(self, agent: Agent, *args, **kwargs) -> dict:
+        agent._compiled = None  # rebuild the tools payload every turn
+        return super().completion_params(agent, *args, **kwargs)
+
+    def get_chat_completion(self, *args, **kwargs):
+        completion = super().get_chat_completion(*args, **kwargs)
+        json.loads(completion.choices[0].message.model_dump_json())
+        return completion
+
+
+def history(length: int) -> List[Dict[str, Any]]:
+    """A chat history of about `length` messages ending with a user turn."""
+    messages = []
+    for i in range(length // 2):
+        messages.append({"role": "user", "content": f"第{i}个问题：" + "推荐几部科幻电影" * 5})
+        messages.append({"role": "assistant", "content": "星际穿越、盗梦空间、银翼杀手2049。" * 4, "sender": "bench",
+                         "function_call": None, "tool_calls": None, "refusal": None, "audio": None,
+                         "annotations": None})
+    messages.append({"role": "user", "content": "再来几部"})
+    return messages
+
+
+def _per_turn_us(client: DeepSeekClient, agent: Agent, messages: List, repeat: int) -> float:
+    context_variables = {"user": {"id": 1, "prefs": ["科幻"] * 20}}
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        client.run(agent=agent, messages=messages, context_variables=context_variables)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) / 2 * 1e6  # two turns per run
+
+
+def bench(lengths=(10, 100, 1000, 5000), repeat: int = 100) -> List[Dict[str, Any]]:
+    """Median per-turn client overhead (microseconds) before and after, per history length."""
+    agent = Agent(name="bench", instructions="你是一个功能强大的对话助手。" * 30,
+                  functions=[call_mcp, search_people, media_detail])
+    before = LegacyClient(client=_InstantModel(), async_client=object())
+    after = DeepSeekClient(client=_InstantModel(), async_client=object())
+    rows = []
+    for length in lengths:
+        messages = history(length)
+        runs = repeat if length < 1000 else max(repeat // 5, 1)
+        rows.append({
+            "history": length,
+            "before_us": _per_turn_us(before, agent, messages, runs),
+            "after_us": _per_turn_us(after, agent, messages, runs),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DeepSeekClient per-turn overhead benchmark')
+    parser.add_argument('--repeat', type=int, default=100, help='Runs per history length (fewer for long histories)')
+    parser.add_argument('--history', type=int, nargs='+', default=[10, 100, 1000, 5000], help='History lengths')
+    args = parser.parse_args()
+
+    print(f"{'history':>8s} {'before':>10s} {'after':>10s}")
+    for row in bench(args.history, args.repeat):
+        print(f"{row['history']:8d} {row['before_us']:8.1f}us {row['after_us']:8.1f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,16 @@
 # Standard library imports
-import copy
 import json
+import time
+import asyncio
+import inspect
+import functools
+import contextvars
+import concurrent.futures
 from collections import defaultdict
-from typing import List, Callable, Union
+from typing import List, Callable, NamedTuple, Optional, Tuple, Union
 
 # Package/library imports
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 
 
 # Local imports
@@ -13,6 +18,7 @@ from .util import function_to_json, debug_print, merge_chunk
 from .types import (
     Agent,
     AgentFunction,
+    CompiledAgent,
     ChatCompletionMessage,
     ChatCompletionMessageToolCall,
     Function,
@@ -23,13 +29,103 @@ from .types import (
 __CTX_VARS_NAME__ = "context_variables"
 
 
+def compile_agent(agent: Agent) -> CompiledAgent:
+    """Build the tools payload (context_variables hidden from the model), the system
+    message and the function map once per agent instead of on every turn. The result
+    is cached on the agent and rebuilt when its functions or instructions are replaced."""
+    key = (tuple(agent.functions), agent.instructions)
+    compiled = agent._compiled
+    if compiled is not None and compiled.key == key:
+        return compiled
+
+    tools = [function_to_json(f) for f in agent.functions]
+    # hide context_variables from model
+    for tool in tools:
+        params = tool["function"]["parameters"]
+        params["properties"].pop(__CTX_VARS_NAME__, None)
+        if __CTX_VARS_NAME__ in params["required"]:
+            params["required"].remove(__CTX_VARS_NAME__)
+
+    compiled = CompiledAgent(
+        key=key,
+        tools=tools or None,
+        system_message=None if callable(agent.instructions) else {"role": "system", "content": agent.instructions},
+        function_map={f.__name__: f for f in agent.functions},
+    )
+    agent._compiled = compiled
+    return compiled
+
+
+def function_map_for(functions: List[AgentFunction], agent: Optional[Agent]) -> dict:
+    if agent is not None and agent.functions is functions:
+        return compile_agent(agent).function_map
+    return {f.__name__: f for f in functions}
+
+
+def new_stream_message(agent: Agent) -> dict:
+    """Empty assistant message that streamed deltas are merged into."""
+    return {
+        "content": "",
+        "sender": agent.name,
+        "role": "assistant",
+        "function_call": None,
+        "tool_calls": defaultdict(
+            lambda: {
+                "function": {"arguments": "", "name": ""},
+                "id": "",
+                "type": "",
+            }
+        ),
+    }
+
+
+def tool_call_objects(message: dict) -> List[ChatCompletionMessageToolCall]:
+    """Convert the tool_calls of a streamed message to objects."""
+    tool_calls = []
+    for tool_call in message["tool_calls"]:
+        function = Function(
+            arguments=tool_call["function"]["arguments"],
+            name=tool_call["function"]["name"],
+        )
+        tool_call_object = ChatCompletionMessageToolCall(
+            id=tool_call["id"], function=function, type=tool_call["type"]
+        )
+        tool_calls.append(tool_call_object)
+    return tool_calls
+
+
+class ToolJob(NamedTuple):
+    """One unit of concurrent tool work: a single call, a batched group or the
+    coroutine calls of a turn. `run` returns {tool_call_id: raw_result}."""
+    name: str
+    call_ids: List[str]
+    run: Callable[[], dict]
+    timeout: Optional[float]
+
+
+class ToolTimeout(Exception):
+    def __init__(self, name: str, timeout: Optional[float]):
+        super().__init__(f"Tool {name} timed out after {timeout}s")
+
+
 class DeepSeekClient:
-    def __init__(self, client=None, key='sk-d53a6d90486e462aa755d198e940ea9d', url='https://api.deepseek.com'):
+    def __init__(self, client=None, key='sk-d53a6d90486e462aa755d198e940ea9d', url='https://api.deepseek.com',
+                 max_tool_workers: int = 8, tool_timeout: Optional[float] = None, async_client=None):
         if not client:
             client = OpenAI(api_key=key, base_url=url)
+        # used by run_async/run_stream_async; its connection pool belongs to the event
+        # loop of the ASGI server, so share the client only within one loop
+        if not async_client:
+            async_client = AsyncOpenAI(api_key=key, base_url=url)
         self.client = client
-
-    def get_chat_completion(
+        self.async_client = async_client
+        # tool calls of one turn run concurrently on a pool of at most max_tool_workers
+        # threads owned by that turn; a function's `timeout` attribute overrides
+        # tool_timeout (None waits indefinitely)
+        self.max_tool_workers = max_tool_workers
+        self.tool_timeout = tool_timeout
+
+    def completion_params(
         self,
         agent: Agent,
         history: List,
@@ -37,36 +133,50 @@ class DeepSeekClient:
         model_override: str,
         stream: bool,
         debug: bool,
-    ) -> ChatCompletionMessage:
-        context_variables = defaultdict(str, context_variables)
-        instructions = (
-            agent.instructions(context_variables)
-            if callable(agent.instructions)
-            else agent.instructions
-        )
-        messages = [{"role": "system", "content": instructions}] + history
+    ) -> dict:
+        compiled = compile_agent(agent)
+        system_message = compiled.system_message
+        if system_message is None:
+            system_message = {"role": "system", "content": agent.instructions(defaultdict(str, context_variables))}
+        messages = [system_message, *history]
         debug_print(debug, "Getting chat completion for...:", messages)
 
-        tools = [function_to_json(f) for f in agent.functions]
-        # hide context_variables from model
-        for tool in tools:
-            params = tool["function"]["parameters"]
-            params["properties"].pop(__CTX_VARS_NAME__, None)
-            if __CTX_VARS_NAME__ in params["required"]:
-                params["required"].remove(__CTX_VARS_NAME__)
-
         create_params = {
             "model": model_override or agent.model,
             "messages": messages,
-            "tools": tools or None,
+            "tools": compiled.tools,
             "tool_choice": agent.tool_choice,
             "stream": stream,
         }
 
-        if tools:
+        if compiled.tools:
             create_params["parallel_tool_calls"] = agent.parallel_tool_calls
 
-        return self.client.chat.completions.create(**create_params)
+        return create_params
+
+    def get_chat_completion(
+        self,
+        agent: Agent,
+        history: List,
+        context_variables: dict,
+        model_override: str,
+        stream: bool,
+        debug: bool,
+    ) -> ChatCompletionMessage:
+        return self.client.chat.completions.create(
+            **self.completion_params(agent, history, context_variables, model_override, stream, debug))
+
+    async def get_chat_completion_async(
+        self,
+        agent: Agent,
+        history: List,
+        context_variables: dict,
+        model_override: str,
+        stream: bool,
+        debug: bool,
+    ) -> ChatCompletionMessage:
+        return await self.async_client.chat.completions.create(
+            **self.completion_params(agent, history, context_variables, model_override, stream, debug))
 
     def handle_function_result(self, result, debug) -> Result:
         match result:
@@ -86,17 +196,281 @@ class DeepSeekClient:
                     debug_print(debug, error_message)
                     raise TypeError(error_message)
 
+    def batch_groups(self, tool_calls: List[ChatCompletionMessageToolCall], function_map: dict) -> dict:
+        """Group calls to a function that exposes a `batch` entry point (e.g. call_mcp).
+        Returns {name: [(tool_call_id, args), ...]} for functions called at least twice."""
+        groups = defaultdict(list)
+        for tool_call in tool_calls:
+            func = function_map.get(tool_call.function.name)
+            if func is None or not hasattr(func, "batch"):
+                continue
+            try:
+                args = json.loads(tool_call.function.arguments)
+            except json.JSONDecodeError:
+                continue
+            groups[tool_call.function.name].append((tool_call.id, args))
+        return {name: calls for name, calls in groups.items() if len(calls) >= 2}
+
+    def run_batched_tool_calls(
+        self,
+        tool_calls: List[ChatCompletionMessageToolCall],
+        function_map: dict,
+        context_variables: dict,
+        debug: bool,
+    ) -> dict:
+        """Merge several calls to a function that exposes a `batch` entry point
+        (e.g. call_mcp) into one batched call. Returns {tool_call_id: raw_result}."""
+        results = {}
+        for name, calls in self.batch_groups(tool_calls, function_map).items():
+            results.update(self._batch_job(name, calls, function_map, context_variables, debug).run())
+        return results
+
+    def _batch_job(self, name: str, calls: list, function_map: dict, context_variables: dict, debug: bool) -> ToolJob:
+        def run():
+            debug_print(debug, f"Batching {len(calls)} tool calls: {name}")
+            raw_results = function_map[name].batch([args for _, args in calls], context_variables)
+            return dict(zip([call_id for call_id, _ in calls], raw_results))
+
+        return ToolJob(
+            name=name,
+            call_ids=[call_id for call_id, _ in calls],
+            run=run,
+            timeout=self.tool_timeout_for(function_map[name]),
+        )
+
+    def tool_timeout_for(self, func: AgentFunction) -> Optional[float]:
+        """Per-tool timeout: the function's `timeout` attribute, else the client default."""
+        return getattr(func, "timeout", None) or self.tool_timeout
+
+    def run_tool_jobs(self, jobs: List[ToolJob], debug: bool) -> dict:
+        """Run the jobs of one turn concurrently and return {tool_call_id: raw_result
+        or exception}. Sync jobs go to the turn's own thread pool, each in a copy of the
+        caller's contextvars (e.g. the request deadline); the turn takes as long as the
+        slowest tool. A job that exceeds its timeout is abandoned and reported as ToolTimeout."""
+        if len(jobs) == 1 and jobs[0].timeout is None:
+            return self._run_job(jobs[0])
+
+        start = time.monotonic()
+        executor = self.turn_executor(len(jobs))
+        try:
+            submitted = [
+                (job, executor.submit(contextvars.copy_context().run, self._run_job, job))
+                for job in jobs
+            ]
+            outcomes = {}
+            for job, future in submitted:
+                timeout = None if job.timeout is None else max(job.timeout - (time.monotonic() - start), 0)
+                try:
+                    outcomes.update(future.result(timeout=timeout))
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+                    debug_print(debug, f"Tool {job.name} timed out after {job.timeout}s")
+                    outcomes.update({call_id: ToolTimeout(job.name, job.timeout) for call_id in job.call_ids})
+            return outcomes
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _run_job(job: ToolJob) -> dict:
+        try:
+            return job.run()
+        except Exception as e:
+            return {call_id: e for call_id in job.call_ids}
+
+    def _async_job(self, calls: list) -> ToolJob:
+        """Await coroutine functions together with asyncio.gather on a private loop,
+        each under its own timeout."""
+        async def gather():
+            results = await asyncio.gather(
+                *[asyncio.wait_for(func(**args), timeout) for _, _, func, args, timeout in calls],
+                return_exceptions=True,
+            )
+            return {
+                call_id: ToolTimeout(name, timeout) if isinstance(result, asyncio.TimeoutError) else result
+                for (call_id, name, _, _, timeout), result in zip(calls, results)
+            }
+
+        return ToolJob(
+            name=", ".join(name for _, name, _, _, _ in calls),
+            call_ids=[call_id for call_id, _, _, _, _ in calls],
+            run=lambda: asyncio.run(gather()),
+            timeout=None,
+        )
+
+    def turn_executor(self, jobs: int) -> concurrent.futures.ThreadPoolExecutor:
+        """A thread pool for the sync tool calls of one turn, sized to them (at most
+        max_tool_workers). Concurrent requests never queue behind each other's tools,
+        and a job abandoned on timeout only keeps its own thread, which exits when the
+        tool returns. The caller shuts it down without waiting once the turn is done."""
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(jobs, self.max_tool_workers)), thread_name_prefix="agent-tool")
+
+    @staticmethod
+    def _to_thread(executor: concurrent.futures.Executor, func: Callable, *args, **kwargs) -> asyncio.Future:
+        """Like asyncio.to_thread, but on the given pool: run a sync function with
+        the caller's contextvars without blocking the event loop."""
+        return asyncio.get_running_loop().run_in_executor(
+            executor,
+            functools.partial(contextvars.copy_context().run, func, *args, **kwargs),
+        )
+
+    def terminal_reply(
+        self,
+        agent: Agent,
+        tool_results: List[Tuple[str, Optional[Result]]],
+        debug: bool,
+    ) -> Optional[str]:
+        """If every tool call of the turn went to one of the agent's terminal tools
+        and succeeded, return the final reply built from the results; otherwise
+        None, and the results go back to the model as usual."""
+        if not agent.terminal_tools or not tool_results:
+            return None
+        for name, result in tool_results:
+            if name not in agent.terminal_tools or result is None or result.error or result.agent:
+                return None
+        results = [result for _, result in tool_results]
+        if agent.terminal_formatter is None:
+            return results[0].value if len(results) == 1 else None
+        reply = agent.terminal_formatter(results)
+        debug_print(debug, f"Terminal tool reply: {reply}")
+        return reply
+
+    def plan_tool_calls(
+        self,
+        tool_calls: List[ChatCompletionMessageToolCall],
+        function_map: dict,
+        context_variables: dict,
+        debug: bool,
+    ) -> Tuple[list, list]:
+        """Split the tool calls of a turn into batched groups [(name, [(tool_call_id, args), ...])]
+        and single calls [(tool_call_id, name, func, args)]. Each single call that takes
+        context_variables gets its own copy; missing tools are left to tool_response."""
+        batches = list(self.batch_groups(tool_calls, function_map).items())
+        batched = {call_id for _, calls in batches for call_id, _ in calls}
+        singles = []
+        for tool_call in tool_calls:
+            name = tool_call.function.name
+            if name not in function_map or tool_call.id in batched:
+                continue
+            args = json.loads(tool_call.function.arguments)
+            debug_print(
+                debug, f"Processing tool call: {name} with arguments {args}")
+
+            func = function_map[name]
+            # pass context_variables to agent functions
+            if __CTX_VARS_NAME__ in func.__code__.co_varnames:
+                args[__CTX_VARS_NAME__] = dict(context_variables)
+            singles.append((tool_call.id, name, func, args))
+        return batches, singles
+
     def handle_tool_calls(
         self,
         tool_calls: List[ChatCompletionMessageToolCall],
         functions: List[AgentFunction],
         context_variables: dict,
         debug: bool,
+        agent: Optional[Agent] = None,
+    ) -> Response:
+        """Run the tool calls of one turn concurrently. Tool messages keep the order of
+        `tool_calls`; each function sees its own copy of context_variables and the
+        returned updates are merged in that order. When `agent` has terminal tools and
+        they all succeed, the final assistant message is appended after the tool messages."""
+        function_map = function_map_for(functions, agent)
+        batches, singles = self.plan_tool_calls(tool_calls, function_map, context_variables, debug)
+
+        jobs = [
+            self._batch_job(name, calls, function_map, dict(context_variables), debug)
+            for name, calls in batches
+        ]
+        async_calls = []
+        for call_id, name, func, args in singles:
+            if inspect.iscoroutinefunction(func):
+                async_calls.append((call_id, name, func, args, self.tool_timeout_for(func)))
+            else:
+                jobs.append(ToolJob(
+                    name=name,
+                    call_ids=[call_id],
+                    run=lambda call_id=call_id, func=func, args=args: {call_id: func(**args)},
+                    timeout=self.tool_timeout_for(func),
+                ))
+        if async_calls:
+            jobs.append(self._async_job(async_calls))
+        outcomes = self.run_tool_jobs(jobs, debug) if jobs else {}
+        return self.tool_response(tool_calls, function_map, outcomes, debug, agent)
+
+    async def handle_tool_calls_async(
+        self,
+        tool_calls: List[ChatCompletionMessageToolCall],
+        functions: List[AgentFunction],
+        context_variables: dict,
+        debug: bool,
+        agent: Optional[Agent] = None,
+    ) -> Response:
+        """Async counterpart of handle_tool_calls used by run_async. A function (or its
+        `batch` entry point) with an `aio` coroutine variant, or a coroutine function,
+        is awaited on the running loop; other functions run on the turn's thread pool.
+        All calls of the turn are gathered concurrently, each under its own timeout."""
+        function_map = function_map_for(functions, agent)
+        batches, singles = self.plan_tool_calls(tool_calls, function_map, context_variables, debug)
+
+        executor = None
+
+        def to_thread(func: Callable, *args, **kwargs) -> asyncio.Future:
+            nonlocal executor
+            if executor is None:
+                executor = self.turn_executor(len(batches) + len(singles))
+            return self._to_thread(executor, func, *args, **kwargs)
+
+        pending = []  # (name, call_ids, awaitable, timeout, batched)
+        for name, calls in batches:
+            debug_print(debug, f"Batching {len(calls)} tool calls: {name}")
+            batch = function_map[name].batch
+            args_list = [args for _, args in calls]
+            batch_aio = getattr(batch, "aio", None)
+            awaitable = (batch_aio(args_list, dict(context_variables)) if batch_aio
+                         else to_thread(batch, args_list, dict(context_variables)))
+            pending.append((name, [call_id for call_id, _ in calls], awaitable,
+                            self.tool_timeout_for(function_map[name]), True))
+        for call_id, name, func, args in singles:
+            impl = getattr(func, "aio", func)
+            awaitable = impl(**args) if inspect.iscoroutinefunction(impl) else to_thread(impl, **args)
+            pending.append((name, [call_id], awaitable, self.tool_timeout_for(func), False))
+
+        try:
+            results = await asyncio.gather(
+                *[asyncio.wait_for(awaitable, timeout) for _, _, awaitable, timeout, _ in pending],
+                return_exceptions=True,
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        outcomes = {}
+        for (name, call_ids, _, timeout, batched), result in zip(pending, results):
+            if isinstance(result, asyncio.TimeoutError):
+                debug_print(debug, f"Tool {name} timed out after {timeout}s")
+                result = ToolTimeout(name, timeout)
+            if isinstance(result, BaseException):
+                outcomes.update({call_id: result for call_id in call_ids})
+            elif batched:
+                outcomes.update(zip(call_ids, result))
+            else:
+                outcomes[call_ids[0]] = result
+        return self.tool_response(tool_calls, function_map, outcomes, debug, agent)
+
+    def tool_response(
+        self,
+        tool_calls: List[ChatCompletionMessageToolCall],
+        function_map: dict,
+        outcomes: dict,
+        debug: bool,
+        agent: Optional[Agent] = None,
     ) -> Response:
-        function_map = {f.__name__: f for f in functions}
+        """Build the tool messages of a turn, in the order of `tool_calls`, from
+        {tool_call_id: raw_result or exception}."""
         partial_response = Response(
             messages=[], agent=None, context_variables={})
 
+        tool_results = []
         for tool_call in tool_calls:
             name = tool_call.function.name
             # handle missing tool case, skip to next tool
@@ -110,18 +484,16 @@ class DeepSeekClient:
                         "content": f"Error: Tool {name} not found.",
                     }
                 )
+                tool_results.append((name, None))
                 continue
-            args = json.loads(tool_call.function.arguments)
-            debug_print(
-                debug, f"Processing tool call: {name} with arguments {args}")
-
-            func = function_map[name]
-            # pass context_variables to agent functions
-            if __CTX_VARS_NAME__ in func.__code__.co_varnames:
-                args[__CTX_VARS_NAME__] = context_variables
-            raw_result = function_map[name](**args)
 
-            result: Result = self.handle_function_result(raw_result, debug)
+            raw_result = outcomes[tool_call.id]
+            if isinstance(raw_result, ToolTimeout):
+                result = Result(value=f"Error: {raw_result}", error=True)
+            elif isinstance(raw_result, BaseException):
+                raise raw_result
+            else:
+                result: Result = self.handle_function_result(raw_result, debug)
             partial_response.messages.append(
                 {
                     "role": "tool",
@@ -133,7 +505,19 @@ class DeepSeekClient:
             partial_response.context_variables.update(result.context_variables)
             if result.agent:
                 partial_response.agent = result.agent
+            tool_results.append((name, result))
 
+        reply = self.terminal_reply(agent, tool_results, debug) if agent else None
+        if reply is not None:
+            partial_response.messages.append(
+                {
+                    "content": reply,
+                    "sender": agent.name,
+                    "role": "assistant",
+                    "function_call": None,
+                    "tool_calls": None,
+                }
+            )
         return partial_response
 
     def run_stream(
@@ -147,25 +531,16 @@ class DeepSeekClient:
         execute_tools: bool = True,
     ):
         active_agent = agent
-        context_variables = copy.deepcopy(context_variables)
-        history = copy.deepcopy(messages)
+        # copy-on-write: messages are only appended, never modified in place, so the
+        # caller's history (and the top level of context_variables) is shared instead
+        # of deep-copied on every call
+        context_variables = dict(context_variables)
+        history = list(messages)
         init_len = len(messages)
 
         while len(history) - init_len < max_turns:
 
-            message = {
-                "content": "",
-                "sender": agent.name,
-                "role": "assistant",
-                "function_call": None,
-                "tool_calls": defaultdict(
-                    lambda: {
-                        "function": {"arguments": "", "name": ""},
-                        "id": "",
-                        "type": "",
-                    }
-                ),
-            }
+            message = new_stream_message(agent)
 
             # get completion with current history, agent
             completion = self.get_chat_completion(
@@ -199,26 +574,22 @@ class DeepSeekClient:
                 debug_print(debug, "Ending turn.")
                 break
 
-            # convert tool_calls to objects
-            tool_calls = []
-            for tool_call in message["tool_calls"]:
-                function = Function(
-                    arguments=tool_call["function"]["arguments"],
-                    name=tool_call["function"]["name"],
-                )
-                tool_call_object = ChatCompletionMessageToolCall(
-                    id=tool_call["id"], function=function, type=tool_call["type"]
-                )
-                tool_calls.append(tool_call_object)
-
             # handle function calls, updating context_variables, and switching agents
             partial_response = self.handle_tool_calls(
-                tool_calls, active_agent.functions, context_variables, debug
+                tool_call_objects(message), active_agent.functions, context_variables, debug, agent=active_agent
             )
             history.extend(partial_response.messages)
             context_variables.update(partial_response.context_variables)
             if partial_response.agent:
                 active_agent = partial_response.agent
+            if history[-1]["role"] == "assistant":
+                # terminal tool result is the reply, stream it as one delta
+                final = history[-1]
+                yield {"delim": "start"}
+                yield {"content": final["content"], "sender": final["sender"], "role": "assistant"}
+                yield {"delim": "end"}
+                debug_print(debug, "Ending turn with terminal tool result.")
+                break
 
         yield {
             "response": Response(
@@ -240,7 +611,7 @@ class DeepSeekClient:
         execute_tools: bool = True,
     ) -> Response:
         if stream:
-            return self.run_and_stream(
+            return self.run_stream(
                 agent=agent,
                 messages=messages,
                 context_variables=context_variables,
@@ -250,8 +621,9 @@ class DeepSeekClient:
                 execute_tools=execute_tools,
             )
         active_agent = agent
-        context_variables = copy.deepcopy(context_variables)
-        history = copy.deepcopy(messages)
+        # copy-on-write, see run_stream
+        context_variables = dict(context_variables)
+        history = list(messages)
         init_len = len(messages)
 
         while len(history) - init_len < max_turns and active_agent:
@@ -268,9 +640,7 @@ class DeepSeekClient:
             message = completion.choices[0].message
             debug_print(debug, "Received completion:", message)
             message.sender = active_agent.name
-            history.append(
-                json.loads(message.model_dump_json())
-            )  # to avoid OpenAI types (?)
+            history.append(message.model_dump(mode="json"))  # plain dict, same as the JSON round trip
 
             if not message.tool_calls or not execute_tools:
                 debug_print(debug, "Ending turn.")
@@ -278,12 +648,159 @@ class DeepSeekClient:
 
             # handle function calls, updating context_variables, and switching agents
             partial_response = self.handle_tool_calls(
-                message.tool_calls, active_agent.functions, context_variables, debug
+                message.tool_calls, active_agent.functions, context_variables, debug, agent=active_agent
             )
             history.extend(partial_response.messages)
             context_variables.update(partial_response.context_variables)
             if partial_response.agent:
                 active_agent = partial_response.agent
+            if history[-1]["role"] == "assistant":
+                debug_print(debug, "Ending turn with terminal tool result.")
+                break
+
+        return Response(
+            messages=history[init_len:],
+            agent=active_agent,
+            context_variables=context_variables,
+        )
+
+    async def run_stream_async(
+        self,
+        agent: Agent,
+        messages: List,
+        context_variables: dict = {},
+        model_override: str = 'deepseek-chat',
+        debug: bool = False,
+        max_turns: int = float("inf"),
+        execute_tools: bool = True,
+    ):
+        """Async generator counterpart of run_stream, on AsyncOpenAI."""
+        active_agent = agent
+        context_variables = dict(context_variables)
+        history = list(messages)
+        init_len = len(messages)
+
+        while len(history) - init_len < max_turns:
+
+            message = new_stream_message(agent)
+
+            # get completion with current history, agent
+            completion = await self.get_chat_completion_async(
+                agent=active_agent,
+                history=history,
+                context_variables=context_variables,
+                model_override=model_override,
+                stream=True,
+                debug=debug,
+            )
+
+            yield {"delim": "start"}
+            async for chunk in completion:
+                delta = json.loads(chunk.choices[0].delta.json())
+                if delta["role"] == "assistant":
+                    delta["sender"] = active_agent.name
+                yield delta
+                delta.pop("role", None)
+                delta.pop("sender", None)
+                merge_chunk(message, delta)
+            yield {"delim": "end"}
+
+            message["tool_calls"] = list(
+                message.get("tool_calls", {}).values())
+            if not message["tool_calls"]:
+                message["tool_calls"] = None
+            debug_print(debug, "Received completion:", message)
+            history.append(message)
+
+            if not message["tool_calls"] or not execute_tools:
+                debug_print(debug, "Ending turn.")
+                break
+
+            # handle function calls, updating context_variables, and switching agents
+            partial_response = await self.handle_tool_calls_async(
+                tool_call_objects(message), active_agent.functions, context_variables, debug, agent=active_agent
+            )
+            history.extend(partial_response.messages)
+            context_variables.update(partial_response.context_variables)
+            if partial_response.agent:
+                active_agent = partial_response.agent
+            if history[-1]["role"] == "assistant":
+                # terminal tool result is the reply, stream it as one delta
+                final = history[-1]
+                yield {"delim": "start"}
+                yield {"content": final["content"], "sender": final["sender"], "role": "assistant"}
+                yield {"delim": "end"}
+                debug_print(debug, "Ending turn with terminal tool result.")
+                break
+
+        yield {
+            "response": Response(
+                messages=history[init_len:],
+                agent=active_agent,
+                context_variables=context_variables,
+            )
+        }
+
+    async def run_async(
+        self,
+        agent: Agent,
+        messages: List,
+        context_variables: dict = {},
+        model_override: str = 'deepseek-chat',
+        stream: bool = False,
+        debug: bool = False,
+        max_turns: int = float("inf"),
+        execute_tools: bool = True,
+    ) -> Response:
+        """Async counterpart of run, on AsyncOpenAI: the LLM round trips and
+        `aio` tool variants wait on the event loop instead of holding a thread.
+        With stream=True, returns the run_stream_async generator."""
+        if stream:
+            return self.run_stream_async(
+                agent=agent,
+                messages=messages,
+                context_variables=context_variables,
+                model_override=model_override,
+                debug=debug,
+                max_turns=max_turns,
+                execute_tools=execute_tools,
+            )
+        active_agent = agent
+        context_variables = dict(context_variables)
+        history = list(messages)
+        init_len = len(messages)
+
+        while len(history) - init_len < max_turns and active_agent:
+
+            # get completion with current history, agent
+            completion = await self.get_chat_completion_async(
+                agent=active_agent,
+                history=history,
+                context_variables=context_variables,
+                model_override=model_override,
+                stream=stream,
+                debug=debug,
+            )
+            message = completion.choices[0].message
+            debug_print(debug, "Received completion:", message)
+            message.sender = active_agent.name
+            history.append(message.model_dump(mode="json"))  # plain dict, same as the JSON round trip
+
+            if not message.tool_calls or not execute_tools:
+                debug_print(debug, "Ending turn.")
+                break
+
+            # handle function calls, updating context_variables, and switching agents
+            partial_response = await self.handle_tool_calls_async(
+                message.tool_calls, active_agent.functions, context_variables, debug, agent=active_agent
+            )
+            history.extend(partial_response.messages)
+            context_variables.update(partial_response.context_variables)
+            if partial_response.agent:
+                active_agent = partial_response.agent
+            if history[-1]["role"] == "assistant":
+                debug_print(debug, "Ending turn with terminal tool result.")
+                break
 
         return Response(
             messages=history[init_len:],
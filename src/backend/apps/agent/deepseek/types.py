@@ -3,12 +3,20 @@ from openai.types.chat.chat_completion_message_tool_call import (
     ChatCompletionMessageToolCall,
     Function,
 )
-from typing import List, Callable, Union, Optional
-from pydantic import BaseModel
+from typing import List, Callable, NamedTuple, Union, Optional
+from pydantic import BaseModel, PrivateAttr
 
 # 定义AgentFunction类型，它是一个可调用对象，返回值可以是字符串、字典或Agent对象
 AgentFunction = Callable[[], Union[str, dict, "Agent"]]
 
+class CompiledAgent(NamedTuple):
+    """Per-agent request parts that stay the same from turn to turn, built by compile_agent."""
+    key: tuple                        # (functions, instructions) the parts were built from
+    tools: Optional[list]             # final tools payload, context_variables hidden
+    system_message: Optional[dict]    # None when instructions depend on context_variables
+    function_map: dict
+
+
 class Agent(BaseModel):
     name: str = "Agent"
     model: str = "model"
@@ -16,6 +24,12 @@ class Agent(BaseModel):
     functions: List[AgentFunction] = []
     tool_choice: str = None
     parallel_tool_calls: bool = True
+    # 终止型工具：一轮中的工具调用全部属于这些工具且都执行成功时，不再请求模型复述结果，
+    # 工具结果直接作为最终答复；terminal_formatter(results: List[Result])可把结果格式化为答复，返回None时仍交给模型
+    terminal_tools: List[str] = []
+    terminal_formatter: Optional[Callable] = None
+    # compile_agent的缓存，functions或instructions被替换后重新编译
+    _compiled: Optional[CompiledAgent] = PrivateAttr(default=None)
 
 
 class Response(BaseModel):
@@ -32,8 +46,10 @@ class Result(BaseModel):
         value (str): The result value as a string.
         agent (Agent): The agent instance, if applicable.
         context_variables (dict): A dictionary of context variables.
+        error (bool): Whether the function failed; failed terminal tools fall back to the model.
     """
 
     value: str = ""
     agent: Optional[Agent] = None
     context_variables: dict = {}
+    error: bool = False
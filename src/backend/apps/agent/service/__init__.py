@@ -1,5 +1,7 @@
 from .core import Service
 from .task import Task
 from .sse_update import SseView
+from .clients import get_mcp_session, get_mcp_transport
+from .deadline import request_deadline, request_budget
 
-__all__ = ["Service", "Task", "SseView"]
+__all__ = ["Service", "Task", "SseView", "get_mcp_session", "get_mcp_transport", "request_deadline", "request_budget"]
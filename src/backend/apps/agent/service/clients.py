@@ -1,6 +1,15 @@
+import time
+import asyncio
+import threading
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
 from ..deepseek import DeepSeekClient
 from ..zhipu import ZhiPuClient
 from ..database import RedisClient
+from .transports import create_transport
 
 deepseek_client = DeepSeekClient(key='sk-d53a6d90486e462aa755d198e940ea9d', url='https://api.deepseek.com')
 
@@ -13,4 +22,107 @@ def get_redis_client():
     global redis_client
     if redis_client is None:
         redis_client = RedisClient()
-    return redis_client
\ No newline at end of file
+    return redis_client
+
+
+class MCPSession:
+    """到MCP Client的持久HTTP连接池，call_mcp/call_mcp_batch共用，避免每次调用重新建立TCP连接
+
+    异步视图经apost使用aiohttp连接池，连接池属于事件循环，每个事件循环各建一个（ASGI服务只有一个）。
+    """
+    def __init__(self, base_url=None, pool_size=None, idle_timeout=None):
+        self.base_url = base_url or getattr(settings, 'MCP_URL', 'http://127.0.0.1:9000')
+        self.pool_size = pool_size or getattr(settings, 'MCP_POOL_SIZE', 10)
+        self.idle_timeout = idle_timeout or getattr(settings, 'MCP_POOL_IDLE_TIMEOUT', 60)
+        self.lock = threading.Lock()
+        self.session = None
+        self.async_sessions = {}  # 事件循环 -> aiohttp.ClientSession
+        self.last_used = 0.0
+        self.sessions_created = 0
+        self.requests = 0
+
+    def _get_session(self):
+        with self.lock:
+            now = time.time()
+            # 空闲过久的连接可能已被服务端关闭，整体重建连接池
+            if self.session is not None and now - self.last_used > self.idle_timeout:
+                self.session.close()
+                self.session = None
+            if self.session is None:
+                self.session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=False)
+                self.session.mount('http://', adapter)
+                self.session.mount('https://', adapter)
+                self.sessions_created += 1
+            self.last_used = now
+            self.requests += 1
+            return self.session
+
+    def post(self, path, **kwargs):
+        return self._get_session().post(f"{self.base_url}{path}", **kwargs)
+
+    def _get_async_session(self):
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            # 事件循环已关闭的连接池无法再使用，直接丢弃
+            self.async_sessions = {l: session for l, session in self.async_sessions.items() if not l.is_closed()}
+            session = self.async_sessions.get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.idle_timeout)
+                session = self.async_sessions[loop] = aiohttp.ClientSession(connector=connector)
+                self.sessions_created += 1
+            self.requests += 1
+            return session
+
+    def apost(self, path, **kwargs):
+        """post的异步版本，返回aiohttp的请求上下文管理器：async with session.apost(...) as response"""
+        return self._get_async_session().post(f"{self.base_url}{path}", **kwargs)
+
+    def stats(self):
+        """连接池占用和复用统计"""
+        connections = 0
+        pool_requests = 0
+        idle = 0
+        if self.session is not None:
+            pools = self.session.get_adapter(self.base_url).poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                connections += pool.num_connections
+                pool_requests += pool.num_requests
+                # 队列中预先填充了None占位，只统计实际空闲的连接
+                idle += sum(1 for conn in list(pool.pool.queue) if conn) if pool.pool else 0
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.pool_size,
+            "idle_timeout": self.idle_timeout,
+            "sessions_created": self.sessions_created,
+            "requests": self.requests,
+            "connections": connections,
+            "reused": max(pool_requests - connections, 0),
+            "idle": idle,
+            "async_sessions": len(self.async_sessions),
+        }
+
+
+mcp_session = None
+
+def get_mcp_session():
+    global mcp_session
+    if mcp_session is None:
+        mcp_session = MCPSession()
+    return mcp_session
+
+
+mcp_transport = None
+mcp_transport_lock = threading.Lock()
+
+def get_mcp_transport():
+    """call_mcp使用的传输方式，由settings.MCP_TRANSPORT选择（http / inprocess / uds）"""
+    global mcp_transport
+    if mcp_transport is None:
+        with mcp_transport_lock:
+            if mcp_transport is None:
+                mcp_transport = create_transport(getattr(settings, 'MCP_TRANSPORT', 'http'), session=get_mcp_session())
+    return mcp_transport
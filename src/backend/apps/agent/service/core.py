@@ -1,15 +1,21 @@
 from django.conf import settings
 import os
+import re
+import asyncio
 import json
 import ast
+import logging
 from ..deepseek import Agent
 
-from .clients import deepseek_client, zhipu_client, get_redis_client
+from .clients import deepseek_client, zhipu_client, get_redis_client, get_mcp_transport
+from .deadline import check_budget
 
 import requests
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from ..deepseek import Result
 
+logger = logging.getLogger(__name__)
+
 
 
 class Service():
@@ -51,6 +57,10 @@ class Service():
             - 信息不全时，不用填写query里所有字段，例如：{"tool_name": "search_medias", "parameters": {"query": {"director": "张艺谋", "actor": "陈道明"}}}}
             - 年份说明：min_year和max_year是开始年份和结束年份，开始年份一定小于结束年份，且2010年之前则只填写max_year，2010年之后则填写min_year
             - 此外注意，单独提到人名时，将该字段同时填入actor和director字段中
+            - 人名尽量填写完整姓名，中文名和英文名均可，例如"Zhang Yimou"
+            - 用户提到语言时填写language字段，例如："粤语电影" → {"tool_name": "search_medias", "parameters": {"query": {"language": "粤语"}}}
+            - 可选排序和分页参数与query同级：sort_by（YEAR按年份/DOUBAN_SCORE按评分/DOUBAN_VOTES按热度/BLEND综合，默认YEAR），limit（返回数量，默认100），offset（跳过数量，默认0）
+            例如："评分最高的科幻电影" → {"tool_name": "search_medias", "parameters": {"query": {"genre": "科幻"}, "sort_by": "DOUBAN_SCORE", "limit": 20}}
             3. 从工具返回的结果中提取信息回答用户
 
             当用户询问最新热门影视问题时：
@@ -61,10 +71,13 @@ class Service():
             
 """
             '''
+        # call_mcp返回的片名列表就是最终答复，不再请求模型复述一遍
         self.agent_media = Agent(
             name='Movie Search Agent',
             instructions=self.media_prompt,
-            functions=[call_mcp]
+            functions=[call_mcp],
+            terminal_tools=['call_mcp'],
+            terminal_formatter=format_media_names
         )
 
         self.figure_prompt = '''你是一个专业的可输入图片的多模态影视查询助手。根据用户输入，返回匹配的影视元素信息，包括片名，导演，演员：
@@ -96,6 +109,40 @@ class Service():
         self.chat_history.append(response.messages[0])
         return response.messages[0]['content']
 
+    def _chat_stream(self, message:str):
+        """流式对话：模型每生成一个片段就产出一次，结束（或TV端断开）后把已生成的回复写入对话历史"""
+        self.chat_history.append({"role": "user", "content": message})
+        reply = ''
+        try:
+            for chunk in deepseek_client.run(agent=self.agent_talk, messages=self.chat_history, stream=True):
+                content = chunk.get('content')
+                if content:
+                    reply += content
+                    yield content
+        finally:
+            if reply:
+                self.chat_history.append({"role": "assistant", "content": reply})
+
+    async def _chat_async(self, message:str):
+        self.chat_history.append({"role": "user", "content": message})
+        response = await deepseek_client.run_async(agent=self.agent_talk, messages=self.chat_history)
+        self.chat_history.append(response.messages[0])
+        return response.messages[0]['content']
+
+    async def _chat_stream_async(self, message:str):
+        """_chat_stream的异步版本"""
+        self.chat_history.append({"role": "user", "content": message})
+        reply = ''
+        try:
+            async for chunk in await deepseek_client.run_async(agent=self.agent_talk, messages=self.chat_history, stream=True):
+                content = chunk.get('content')
+                if content:
+                    reply += content
+                    yield content
+        finally:
+            if reply:
+                self.chat_history.append({"role": "assistant", "content": reply})
+
     def _media(self, message:str):
         response = deepseek_client.run(agent=self.agent_media, messages=[{"role": "user", "content": message}], context_variables={})
         '''# 假设 response.messages 是可迭代的消息容器
@@ -103,6 +150,10 @@ class Service():
             print(message)  # 直接打印消息内容'''
         return response.messages[-1]['content']
 
+    async def _media_async(self, message:str):
+        response = await deepseek_client.run_async(agent=self.agent_media, messages=[{"role": "user", "content": message}], context_variables={})
+        return response.messages[-1]['content']
+
     def _image(self, img_path, text):
         safe, query = zhipu_client.chat(img_path=img_path,text=self.figure_prompt+'用户输入：'+text)
         if safe:
@@ -110,6 +161,13 @@ class Service():
             return safe, json.loads(result)['data']['result']
         return safe, {}
 
+    async def _image_async(self, img_path, text):
+        safe, query = await zhipu_client.chat_async(img_path=img_path, text=self.figure_prompt+'用户输入：'+text)
+        if safe:
+            result = (await call_mcp_async(tool_name='search_medias', parameters={"query": ast.literal_eval(query)})).value
+            return safe, json.loads(result)['data']['result']
+        return safe, {}
+
     def _load_medias_info(self, medias):
         medias_info = [
             media for media in self.medias
@@ -124,6 +182,13 @@ class Service():
         redis_client.publish(medias_info)
         return medias, medias_info
 
+    async def media_search_async(self, message:str):
+        medias = await self._media_async(message=message)
+        medias_info = self._load_medias_info(medias)
+        redis_client = get_redis_client()
+        await asyncio.to_thread(redis_client.publish, medias_info)
+        return medias, medias_info
+
     def voice_media_search(self, message:str, steps:list[str]):
         chat_info = ''
         medias = []
@@ -136,6 +201,46 @@ class Service():
                 chat_info = self._chat(message=message + str(medias))
         return chat_info, medias, medias_info
 
+    async def voice_media_search_async(self, message:str, steps:list[str]):
+        chat_info = ''
+        medias = []
+        medias_info = []
+        for step in steps:
+            logger.debug("Voice step: %s", step)
+            if step == 'query':
+                medias, medias_info = await self.media_search_async(message=message)
+            elif step == 'talk':
+                chat_info = await self._chat_async(message=message + str(medias))
+        return chat_info, medias, medias_info
+
+    def voice_media_search_stream(self, message:str, steps:list[str]):
+        """voice_media_search的流式版本，依次产出(事件, 数据)：
+
+        - ("medias", {"medias": ..., "medias_info": ...})：检索结果，在对话开始前产出
+        - ("chat", {"text": 句子})：对话回复按句切分，每生成完一句就产出，TV端可以边收边播报
+        """
+        medias = []
+        for step in steps:
+            logger.debug("Voice step: %s", step)
+            if step == 'query':
+                medias, medias_info = self.media_search(message=message)
+                yield 'medias', {"medias": medias, "medias_info": medias_info}
+            elif step == 'talk':
+                for sentence in sentence_chunks(self._chat_stream(message=message + str(medias))):
+                    yield 'chat', {"text": sentence}
+
+    async def voice_media_search_stream_async(self, message:str, steps:list[str]):
+        """voice_media_search_stream的异步版本"""
+        medias = []
+        for step in steps:
+            logger.debug("Voice step: %s", step)
+            if step == 'query':
+                medias, medias_info = await self.media_search_async(message=message)
+                yield 'medias', {"medias": medias, "medias_info": medias_info}
+            elif step == 'talk':
+                async for sentence in sentence_chunks_async(self._chat_stream_async(message=message + str(medias))):
+                    yield 'chat', {"text": sentence}
+
     def image_analyze(self, img_path, text):
         safe, medias = self._image(img_path=img_path, text=text)
         if not safe :
@@ -145,6 +250,15 @@ class Service():
         redis_client.publish(medias_info)
         return safe, medias, medias_info
 
+    async def image_analyze_async(self, img_path, text):
+        safe, medias = await self._image_async(img_path=img_path, text=text)
+        if not safe :
+            return safe, medias, []
+        medias_info = self._load_medias_info(medias)
+        redis_client = get_redis_client()
+        await asyncio.to_thread(redis_client.publish, medias_info)
+        return safe, medias, medias_info
+
     def get_media_path(self, media_id):
         file_name = ''
         for media in self.medias:
@@ -172,77 +286,210 @@ def call_mcp(
         context_variables: Swarm上下文变量（用于存储结果）
     """
     try:
-        # 从上下文获取MCP服务器地址（也可硬编码）
-        mcp_url = "http://127.0.0.1:9000/execute"
-        
         # 构造请求体
         payload = {
             "tool_name": tool_name,
             "parameters": parameters
         }
         
-        # 发送请求（使用stream=True启用流式响应）
-        with requests.post(mcp_url, json=payload, stream=True) as response:
-            response.raise_for_status()
-            
-            # 检查Content-Type是否为SSE格式
-            content_type = response.headers.get('Content-Type', '')
-            if 'text/event-stream' in content_type:
-                # 处理流式SSE响应
-                result = parse_sse_response(response)
-            else:
-                # 处理普通JSON响应
-                result = response.json()
+        # 按settings.MCP_TRANSPORT经HTTP、进程内或Unix域套接字执行，只使用请求剩余的时间预算
+        result = get_mcp_transport().execute(payload, timeout=check_budget())
         #print(result)
-        
-        # 将结果存入上下文变量（使用工具名称作为键前缀）
-        context_key = f"mcp_result_{tool_name}"
-        context_variables[context_key] = result
-        
-        # 封装结果为Result对象（value需为字符串，agent可为None）
-        return Result(
-            value=json.dumps(result),
-            context_variables={context_key: result}
-        )
-        
     except Exception as e:
-        # 错误处理：存入错误信息到上下文
-        error_msg = f"MCP调用失败: {str(e)}"
-        context_variables[f"mcp_error_{tool_name}"] = error_msg
-        return Result(
-            value=error_msg,
-            context_variables={f"mcp_error_{tool_name}": error_msg}
-        )
-    
-def parse_sse_response(response) -> Dict[str, Any]:
-    """解析SSE格式的流式响应，合并所有data段"""
-    full_result = {"data": []}
-    current_line = ""
+        return mcp_error(tool_name, e, context_variables)
+    return mcp_result(tool_name, result, context_variables)
+
+
+async def call_mcp_async(
+    tool_name: str,
+    parameters: Dict[str, Any],
+    context_variables: Dict[str, Any] = {}
+) -> Result:
+    """call_mcp的异步版本，等待MCP结果期间不占用线程"""
+    logger.debug("MCP call: %s %s", tool_name, parameters)
+    try:
+        payload = {
+            "tool_name": tool_name,
+            "parameters": parameters
+        }
+        result = await get_mcp_transport().execute_async(payload, timeout=check_budget())
+    except Exception as e:
+        return mcp_error(tool_name, e, context_variables)
+    return mcp_result(tool_name, result, context_variables)
+
+
+def mcp_result(tool_name: str, result: Dict[str, Any], context_variables: Dict[str, Any]) -> Result:
+    """将MCP返回帧存入上下文变量（使用工具名称作为键前缀），封装为Result对象（value需为字符串，agent可为None）"""
+    context_key = f"mcp_result_{tool_name}"
+    context_variables[context_key] = result
+    return Result(
+        value=json.dumps(result),
+        context_variables={context_key: result},
+        error=not tool_succeeded(result)
+    )
+
+
+def mcp_error(tool_name: str, error: Any, context_variables: Dict[str, Any]) -> Result:
+    """错误处理：存入错误信息到上下文"""
+    error_msg = error if isinstance(error, str) else f"MCP调用失败: {str(error)}"
+    context_variables[f"mcp_error_{tool_name}"] = error_msg
+    return Result(
+        value=error_msg,
+        context_variables={f"mcp_error_{tool_name}": error_msg},
+        error=True
+    )
+
+
+def mcp_batch_items(calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {"request_id": str(i), "tool_name": call.get("tool_name"), "parameters": call.get("parameters", {})}
+        for i, call in enumerate(calls)
+    ]
+
+
+def mcp_batch_results(calls: List[Dict[str, Any]], results: Dict[str, Dict[str, Any]], error_msg: str,
+                      context_variables: Dict[str, Any]) -> List[Result]:
+    """结果按request_id对应回请求，未返回结果的请求记为错误"""
+    batch_results = []
+    for i, call in enumerate(calls):
+        tool_name = call.get("tool_name")
+        result = results.get(str(i))
+        if result is None:
+            batch_results.append(mcp_error(tool_name, error_msg, context_variables))
+        else:
+            batch_results.append(mcp_result(tool_name, result, context_variables))
+    return batch_results
+
     
-    for chunk in response.iter_content(chunk_size=1024, decode_unicode=True):
-        if not chunk:
-            continue
-            
-        # 处理分块数据
-        current_line += chunk
-        
-        # 按行分割（SSE使用\n\n分隔消息）
-        lines = current_line.split('\n')
-        current_line = lines.pop()  # 最后一行可能不完整，保留到下一次处理
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith('data:'):
-                data_str = line[5:].strip()
-                if data_str:
-                    try:
-                        data = json.loads(data_str)
-                        full_result["data"].append(data)
-                    except json.JSONDecodeError:
-                        print(f"Invalid JSON in SSE: {data_str}")
+def call_mcp_batch(
+    calls: List[Dict[str, Any]],
+    context_variables: Dict[str, Any] = {}
+) -> List[Result]:
+    """
+    批量调用MCP工具，一次请求执行多个工具，MCP服务端并发执行
     
-    # 提取最终结果（根据MCP实际返回结构调整）
-    if full_result["data"] and isinstance(full_result["data"][0], dict):
-        # 假设最后一条data包含完整结果
-        return full_result["data"][-1]
-    return full_result
\ No newline at end of file
+    参数:
+        calls: call_mcp的参数列表（如[{"tool_name": "search_medias", "parameters": {...}}, ...]）
+        context_variables: Swarm上下文变量（用于存储结果）
+    返回:
+        与calls顺序一致的Result列表，每项与单独调用call_mcp的结果格式相同
+    """
+    logger.debug("MCP batch call: %s", calls)
+    try:
+        results = get_mcp_transport().execute_batch(mcp_batch_items(calls), timeout=check_budget())
+    except Exception as e:
+        error_msg = f"MCP调用失败: {str(e)}"
+        results = {}
+    else:
+        error_msg = "MCP调用失败: 未返回结果"
+    return mcp_batch_results(calls, results, error_msg, context_variables)
+
+
+async def call_mcp_batch_async(
+    calls: List[Dict[str, Any]],
+    context_variables: Dict[str, Any] = {}
+) -> List[Result]:
+    """call_mcp_batch的异步版本"""
+    logger.debug("MCP batch call: %s", calls)
+    try:
+        results = await get_mcp_transport().execute_batch_async(mcp_batch_items(calls), timeout=check_budget())
+    except Exception as e:
+        error_msg = f"MCP调用失败: {str(e)}"
+        results = {}
+    else:
+        error_msg = "MCP调用失败: 未返回结果"
+    return mcp_batch_results(calls, results, error_msg, context_variables)
+
+
+# 同一轮中的多个call_mcp调用由DeepSeekClient合并为一次批量请求
+call_mcp.batch = call_mcp_batch
+# DeepSeekClient.run_async改为等待异步版本，模型看到的工具名仍是call_mcp
+call_mcp.aio = call_mcp_async
+call_mcp_batch.aio = call_mcp_batch_async
+
+
+def tool_succeeded(result: Any) -> bool:
+    """MCP返回帧（{"request_id": ..., "data": 工具响应}）中的工具是否执行成功"""
+    data = result.get("data") if isinstance(result, dict) else None
+    return isinstance(data, dict) and data.get("success") is True
+
+
+def format_media_names(results: List[Result]) -> Optional[str]:
+    """把call_mcp的结果整理为影视检索agent的答复格式：["影片1", "影片2"]
+
+    search_medias返回片名列表，hot_medias返回带title的字典列表；多次调用的结果按顺序合并去重。
+    结果不是片名列表时返回None，交给模型处理。
+    """
+    names = []
+    for result in results:
+        try:
+            items = json.loads(result.value)["data"]["result"]
+        except (json.JSONDecodeError, KeyError, TypeError):
+            return None
+        if not isinstance(items, list):
+            return None
+        for item in items:
+            name = item.get("title") or item.get("name") if isinstance(item, dict) else item
+            if isinstance(name, float):
+                continue  # 片名缺失（NaN）
+            if not isinstance(name, str):
+                return None
+            if name not in names:
+                names.append(name)
+    return json.dumps(names, ensure_ascii=False)
+
+
+
+
+# 句末标点（含其后的引号、括号），英文句点后需跟空白，避免切开小数
+SENTENCE_END = re.compile(r'(?:[。！？!?；;…\n]|\.(?=\s))+[”’"）)]*')
+# 长句在最后一个逗号处切开，避免迟迟凑不满一句
+CLAUSE_END = '，,、：:'
+
+
+class SentenceSplitter:
+    """把模型流式输出的文本片段合并成句子大小的块，句子一完整就产出，供TV端逐句播报"""
+
+    def __init__(self, max_chars: int = 40):
+        self.max_chars = max_chars
+        self.buffer = ''
+
+    def feed(self, piece: str) -> List[str]:
+        """加入一个片段，返回已完整的句子"""
+        sentences = []
+        self.buffer += piece
+        while True:
+            match = SENTENCE_END.search(self.buffer)
+            if match is None:
+                break
+            sentence, self.buffer = self.buffer[:match.end()].strip(), self.buffer[match.end():]
+            if sentence:
+                sentences.append(sentence)
+        if len(self.buffer) >= self.max_chars:
+            cut = max(self.buffer.rfind(char) for char in CLAUSE_END) + 1 or len(self.buffer)
+            sentence, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self) -> List[str]:
+        """输出结束，返回剩余的不完整句子"""
+        sentence, self.buffer = self.buffer.strip(), ''
+        return [sentence] if sentence else []
+
+
+def sentence_chunks(pieces, max_chars: int = 40):
+    splitter = SentenceSplitter(max_chars)
+    for piece in pieces:
+        yield from splitter.feed(piece)
+    yield from splitter.flush()
+
+
+async def sentence_chunks_async(pieces, max_chars: int = 40):
+    """sentence_chunks的异步版本，pieces为异步迭代器"""
+    splitter = SentenceSplitter(max_chars)
+    async for piece in pieces:
+        for sentence in splitter.feed(piece):
+            yield sentence
+    for sentence in splitter.flush():
+        yield sentence
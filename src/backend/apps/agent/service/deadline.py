@@ -0,0 +1,65 @@
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+
+# 与MCP Client/Server约定的时间预算请求头（剩余秒数），每一跳只向下游传递剩余的部分
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# 当前请求的截止时间（time.monotonic()），由视图设置，call_mcp等下游调用读取
+# 在线程池中执行工具时需通过contextvars.copy_context()把它带进工作线程
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """请求的时间预算已用完"""
+
+
+def parse_budget(value) -> Optional[float]:
+    """解析时间预算（秒），缺失或无效时返回None"""
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        return None
+    return budget if budget == budget else None
+
+
+def request_budget(request) -> Optional[float]:
+    """视图请求的时间预算：settings.REQUEST_TIMEOUT，TV端在请求头中给出更短的预算时以其为准"""
+    budgets = [parse_budget(getattr(settings, 'REQUEST_TIMEOUT', None)),
+               parse_budget(request.headers.get(DEADLINE_HEADER))]
+    budgets = [budget for budget in budgets if budget is not None]
+    return min(budgets) if budgets else None
+
+
+@contextmanager
+def request_deadline(budget: Optional[float]):
+    """在with块内为当前请求设置时间预算（秒），嵌套时取较早的截止时间，None表示不限时"""
+    if budget is None:
+        yield
+        return
+    deadline = time.monotonic() + budget
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """当前请求剩余的时间预算（秒），未设置时为None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_budget() -> Optional[float]:
+    """返回剩余的时间预算，已用完时抛出DeadlineExceeded"""
+    budget = remaining_budget()
+    if budget is not None and budget <= 0:
+        raise DeadlineExceeded("请求已超时")
+    return budget
@@ -1,7 +1,11 @@
 from queue import Queue
+import asyncio
+import logging
 import threading
 from .clients import get_redis_client
 
+logger = logging.getLogger(__name__)
+
 clients = set()
 
 def background_listener():
@@ -16,6 +20,18 @@ def background_listener():
 # 启动后台线程（Django启动时执行）
 threading.Thread(target=background_listener, daemon=True).start()
 
+class AsyncClientQueue:
+    """异步客户端的消息队列，后台监听线程经事件循环投递消息"""
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+
+    def put(self, data):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, data)
+
+    async def get(self):
+        return await self.queue.get()
+
 class SseView:
     def event_stream(self):
         q = Queue()
@@ -28,4 +44,19 @@ class SseView:
         except GeneratorExit:
             print('❌ 客户端断开')
         finally:
-            clients.remove(q)
\ No newline at end of file
+            clients.remove(q)
+
+    async def event_stream_async(self):
+        """event_stream的异步版本，ASGI下等待消息时不占用线程"""
+        q = AsyncClientQueue()
+        clients.add(q)
+        logger.debug('新客户端连接，当前客户端数: %d', len(clients))
+        try:
+            while True:
+                data = await q.get()
+                yield f"data: {data.decode('utf-8')}\n\n"
+        except (GeneratorExit, asyncio.CancelledError):
+            logger.debug('客户端断开')
+            raise
+        finally:
+            clients.discard(q)
@@ -4,10 +4,13 @@ from pathlib import Path
 from typing import List, Literal
 import re
 import json
+import logging
 
 from ..deepseek import Agent
 from .clients import deepseek_client
 
+logger = logging.getLogger(__name__)
+
 class Task():
     def __init__(self) -> None:
         self.name = 'task'
@@ -95,6 +98,13 @@ class TaskPlanner:
         # 第二步：降级到Agent拆解
         return self._agent_judge(message)
 
+    async def plan_async(self, message: str) -> list[Literal["query", "talk"]]:
+        """plan的异步版本"""
+        local_decision = self._local_judge(message)
+        if local_decision is not None:
+            return local_decision
+        return await self._agent_judge_async(message)
+
     def _local_judge(self, text: str) -> list[str] | None:
         """本地规则判断（返回None表示不确定）"""
         text_lower = text.lower()
@@ -109,4 +119,11 @@ class TaskPlanner:
         response = deepseek_client.run(agent=self.agent_task_planner, messages=[{"role": "user", "content": message}], context_variables={})
         print(response.messages[0]['content'], type(response.messages[0]['content']))
         steps = json.loads(response.messages[0]['content'])
-        return steps
\ No newline at end of file
+        return steps
+
+    async def _agent_judge_async(self, message: str) -> list[str]:
+        """_agent_judge的异步版本"""
+        response = await deepseek_client.run_async(agent=self.agent_task_planner, messages=[{"role": "user", "content": message}], context_variables={})
+        logger.debug("Task planner reply: %s", response.messages[0]['content'])
+        steps = json.loads(response.messages[0]['content'])
+        return steps
@@ -0,0 +1,423 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import asyncio
+import threading
+import logging
+import concurrent.futures
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+from django.conf import settings
+
+from .deadline import DEADLINE_HEADER
+
+logger = logging.getLogger(__name__)
+
+# msgpack为可选依赖，未安装时HTTP传输只使用JSON/SSE
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK = 'application/x-msgpack'
+FRAME_HEADER = struct.Struct('>I')
+
+# 各传输方式的返回格式与MCP Client的SSE帧一致：{"request_id": ..., "data": 工具响应}
+# execute_batch返回 request_id -> 帧 的字典，未返回结果的请求不在其中
+# timeout为本次调用剩余的时间预算（秒），传给下游并作为本跳的超时，None时使用传输方式的默认超时
+# execute_async/execute_batch_async供异步视图使用，语义与同步版本相同，等待期间不占用线程
+
+
+def decode_frames(body: bytes) -> List[Any]:
+    """解码长度前缀的msgpack帧序列"""
+    frames = []
+    offset = 0
+    while offset + FRAME_HEADER.size <= len(body):
+        (length,) = FRAME_HEADER.unpack_from(body, offset)
+        offset += FRAME_HEADER.size
+        frames.append(msgpack.unpackb(body[offset:offset + length], raw=False))
+        offset += length
+    return frames
+
+
+class HttpTransport:
+    """经MCP Client转发（Django -> HTTP -> Client -> HTTP -> Server），多机部署时使用
+
+    wire_format为msgpack且已安装msgpack时，通过Accept头协商二进制帧，MCP Client原样转发服务器的编码结果。
+    """
+    name = 'http'
+
+    def __init__(self, session, wire_format: str = 'json', timeout: float = 60):
+        self.session = session
+        self.timeout = timeout
+        self.wire_format = 'msgpack' if wire_format == 'msgpack' and msgpack is not None else 'json'
+        self.headers = {"Accept": MSGPACK} if self.wire_format == 'msgpack' else {}
+
+    def _request_options(self, timeout: Optional[float]) -> Dict[str, Any]:
+        """请求头带上剩余的时间预算，MCP Client和Server据此在超时后取消工具调用"""
+        if timeout is None:
+            return {"headers": self.headers, "timeout": self.timeout}
+        return {"headers": {**self.headers, DEADLINE_HEADER: f"{timeout:.3f}"}, "timeout": timeout}
+
+    def execute(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        # 发送请求（使用stream=True启用流式响应）
+        # 通过持久连接池发送，复用到MCP Client的连接
+        with self.session.post("/execute", json=payload, stream=True, **self._request_options(timeout)) as response:
+            response.raise_for_status()
+
+            # 检查Content-Type是否为SSE格式
+            content_type = response.headers.get('Content-Type', '')
+            if MSGPACK in content_type:
+                frames = decode_frames(response.content)
+                return frames[-1] if frames else {"data": []}
+            if 'text/event-stream' in content_type:
+                # 处理流式SSE响应
+                return parse_sse_response(response)
+            # 处理普通JSON响应
+            return response.json()
+
+    def execute_batch(self, requests: List[Dict[str, Any]], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        request_ids = {request["request_id"] for request in requests}
+        results = {}
+        # 结果按完成顺序逐条返回，按request_id对应回请求
+        with self.session.post("/execute_batch", json={"requests": requests}, stream=True,
+                               **self._request_options(timeout)) as response:
+            response.raise_for_status()
+            if MSGPACK in response.headers.get('Content-Type', ''):
+                for data in decode_frames(response.content):
+                    if isinstance(data, dict) and data.get("request_id") in request_ids:
+                        results[data["request_id"]] = data
+                return results
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                try:
+                    data = json.loads(line[5:].strip())
+                except json.JSONDecodeError:
+                    print(f"Invalid JSON in SSE: {line}")
+                    continue
+                if isinstance(data, dict) and data.get("request_id") in request_ids:
+                    results[data["request_id"]] = data
+        return results
+
+    async def _post_async(self, path: str, body: Dict[str, Any], timeout: Optional[float]):
+        """经异步连接池发送请求，返回(Content-Type, 响应体)"""
+        options = self._request_options(timeout)
+        async with self.session.apost(path, json=body, headers=options["headers"],
+                                      timeout=aiohttp.ClientTimeout(total=options["timeout"])) as response:
+            response.raise_for_status()
+            return response.headers.get('Content-Type', ''), await response.read()
+
+    async def execute_async(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        content_type, body = await self._post_async("/execute", payload, timeout)
+        if MSGPACK in content_type:
+            frames = decode_frames(body)
+            return frames[-1] if frames else {"data": []}
+        if 'text/event-stream' in content_type:
+            return parse_sse_text(body.decode('utf-8'))
+        return json.loads(body)
+
+    async def execute_batch_async(self, requests: List[Dict[str, Any]], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        request_ids = {request["request_id"] for request in requests}
+        content_type, body = await self._post_async("/execute_batch", {"requests": requests}, timeout)
+        frames = decode_frames(body) if MSGPACK in content_type else sse_data(body.decode('utf-8'))
+        return {data["request_id"]: data for data in frames
+                if isinstance(data, dict) and data.get("request_id") in request_ids}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"transport": self.name, "wire_format": self.wire_format, **self.session.stats()}
+
+
+class InProcessTransport:
+    """在Django进程内运行MCPServer的工具，单机部署时跳过两跳HTTP和SSE编解码
+
+    MCPServer运行在专用线程的事件循环中，工具代码与独立部署的server.py完全相同。
+    options中未给出的数据文件路径（movies_csv、snapshot_dir、hot_path）按server_dir解析，
+    与在MCP服务目录下启动server.py时一致，不依赖Django进程的工作目录。
+    """
+    name = 'inprocess'
+
+    def __init__(self, server_dir: str, options: Optional[Dict[str, Any]] = None, timeout: float = 60):
+        self.timeout = timeout
+        if server_dir not in sys.path:
+            sys.path.insert(0, server_dir)
+        from server import MCPServer  # MCP服务端模块按目录平铺导入
+        from snapshot import DEFAULT_CSV, DEFAULT_SNAPSHOT
+        from catalog import DEFAULT_HOT_PATH
+
+        defaults = {'movies_csv': DEFAULT_CSV, 'snapshot_dir': DEFAULT_SNAPSHOT, 'hot_path': DEFAULT_HOT_PATH}
+        options = {**{key: os.path.join(server_dir, path) for key, path in defaults.items()}, **(options or {})}
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='mcp-inprocess', daemon=True)
+        self.thread.start()
+
+        async def start():
+            server = MCPServer(**options)
+            await server.start_in_process()
+            return server
+
+        self.server = self._run(start(), timeout=None)  # 首次加载数据集可能较慢，不设超时
+        self.calls = 0
+
+    def _budget(self, timeout: Optional[float]) -> float:
+        return self.timeout if timeout is None else min(timeout, self.timeout)
+
+    def _run(self, coro, timeout: Optional[float]):
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    async def _run_async(self, coro, timeout: Optional[float]):
+        """在调用方的事件循环中等待MCPServer线程上的协程，超时或被取消时一并取消服务端的调用"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            future.cancel()
+            raise
+
+    def _execute(self, payload: Dict[str, Any], budget: float):
+        # 截止时间交给MCPServer，超时后工具调用在服务端取消并返回错误；外层多等1秒以取回该错误
+        return self.server.execute_request(payload.get("request_id") or "", payload, deadline=time.time() + budget)
+
+    async def _execute_batch(self, requests: List[Dict[str, Any]], budget: float):
+        deadline = time.time() + budget
+        return await asyncio.gather(*[
+            self.server.execute_request(request["request_id"], request, deadline=deadline) for request in requests
+        ])
+
+    @staticmethod
+    def _frame(request_id, data: Dict[str, Any]) -> Dict[str, Any]:
+        data.pop("request_id", None)
+        return {"request_id": request_id, "data": data}
+
+    def execute(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        self.calls += 1
+        budget = self._budget(timeout)
+        return self._frame(payload.get("request_id"), self._run(self._execute(payload, budget), budget + 1))
+
+    def execute_batch(self, requests: List[Dict[str, Any]], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        self.calls += len(requests)
+        budget = self._budget(timeout)
+        return {data["request_id"]: {"request_id": data["request_id"], "data": data}
+                for data in self._run(self._execute_batch(requests, budget), budget + 1)}
+
+    async def execute_async(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        self.calls += 1
+        budget = self._budget(timeout)
+        return self._frame(payload.get("request_id"), await self._run_async(self._execute(payload, budget), budget + 1))
+
+    async def execute_batch_async(self, requests: List[Dict[str, Any]], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        self.calls += len(requests)
+        budget = self._budget(timeout)
+        return {data["request_id"]: {"request_id": data["request_id"], "data": data}
+                for data in await self._run_async(self._execute_batch(requests, budget), budget + 1)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"transport": self.name, "calls": self.calls, "cache": self.server.cache.stats()}
+
+
+class UnixSocketTransport:
+    """经Unix域套接字直连MCPServer（server.py --uds），每帧为4字节大端长度 + 紧凑JSON
+
+    连接保存在池中复用；一个连接上可连续发送多帧，服务端并发执行并按完成顺序返回。
+    """
+    name = 'uds'
+    header = FRAME_HEADER
+
+    def __init__(self, path: str, pool_size: int = 10, timeout: float = 60):
+        self.path = path
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=pool_size)
+        self.connections_created = 0
+        self.calls = 0
+
+    def _acquire(self) -> socket.socket:
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self.connections_created += 1
+            return sock
+
+    def _release(self, sock: socket.socket):
+        try:
+            self.idle.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def _recv_exact(self, sock: socket.socket, size: int) -> bytes:
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = sock.recv(size - len(buffer))
+            if not chunk:
+                raise ConnectionError("MCP server closed the connection")
+            buffer += chunk
+        return bytes(buffer)
+
+    def _call(self, requests: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """在一个连接上发送全部请求帧，再读回同样数量的响应帧
+
+        每帧的"timeout"字段携带剩余的时间预算；本地等待超时时关闭连接，服务端随之取消未完成的请求。
+        """
+        frames = self._encode(requests, timeout)
+        sock = self._acquire()
+        try:
+            sock.settimeout(self.timeout if timeout is None else timeout)
+            sock.sendall(frames)
+            responses = []
+            for _ in requests:
+                (length,) = self.header.unpack(self._recv_exact(sock, self.header.size))
+                responses.append(json.loads(self._recv_exact(sock, length)))
+        except Exception:
+            # 连接状态未知（可能残留未读的响应），不放回连接池
+            sock.close()
+            raise
+        self._release(sock)
+        self.calls += len(requests)
+        return responses
+
+    def _encode(self, requests: List[Dict[str, Any]], timeout: Optional[float]) -> bytes:
+        frames = []
+        for request in requests:
+            if timeout is not None:
+                request = {**request, "timeout": timeout}
+            body = json.dumps(request, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            frames.append(self.header.pack(len(body)) + body)
+        return b''.join(frames)
+
+    async def _call_async(self, requests: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """_call的异步版本；连接属于调用方的事件循环，不放入连接池，每次调用新建（Unix域套接字建连开销很小）"""
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        self.connections_created += 1
+
+        async def exchange():
+            writer.write(self._encode(requests, timeout))
+            await writer.drain()
+            responses = []
+            for _ in requests:
+                (length,) = self.header.unpack(await reader.readexactly(self.header.size))
+                responses.append(json.loads(await reader.readexactly(length)))
+            return responses
+
+        try:
+            # 超时或被取消时关闭连接，服务端随之取消未完成的请求
+            responses = await asyncio.wait_for(exchange(), self.timeout if timeout is None else timeout)
+        finally:
+            writer.close()
+        self.calls += len(requests)
+        return responses
+
+    @staticmethod
+    def _frame(request_id, data: Dict[str, Any]) -> Dict[str, Any]:
+        data.pop("request_id", None)
+        return {"request_id": request_id, "data": data}
+
+    def execute(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        request_id = payload.get("request_id")
+        return self._frame(request_id, self._call([{**payload, "request_id": request_id or "0"}], timeout)[0])
+
+    def execute_batch(self, requests: List[Dict[str, Any]], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        return {data["request_id"]: {"request_id": data["request_id"], "data": data} for data in self._call(requests, timeout)}
+
+    async def execute_async(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        request_id = payload.get("request_id")
+        responses = await self._call_async([{**payload, "request_id": request_id or "0"}], timeout)
+        return self._frame(request_id, responses[0])
+
+    async def execute_batch_async(self, requests: List[Dict[str, Any]], timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        return {data["request_id"]: {"request_id": data["request_id"], "data": data}
+                for data in await self._call_async(requests, timeout)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "transport": self.name,
+            "path": self.path,
+            "calls": self.calls,
+            "connections_created": self.connections_created,
+            "idle": self.idle.qsize(),
+        }
+
+
+def create_transport(name: str, session=None):
+    """按settings.MCP_TRANSPORT创建call_mcp使用的传输方式"""
+    timeout = getattr(settings, 'MCP_TIMEOUT', 60)
+    if name == 'http':
+        return HttpTransport(session, wire_format=getattr(settings, 'MCP_WIRE_FORMAT', 'json'), timeout=timeout)
+    if name == 'inprocess':
+        server_dir = getattr(settings, 'MCP_SERVER_DIR', os.path.join(settings.BASE_DIR.parent, 'mcp'))
+        return InProcessTransport(str(server_dir), getattr(settings, 'MCP_SERVER_OPTIONS', {}), timeout=timeout)
+    if name == 'uds':
+        return UnixSocketTransport(getattr(settings, 'MCP_UDS_PATH', '/tmp/mcp_server.sock'),
+                                   pool_size=getattr(settings, 'MCP_POOL_SIZE', 10), timeout=timeout)
+    raise ValueError(f"Unknown MCP transport: {name}")
+
+
+def parse_sse_response(response) -> Dict[str, Any]:
+    """解析SSE格式的流式响应，合并所有data段"""
+    full_result = {"data": []}
+    current_line = ""
+
+    for chunk in response.iter_content(chunk_size=1024, decode_unicode=True):
+        if not chunk:
+            continue
+
+        # 处理分块数据
+        current_line += chunk
+
+        # 按行分割（SSE使用\n\n分隔消息）
+        lines = current_line.split('\n')
+        current_line = lines.pop()  # 最后一行可能不完整，保留到下一次处理
+
+        for line in lines:
+            line = line.strip()
+            if line.startswith('data:'):
+                data_str = line[5:].strip()
+                if data_str:
+                    try:
+                        data = json.loads(data_str)
+                        full_result["data"].append(data)
+                    except json.JSONDecodeError:
+                        print(f"Invalid JSON in SSE: {data_str}")
+
+    # 提取最终结果（根据MCP实际返回结构调整）
+    if full_result["data"] and isinstance(full_result["data"][0], dict):
+        # 假设最后一条data包含完整结果
+        return full_result["data"][-1]
+    return full_result
+
+
+def sse_data(text: str) -> List[Any]:
+    """解析完整的SSE响应文本，返回各data段"""
+    frames = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line.startswith('data:'):
+            continue
+        data_str = line[5:].strip()
+        if not data_str:
+            continue
+        try:
+            frames.append(json.loads(data_str))
+        except json.JSONDecodeError:
+            logger.warning("Invalid JSON in SSE: %s", data_str)
+    return frames
+
+
+def parse_sse_text(text: str) -> Dict[str, Any]:
+    """parse_sse_response的非流式版本，最后一条data为完整结果"""
+    frames = sse_data(text)
+    if frames and isinstance(frames[0], dict):
+        return frames[-1]
+    return {"data": frames}
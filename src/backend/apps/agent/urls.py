@@ -8,8 +8,10 @@ urlpatterns = [
 
     path("media_search", views.media_search, name='media search'),
     path("voice_media_search", views.voice_media_search, name='voice media search'),
+    path("voice_media_search_stream", views.voice_media_search_stream, name='voice media search stream'),
     path('media/<int:media_id>', views.stream_media, name='media-stream'),
     path('server_ip', views.get_server_ip),
+    path('mcp_stats', views.mcp_stats, name='mcp stats'),
     path('see', views.see, name='see'),
 
     # 手机端api
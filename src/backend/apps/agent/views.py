@@ -6,8 +6,10 @@ from django.conf import settings
 from datetime import datetime
 import os
 import re
+import json
+import asyncio
 
-from .service import Service, Task, SseView
+from .service import Service, Task, SseView, get_mcp_transport, request_deadline, request_budget
 from .utils import get_ip
 
 service = Service()
@@ -17,7 +19,7 @@ task = Task()
 def index(request):
     return HttpResponse("Hello Django!")
 
-def media_search(request):
+async def media_search(request):
     if request.method == 'GET':
         try:
             msg = request.GET.get('message', '')
@@ -35,7 +37,8 @@ def media_search(request):
                     "medias_info": "",
                     "status": "error"
                 })
-            medias, medias_info = service.media_search(message=msg)
+            with request_deadline(request_budget(request)):
+                medias, medias_info = await service.media_search_async(message=msg)
             print('media_search', medias, medias_info)
             return JsonResponse({
                 "chat": "",
@@ -57,7 +60,7 @@ def media_search(request):
         "status": "error"
     })
 
-def voice_media_search(request):
+async def voice_media_search(request):
     if request.method == 'GET':
         try:
             msg = request.GET.get('message', '')
@@ -75,9 +78,10 @@ def voice_media_search(request):
                     "medias_info": "",
                     "status": "error"
                 })
-            steps = task.planner.plan(message=msg)
-            print(steps)
-            chat, medias, medias_info = service.voice_media_search(message=msg, steps=steps)
+            with request_deadline(request_budget(request)):
+                steps = await task.planner.plan_async(message=msg)
+                print(steps)
+                chat, medias, medias_info = await service.voice_media_search_async(message=msg, steps=steps)
             print('voice_media_search', chat, medias, medias_info)
             return JsonResponse({
                 "chat": chat,
@@ -99,6 +103,65 @@ def voice_media_search(request):
         "status": "error"
     })
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def voice_media_search_stream(request):
+    """voice_media_search的SSE版本：先推送检索结果，对话回复每生成完一句就推送一句，TV端收到即可播报
+
+    事件依次为medias、chat（多次）、done，出错时为error
+    """
+    if request.method != 'GET':
+        return JsonResponse({
+            "chat": "请使用GET方法",
+            "medias": "",
+            "medias_info": "",
+            "status": "error"
+        })
+    msg = request.GET.get('message', '')
+    if task.taskSensitiveFilter.contains_sensitive(msg):
+        error = "⚠️ 检测到敏感任务"
+    elif task.textSensitiveFilter.contains_sensitive(msg):
+        error = "⚠️ 检测到敏感词"
+    else:
+        error = None
+    budget = request_budget(request)
+
+    # ASGI下StreamingHttpResponse需异步迭代器，同步生成器会被整体读完后才发送
+    async def event_stream():
+        if error:
+            yield sse_event('error', {"chat": error})
+            return
+        # 生成器在视图返回后才执行，时间预算要在这里设置
+        try:
+            with request_deadline(budget):
+                steps = await task.planner.plan_async(message=msg)
+                print(steps)
+                async for event, data in service.voice_media_search_stream_async(message=msg, steps=steps):
+                    yield sse_event(event, data)
+            yield sse_event('done', {"status": "success"})
+        except Exception as e:
+            yield sse_event('error', {"chat": str(e)})
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # 禁止反向代理缓冲，逐句送达
+    return response
+
+async def file_chunks(path, offset=0, length=None, chunk_size=64 * 1024):
+    """异步分块读取文件（64KB分块），ASGI下同步迭代器会先把整个文件读入内存"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            read_size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await asyncio.to_thread(f.read, read_size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
 def stream_media(request, media_id):
     # 1. 获取视频文件名（安全处理）
     # 安全校验文件名
@@ -120,20 +183,8 @@ def stream_media(request, media_id):
         last_byte = int(match.group(2)) if match.group(2) else file_size - 1
         chunk_size = last_byte - first_byte + 1
 
-        def chunk_generator():
-            with open(media_path, 'rb') as f:
-                f.seek(first_byte)
-                remaining = chunk_size
-                while remaining > 0:
-                    read_size = min(4096, remaining)  # 4KB分块
-                    chunk = f.read(read_size)
-                    if not chunk:
-                        break
-                    remaining -= len(chunk)
-                    yield chunk
-
         response = StreamingHttpResponse(
-            chunk_generator(),
+            file_chunks(media_path, first_byte, chunk_size),
             status=206,
             content_type='video/mp4'
         )
@@ -142,7 +193,7 @@ def stream_media(request, media_id):
     else:
         # 5. 完整文件传输（小文件备用方案）
         response = StreamingHttpResponse(
-            open(media_path, 'rb'),
+            file_chunks(media_path),
             content_type='video/mp4'
         )
         response['Content-Length'] = str(file_size)
@@ -155,18 +206,26 @@ def stream_media(request, media_id):
 @csrf_exempt
 def see(request):
     sse_view = SseView()  # 每个连接新建实例
-    response = StreamingHttpResponse(sse_view.event_stream(), content_type='text/event-stream')
+    response = StreamingHttpResponse(sse_view.event_stream_async(), content_type='text/event-stream')
     response['Cache-Control'] = 'no-cache'
     return response
 
 def get_server_ip(request):
     return JsonResponse({'ip': get_ip()})
 
+def mcp_stats(request):
+    return JsonResponse(get_mcp_transport().stats())
+
 def show_uploader_page(request):
     return render(request, 'agent/uploader.html', {'local_ip': get_ip()})
 
+def save_upload(image_file, image_path):
+    with open(image_path, 'wb+') as destination:
+        for chunk in image_file.chunks():
+            destination.write(chunk)
+
 @csrf_exempt
-def upload(request):
+async def upload(request):
     if request.method == 'POST':
         try:
             # 处理文本输入
@@ -178,9 +237,7 @@ def upload(request):
             if image_file:
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 image_path = f'image/{timestamp}_{image_file.name}'
-                with open(image_path, 'wb+') as destination:
-                    for chunk in image_file.chunks():
-                        destination.write(chunk)
+                await asyncio.to_thread(save_upload, image_file, image_path)
             if task.taskSensitiveFilter.contains_sensitive(text_input) or task.textSensitiveFilter.contains_sensitive(text_input):
                 return JsonResponse({
                     'status': 'error',
@@ -188,7 +245,8 @@ def upload(request):
                 })
 
             # 分析结果
-            safe, medias, medias_info = service.image_analyze(image_path, text_input)
+            with request_deadline(request_budget(request)):
+                safe, medias, medias_info = await service.image_analyze_async(image_path, text_input)
             print('image_media_search', safe, medias, medias_info)
             if safe:
                 return JsonResponse({
@@ -1,5 +1,6 @@
 import base64
 import json
+import asyncio
 from zhipuai import ZhipuAI
 
 class ZhiPuClient:
@@ -34,4 +35,8 @@ class ZhiPuClient:
                 raise ValueError("返回的JSON缺少必要字段")
         except (json.JSONDecodeError, ValueError, KeyError, AttributeError) as e:
             print(f"解析模型响应失败: {e}")
-            return {"safe": False, "response": ""}
\ No newline at end of file
+            return {"safe": False, "response": ""}
+
+    async def chat_async(self, img_path, text):
+        """chat的异步版本。zhipuai SDK没有asyncio客户端，请求在线程中执行，不阻塞事件循环"""
+        return await asyncio.to_thread(self.chat, img_path, text)
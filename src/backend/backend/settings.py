@@ -72,6 +72,9 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "backend.wsgi.application"
+# 语音/检索视图为异步视图，生产环境经ASGI服务（如uvicorn backend.asgi:application）运行，
+# 一个进程即可同时处理大量等待模型和MCP返回的请求
+ASGI_APPLICATION = "backend.asgi.application"
 
 
 # Database
@@ -141,4 +144,22 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
-REDIS_DB = 0
\ No newline at end of file
+REDIS_DB = 0
+
+# MCP Client地址及持久连接池配置
+MCP_URL = 'http://127.0.0.1:9000'
+MCP_POOL_SIZE = 10          # 连接池最大连接数
+MCP_POOL_IDLE_TIMEOUT = 60  # 空闲超过该时间（秒）后重建连接池，需小于MCP Client的keep-alive超时
+
+# call_mcp的传输方式：http经MCP Client转发；单机部署时可用inprocess在Django进程内执行MCPServer工具，
+# 或uds经Unix域套接字直连MCPServer（server.py --uds MCP_UDS_PATH）
+MCP_TRANSPORT = 'http'
+MCP_UDS_PATH = '/tmp/mcp_server.sock'
+MCP_SERVER_DIR = BASE_DIR.parent / 'mcp'
+MCP_SERVER_OPTIONS = {}     # inprocess时传给MCPServer的参数，如movies_csv、snapshot_dir、hot_path、workers；
+                            # 未给出的数据文件路径按MCP_SERVER_DIR解析
+MCP_TIMEOUT = 60            # 单次工具调用超时（秒），请求剩余的时间预算更短时以预算为准
+# 检索/语音请求的总时间预算（秒），call_mcp只使用剩余部分并经X-Request-Timeout头传给MCP Client和Server，
+# 超时后服务端取消工具调用；TV端可在请求头中给出更短的预算
+REQUEST_TIMEOUT = 20
+MCP_WIRE_FORMAT = 'json'    # http传输的结果编码：json（SSE）或msgpack（需安装msgpack，长度前缀二进制帧）
@@ -0,0 +1,122 @@
+import math
+import asyncio
+from collections import deque
+from typing import Dict, Any, Optional
+
+# 建议调用方重试等待时间（秒）的上限
+MAX_RETRY_AFTER = 30
+
+
+class Overloaded(Exception):
+    """工具过载，请求在执行前被拒绝，调用方应在retry_after秒后重试"""
+
+    def __init__(self, tool_name: str, reason: str, retry_after: int):
+        super().__init__(f"Tool overloaded: {tool_name} ({reason}), retry after {retry_after}s")
+        self.tool_name = tool_name
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class ToolGate:
+    """单个工具的准入控制：最多max_concurrency个调用同时执行，其余按先来先到排队
+
+    排队数达到max_queue时新请求立即拒绝，排队超过max_queue_time秒的请求也被拒绝，
+    高峰期宁可让少数请求快速失败，也不让所有请求一起排队到超时。max_concurrency为None时不限制。
+    """
+
+    def __init__(self, name: str, max_concurrency: Optional[int] = None, max_queue: int = 64,
+                 max_queue_time: Optional[float] = 2.0, ewma_alpha: float = 0.2):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_time = max_queue_time
+        self.ewma_alpha = ewma_alpha
+        self.running = 0
+        self.waiters: "deque[asyncio.Future]" = deque()
+        self.ewma_latency: Optional[float] = None  # 执行耗时（不含排队），用于估算Retry-After
+        self.admitted = 0
+        self.queued = 0         # 曾经排队的请求数
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+
+    @property
+    def depth(self) -> int:
+        """执行中及排队中的调用数"""
+        return self.running + len(self.waiters)
+
+    @property
+    def saturated(self) -> bool:
+        """排队已满，新请求会被立即拒绝"""
+        return self.max_concurrency is not None and len(self.waiters) >= self.max_queue
+
+    def retry_after(self) -> int:
+        """按当前排队长度和平均执行耗时估算排空队列所需的秒数"""
+        latency = self.ewma_latency or 1.0
+        backlog = (len(self.waiters) + 1) / (self.max_concurrency or 1)
+        return int(min(max(math.ceil(latency * backlog), 1), MAX_RETRY_AFTER))
+
+    def _shed(self, reason: str) -> Overloaded:
+        if reason == "queue full":
+            self.shed_queue_full += 1
+        else:
+            self.shed_timeout += 1
+        return Overloaded(self.name, reason, self.retry_after())
+
+    async def acquire(self) -> None:
+        """获取执行名额，排队已满或排队超时抛出Overloaded"""
+        if self.max_concurrency is None or (self.running < self.max_concurrency and not self.waiters):
+            self.running += 1
+            self.admitted += 1
+            return
+        if len(self.waiters) >= self.max_queue:
+            raise self._shed("queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued += 1
+        try:
+            # 名额由release直接转交给队首的等待者，running不变
+            await asyncio.wait_for(waiter, self.max_queue_time)
+        except asyncio.TimeoutError:
+            raise self._shed(f"queued over {self.max_queue_time}s")
+        except asyncio.CancelledError:
+            # 已分到名额后调用方被取消（如客户端断开），把名额转交给下一个
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self.waiters.remove(waiter)
+                except ValueError:
+                    pass
+        self.admitted += 1
+
+    def release(self) -> None:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+    def observe(self, latency: float) -> None:
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.ewma_latency
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "max_queue_time": self.max_queue_time,
+            "running": self.running,
+            "queue_depth": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed_queue_full + self.shed_timeout,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "ewma_latency": self.ewma_latency,
+        }
@@ -0,0 +1,114 @@
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+def canonicalize(value: Any) -> Any:
+    """规范化工具参数：字符串去除首尾空白，字典按键排序（由json序列化完成）"""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, dict):
+        return {str(k).strip(): canonicalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v) for v in value]
+    return value
+
+
+def make_cache_key(tool_name: str, parameters: Dict[str, Any]) -> str:
+    """由工具名和规范化后的参数生成缓存键，键顺序和空白不同的等价参数得到相同的键"""
+    payload = json.dumps(
+        {"tool_name": tool_name, "parameters": canonicalize(parameters)},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """工具结果缓存：按条目数和字节数限制容量，LRU淘汰，支持按工具设置TTL"""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, default_ttl: float = 300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls: Dict[str, float] = {}
+        # key -> (tool_name, result, size, expires_at)
+        self.entries: "OrderedDict[str, Tuple[str, Any, int, float]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def set_ttl(self, tool_name: str, ttl: Optional[float]) -> None:
+        """设置工具的缓存有效期（秒），None使用默认值，0表示不缓存"""
+        if ttl is None:
+            self.ttls.pop(tool_name, None)
+        else:
+            self.ttls[tool_name] = ttl
+
+    def ttl_for(self, tool_name: str) -> float:
+        return self.ttls.get(tool_name, self.default_ttl)
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """查找缓存，返回(是否命中, 结果)"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        if entry[3] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, entry[1]
+
+    def put(self, key: str, tool_name: str, result: Any) -> None:
+        """写入结果，超出容量时淘汰最久未使用的条目"""
+        ttl = self.ttl_for(tool_name)
+        if ttl <= 0:
+            return
+        size = len(json.dumps(result, ensure_ascii=False, default=str).encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (tool_name, result, size, time.monotonic() + ttl)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, tool_name: Optional[str] = None) -> int:
+        """清除指定工具（默认全部）的缓存，返回清除的条目数"""
+        keys = [key for key, entry in self.entries.items() if tool_name is None or entry[0] == tool_name]
+        for key in keys:
+            self._remove(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        self.bytes -= entry[2]
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计，用于评估容量设置"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "ttls": self.ttls,
+        }
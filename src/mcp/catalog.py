@@ -0,0 +1,207 @@
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Tuple
+from search_index import MovieIndex
+from ranking import Ranker
+from snapshot import load_movies, dataset_version, DEFAULT_CSV, DEFAULT_SNAPSHOT
+from sharding import Shard
+from utils import get_logger
+
+logger = get_logger("mcp.catalog")
+
+DEFAULT_HOT_PATH = 'movie.xlsx'
+
+# 支持容错匹配的查询键
+FUZZY_KEYS = ('name', 'director', 'actor')
+
+
+class HotRanking:
+    """热门影视票房排行，启动时解析movie.xlsx并缓存完整排序结果
+
+    文件的修改时间或大小变化后由reload_if_changed重新加载，请求只读取缓存。
+    """
+
+    def __init__(self, path: str = DEFAULT_HOT_PATH):
+        self.path = path
+        self.ranking: List[Dict[str, Any]] = []
+        self.signature: Optional[Tuple[int, int]] = None
+        self.loaded_at = 0.0
+        self.reload()
+
+    def _stat(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _parse(self) -> List[Dict[str, Any]]:
+        excel_file = pd.ExcelFile(self.path)
+        # 获取指定工作表中的数据
+        df = excel_file.parse('Sheet1')
+
+        # 将票房列转换为数值类型
+        df['票房数值'] = df['票房'].str.extract(r'(\d+\.?\d*)').astype(float)
+
+        # 按照票房数值降序排序
+        sorted_df = df.sort_values(by='票房数值', ascending=False)
+
+        result = []
+        for index, row in sorted_df.iterrows():
+            movie_info = {
+                "id": index + 1,
+                "title": row['title'],
+                "票房": row['票房']
+            }
+            result.append(movie_info)
+        return result
+
+    def reload(self) -> None:
+        """重新解析文件并替换缓存的排行"""
+        signature = self._stat()
+        self.ranking = self._parse()
+        self.signature = signature
+        self.loaded_at = time.time()
+
+    def reload_if_changed(self) -> bool:
+        """文件修改时间或大小变化时重新加载，返回是否发生了重新加载"""
+        try:
+            if self._stat() == self.signature:
+                return False
+        except OSError:
+            return False
+        self.reload()
+        return True
+
+    def top(self, top_n: int = 10) -> List[Dict[str, Any]]:
+        """返回票房前top_n的影片"""
+        return self.ranking[:max(int(top_n), 0)]
+
+
+class MovieCatalog:
+    """影视数据集及其检索逻辑，MCPServer主进程和工具进程池共用"""
+
+    def __init__(self, movies: pd.DataFrame, index: MovieIndex, version: str = ""):
+        self.movies = movies
+        self.index = index
+        self.version = version
+        # 分片数据集带有全量数据的排序归一化范围和原始行号，不分片时行号即原始行号
+        self.ranker = Ranker(movies, bounds=movies.attrs.get('rank_bounds'))
+        self.names = movies['NAME'].to_numpy(dtype=object)
+        if 'POSITION' in movies:
+            self.positions = movies['POSITION'].to_numpy(dtype=np.int64)
+        else:
+            self.positions = np.arange(len(movies), dtype=np.int64)
+
+    @classmethod
+    def load(cls, movies_csv: str = DEFAULT_CSV, snapshot_dir: str = DEFAULT_SNAPSHOT,
+             shard: Optional[Shard] = None) -> "MovieCatalog":
+        """优先从快照加载数据集，快照过期时回退到CSV；指定分片时只加载该分片的影片"""
+        version = dataset_version(movies_csv, snapshot_dir, shard)
+        movies, index = load_movies(movies_csv, snapshot_dir, shard)
+        return cls(movies, index, version=version)
+
+    def search_medias(self, query: dict, limit: int = 100, offset: int = 0,
+                      sort_by: str = 'YEAR', weights: Optional[Dict[str, float]] = None, ranked: bool = False):
+        """检索影视，返回片名列表
+
+        ranked为True时返回 {"fuzzy": 是否为容错匹配, "items": [[片名, 排序分数, 原始行号], ...]}，
+        供MCPClient合并各分片的结果。sort_by或weights中有未知的排序键时抛出ValueError。
+        """
+        # 排序参数错误直接抛出，由execute_tool返回失败（不写入缓存），而不是当作没有命中
+        self.ranker.resolve(sort_by)
+        for name in (weights or {}):
+            self.ranker.resolve(name)
+        try:
+            # 通过倒排索引筛选，只处理命中的行
+            rows = self.index.filter(query, self.movies)
+            fuzzy = False
+            if len(rows) == 0 and any(query.get(key) for key in FUZZY_KEYS):
+                # 语音识别可能把片名/人名识别成同音字或近似字，本地容错重试，避免再走一轮大模型
+                rows = self.index.filter(query, self.movies, fuzzy=True)
+                fuzzy = True
+            if ranked:
+                return {"fuzzy": fuzzy, "items": self._rank_items(rows, limit=limit, offset=offset,
+                                                                  sort_by=sort_by, weights=weights)}
+            name_list = self._rank_names(rows, limit=limit, offset=offset, sort_by=sort_by, weights=weights)
+            logger.debug(f"search_medias {query}: {name_list}")
+            return name_list
+
+        except Exception as e:
+            logger.error(f"search_medias failed for {query}: {e}")
+            return {"fuzzy": False, "items": []} if ranked else []
+
+    def _rank_names(self, rows, limit: int = 100, offset: int = 0,
+                    sort_by: str = 'YEAR', weights: Optional[Dict[str, float]] = None) -> List[str]:
+        """按排序键选出第offset到offset+limit个命中行，返回片名"""
+        limit, offset = max(int(limit), 0), max(int(offset), 0)
+        ranked = self.ranker.rank(rows, offset + limit, sort_by=sort_by, weights=weights)
+        return self.names[ranked[offset:]].tolist()
+
+    def _rank_items(self, rows, limit: int = 100, offset: int = 0,
+                    sort_by: str = 'YEAR', weights: Optional[Dict[str, float]] = None) -> List[list]:
+        """与_rank_names相同的选择，附带排序分数（缺失为None）和原始行号"""
+        limit, offset = max(int(limit), 0), max(int(offset), 0)
+        ranked = self.ranker.rank(rows, offset + limit, sort_by=sort_by, weights=weights)[offset:]
+        scores = self.ranker.scores(ranked, sort_by, weights)
+        return [
+            [name, None if np.isnan(score) else float(score), int(position)]
+            for name, score, position in zip(self.names[ranked].tolist(), scores.tolist(), self.positions[ranked].tolist())
+        ]
+
+    def scan_movies(self, query: dict) -> pd.DataFrame:
+        """逐列str.contains全表扫描筛选，作为索引结果的对照基准"""
+        results = self.movies.copy()
+
+        # 遍历query中的所有键值对，动态应用筛选条件
+        for key, value in query.items():
+            # 确保值不为空
+            if value is None or value == "":
+                continue
+
+            # 根据不同的键应用不同的筛选逻辑
+            if key == 'name':
+                results = results[results['NAME'].astype(str).str.contains(value, case=False, na=False)]
+            elif key == 'director' or key == 'actor':
+                person_ids = self.index.persons.resolve(value)
+                if person_ids is not None:
+                    # 姓名或别名对应到PERSON_ID时，按演职员ID列中的“:ID”匹配
+                    pattern = '|'.join(f":{re.escape(person_id)}(?:\\||$)" for person_id in person_ids)
+                    credits = results['DIRECTOR_IDS'].fillna('').astype(str) + '|' + results['ACTOR_IDS'].fillna('').astype(str)
+                    results = results[credits.str.contains(pattern, na=False)]
+                    continue
+                # 导演字段包含该人 OR 演员字段包含该人
+                is_director = results['DIRECTORS'].astype(str).str.contains(value, case=False, na=False)
+                is_actor = results['ACTORS'].astype(str).str.contains(value, case=False, na=False)
+                results = results[is_director | is_actor]  # 取两者的并集
+            elif key == 'genre':
+                results = results[results['GENRES'].astype(str).str.contains(value, case=False, na=False)]
+            elif key == 'region':
+                results = results[results['REGIONS'].astype(str).str.contains(value, case=False, na=False)]
+            elif key == 'language':
+                results = results[results['LANGUAGES'].astype(str).str.contains(value, case=False, na=False)]
+            elif key == 'min_year':
+                try:
+                    min_year = int(value)
+                    results = results[results['YEAR'] >= min_year]
+                except ValueError:
+                    print(f"无效的年份值: {value}")
+            elif key == 'max_year':
+                try:
+                    max_year = int(value)
+                    results = results[results['YEAR'] <= max_year]
+                except ValueError:
+                    print(f"无效的年份值: {value}")
+        return results
+
+    def verify_search_index(self, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """用同一批查询对比索引路径与扫描路径，返回命中行或排序结果不一致的查询"""
+        mismatches = []
+        for query in queries:
+            expected_rows = self.scan_movies(query).index.to_numpy(dtype=np.int64)
+            actual_rows = self.index.filter(query, self.movies)
+            expected = self._rank_names(expected_rows)
+            actual = self._rank_names(actual_rows)
+            if not np.array_equal(expected_rows, actual_rows) or expected != actual:
+                mismatches.append({"query": query, "expected": expected, "actual": actual})
+        return mismatches
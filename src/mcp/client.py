@@ -3,10 +3,15 @@ import json
 import time
 import asyncio
 import logging
-from typing import Dict, Any, List, Optional, Set
+import aiohttp
+from typing import Dict, Any, List, Optional, Set, Tuple, AsyncIterator, Union
 from aiohttp import web
-from aiohttp.client import ClientSession, TCPConnector
-from utils import validate_tool_request, format_message_for_logging
+from routing import ToolRouter, ROUTING_STRATEGIES
+from utils import validate_tool_request, format_message_for_logging, generate_request_id, parse_sse_line, ConnectionPool, SingleFlight
+from utils import DEADLINE_HEADER, parse_budget, deadline_after, deadline_bucket, time_left
+from cache import canonicalize, make_cache_key
+from sharding import SHARDED_TOOLS, parse_shard, shard_route, merge_ranked
+import wire
 import argparse
 
 # 配置日志
@@ -27,10 +32,25 @@ class MCPServerInfo:
         self.status = server_data.get("status", "offline")
         self.last_heartbeat = server_data.get("last_heartbeat", 0)
         self.base_url = f"http://{self.host}:{self.port}"
+        self.tool_names = {tool.get("name") for tool in self.tools if tool.get("name")}
+        # 分片服务器只持有部分影片，分片工具以"工具名#分片号"加入路由表，不直接承接完整的工具调用
+        self.shard = parse_shard(server_data.get("shard"))
+        if self.shard:
+            self.tool_names = {
+                shard_route(name, self.shard.index) if name in SHARDED_TOOLS else name for name in self.tool_names
+            }
+        # 服务器心跳上报的间隔（秒）和负载指标（在途请求数、排队深度、是否饱和），未上报心跳时为None
+        self.heartbeat_interval = server_data.get("heartbeat_interval")
+        self.load: Dict[str, Any] = server_data.get("load") or {}
+        # 路由统计：在途请求数、EWMA延迟（秒）、累计请求及失败数
+        self.inflight = 0
+        self.ewma_latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
     
     def has_tool(self, tool_name: str) -> bool:
         """检查服务器是否支持指定工具"""
-        return any(tool.get("name") == tool_name for tool in self.tools)
+        return tool_name in self.tool_names
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典格式，便于序列化"""
@@ -40,36 +60,53 @@ class MCPServerInfo:
             "port": self.port,
             "tools": self.tools,
             "status": self.status,
-            "last_heartbeat": self.last_heartbeat
+            "last_heartbeat": self.last_heartbeat,
+            "inflight": self.inflight,
+            "ewma_latency": self.ewma_latency,
+            "requests": self.requests,
+            "failures": self.failures,
+            "heartbeat_interval": self.heartbeat_interval,
+            "load": self.load,
+            "shard": str(self.shard) if self.shard else None
         }
 
 class MCPClient:
     """MCP客户端服务，作为Agent与工具服务器的交互入口"""
     
-    def __init__(self, host: str = "localhost", port: int = 9000):
+    def __init__(self, host: str = "localhost", port: int = 9000, routing: str = "least_outstanding",
+                 pool_size: int = 100, pool_per_host: int = 20, keepalive_timeout: float = 30.0,
+                 coalesce: bool = True):
         self.host = host
         self.port = port
+        # 到工具服务器的持久连接池，转发的工具调用复用已建立的连接
+        self.pool = ConnectionPool(limit=pool_size, limit_per_host=pool_per_host, keepalive_timeout=keepalive_timeout)
+        # 健康探测使用独立的小连接池，转发池被占满时探测不必排队等连接
+        self.probe_pool = ConnectionPool(limit=16, limit_per_host=1, keepalive_timeout=keepalive_timeout)
         self.servers: Dict[str, MCPServerInfo] = {}
+        self.router = ToolRouter(strategy=routing)  # 工具 -> 副本集合，注册和健康状态变化时更新
+        # 合并同时进行的相同工具调用（工具名和规范化参数相同），多台TV同时发起热门查询时只转发一次
+        self.coalesce = coalesce
+        self.single_flight = SingleFlight()
         self.running = False
         self.server = None
         self.session = None
+        self.probe_session = None
         self.http_app = None
         self.health_check_task = None
         self.heartbeat_interval = 15  # 心跳检查间隔（秒）
         self.server_timeout = 45      # 服务器超时时间（秒）
         self.max_retries = 3          # 健康检查重试次数
+        self.health_timeout = 1.0     # 单次健康探测超时（秒）
+        self.health_deadline = 2.0    # 一轮健康检查的总时限（秒），所有服务器并发探测
+        self.heartbeat_watch_interval = 0.5  # 检查服务器心跳是否中断的间隔（秒）
+        self.heartbeat_misses = 3     # 连续错过多少个心跳周期视为离线
+        self.heartbeat_watch_task = None
     
     async def initialize(self):
         """初始化客户端资源，创建连接池和会话"""
         self.running = True
-        # 配置连接池参数，防止资源耗尽
-        connector = TCPConnector(
-            limit=100,            # 最大连接数
-            limit_per_host=20,      # 每个主机的最大连接数
-            force_close=True,       # 请求后强制关闭连接
-            enable_cleanup_closed=True  # 自动清理关闭的连接
-        )
-        self.session = ClientSession(connector=connector)
+        self.session = self.pool.open()
+        self.probe_session = self.probe_pool.open()
         logger.info(f"MCP Client initialized on http://{self.host}:{self.port}")
     
     async def close(self):
@@ -83,11 +120,20 @@ class MCPClient:
                 await self.health_check_task
             except asyncio.CancelledError:
                 logger.info("Health check task cancelled")
+        if self.heartbeat_watch_task and not self.heartbeat_watch_task.done():
+            self.heartbeat_watch_task.cancel()
+            try:
+                await self.heartbeat_watch_task
+            except asyncio.CancelledError:
+                pass
         
         # 关闭客户端会话
         if self.session:
-            await self.session.close()
+            await self.pool.close()
             self.session = None
+        if self.probe_session:
+            await self.probe_pool.close()
+            self.probe_session = None
         
         # 停止HTTP服务器
         if self.server:
@@ -110,46 +156,111 @@ class MCPClient:
             logger.error("Server registration failed: missing server ID")
             return False
         
-        server = MCPServerInfo(server_data)
+        try:
+            server = MCPServerInfo(server_data)
+        except ValueError as e:
+            logger.error(f"Server registration failed: {str(e)}")
+            return False
         server.last_heartbeat = time.time()
         server.status = "online"
         self.servers[server_id] = server
+        self.router.add(server)
         logger.info(f"Server registered: {server_id}, tools: {[t['name'] for t in server.tools]}")
         return True
     
+    def receive_heartbeat(self, data: Dict[str, Any]) -> bool:
+        """处理服务器推送的心跳，更新负载指标；未注册的服务器返回False，由其重新注册"""
+        server = self.servers.get(data.get("id"))
+        if not server:
+            return False
+        server.last_heartbeat = time.time()
+        server.load = data.get("load") or {}
+        if server.status != "online":
+            server.status = "online"
+            logger.info(f"Server back online by heartbeat: {server.id}")
+        self.router.update(server)
+        return True
+    
+    async def _probe_server(self, server: MCPServerInfo) -> Optional[bool]:
+        """探测单个服务器的/health，包含重试
+
+        返回True（健康）、False（连接失败或明确返回不健康）或None（超时等无法判断）。
+        繁忙的副本可能来不及在health_timeout内响应，只有连接失败才说明副本已不可达。
+        """
+        healthy = None
+        for retry in range(self.max_retries):
+            try:
+                async with self.probe_session.get(
+                    f"{server.base_url}/health",
+                    timeout=aiohttp.ClientTimeout(total=self.health_timeout),
+                    allow_redirects=False
+                ) as response:
+                    health = await response.json(content_type=None) if response.status == 200 else None
+                    if not isinstance(health, dict) or health.get("status") != "ok":
+                        logger.warning(f"Server health check failed (status {response.status}): {server.id}")
+                        return False
+                    if isinstance(health.get("load"), dict):
+                        server.load = health["load"]
+                    return True
+            except (aiohttp.ClientConnectorError, ConnectionError) as e:
+                healthy = False
+                logger.warning(f"Health check retry {retry+1}/{self.max_retries} for {server.id}: {str(e)}")
+            except asyncio.TimeoutError:
+                healthy = None
+                logger.warning(f"Health check retry {retry+1}/{self.max_retries} for {server.id}: timed out")
+            except Exception as e:
+                logger.error(f"Unexpected error checking {server.id}: {str(e)}")
+                return None
+        return healthy
+    
     async def check_server_health(self):
-        """检查所有服务器的健康状态，包含重试机制"""
+        """并发检查所有服务器的健康状态，单个服务器挂起不会拖慢其他服务器，整轮不超过health_deadline"""
         current_time = time.time()
+        probes: Dict[asyncio.Task, MCPServerInfo] = {}
         for server_id, server in list(self.servers.items()):
             # 检查超时
             if current_time - server.last_heartbeat > self.server_timeout:
-                server.status = "offline"
-                logger.warning(f"Server marked offline due to timeout: {server_id}")
-                continue
-            
-            # 发送健康检查请求，包含重试逻辑
-            success = False
-            for retry in range(self.max_retries):
-                try:
-                    async with self.session.get(
-                        f"{server.base_url}/health",
-                        timeout=8,  # 适当延长超时时间
-                        allow_redirects=False
-                    ) as response:
-                        if response.status == 200:
-                            server.status = "online"
-                            server.last_heartbeat = time.time()
-                            success = True
-                            break
-                        else:
-                            server.status = "offline"
-                            logger.warning(f"Server health check failed (status {response.status}): {server_id}")
-                except (asyncio.TimeoutError, ConnectionError) as e:
-                    logger.warning(f"Health check retry {retry+1}/{self.max_retries} for {server_id}: {str(e)}")
-                except Exception as e:
+                if server.status != "offline":
                     server.status = "offline"
-                    logger.error(f"Unexpected error checking {server_id}: {str(e)}")
-                    break
+                    self.router.update(server)
+                    logger.warning(f"Server marked offline due to timeout: {server_id}")
+                continue
+            probes[asyncio.create_task(self._probe_server(server))] = server
+        
+        if not probes:
+            return
+        done, pending = await asyncio.wait(probes, timeout=self.health_deadline)
+        for task in pending:
+            task.cancel()
+        
+        for task, server in probes.items():
+            # 整轮超时或探测超时无法判断健康状态，保持原状态，由心跳超时（server_timeout）兜底
+            healthy = task.result() if task in done and task.exception() is None else None
+            if healthy is None:
+                continue
+            if healthy:
+                server.status = "online"
+                server.last_heartbeat = time.time()
+            elif server.status != "offline":
+                server.status = "offline"
+                logger.warning(f"Server marked offline by health check: {server.id}")
+            self.router.update(server)
+    
+    async def watch_heartbeats(self):
+        """检查推送心跳的服务器，连续错过heartbeat_misses个周期即标记离线，路由在一两秒内避开该副本"""
+        try:
+            while self.running:
+                await asyncio.sleep(self.heartbeat_watch_interval)
+                current_time = time.time()
+                for server in list(self.servers.values()):
+                    if not server.heartbeat_interval or server.status != "online":
+                        continue
+                    if current_time - server.last_heartbeat > server.heartbeat_interval * self.heartbeat_misses:
+                        server.status = "offline"
+                        self.router.update(server)
+                        logger.warning(f"Server marked offline, heartbeat missed: {server.id}")
+        except asyncio.CancelledError:
+            pass
     
     async def periodic_health_check(self):
         """定期执行服务器健康检查的后台任务"""
@@ -177,15 +288,29 @@ class MCPClient:
                         tools[tool_name]["servers"].append(server.id)
         return list(tools.values())
     
+    def shard_count(self) -> int:
+        """已注册的分片服务器划分的分片数，没有分片服务器时为0"""
+        return max((server.shard.count for server in self.servers.values() if server.shard), default=0)
+    
+    def scatter_shards(self, tool_name: str) -> int:
+        """没有持有全量数据的副本时，分片工具需扇出到每个分片，返回分片数；否则返回0"""
+        if tool_name in SHARDED_TOOLS and not self.router.candidates(tool_name):
+            return self.shard_count()
+        return 0
+    
     def find_server_for_tool(self, tool_name: str) -> Optional[MCPServerInfo]:
-        """根据工具名称查找可用的在线服务器"""
-        for server in self.servers.values():
-            if server.status == "online" and server.has_tool(tool_name):
-                return server
-        return None
+        """根据工具名称选择负载最低的在线副本"""
+        return self.router.pick(tool_name)
     
-    async def execute_tool(self, request: Dict[str, Any]) -> Dict[str, Any]:
-        """执行工具调用，转发请求到对应服务器并处理响应"""
+    async def execute_tool(self, request: Dict[str, Any], wire_format: str = wire.SSE,
+                           deadline: Optional[float] = None) -> Union[Dict[str, Any], bytes]:
+        """执行工具调用，转发请求到对应服务器并处理响应
+
+        wire_format为msgpack时，服务器返回的msgpack数据不经解码原样返回（bytes），由调用方直接包装转发。
+        deadline为调用方的截止时间（time.time()），转发时只把剩余的时间预算传给服务器；
+        只合并截止时间落在同一时间段（deadline_bucket）内的相同调用，上游调用使用首个调用的截止时间，
+        每个调用最多等到自己的截止时间。
+        """
         # 验证请求格式
         validation = validate_tool_request(request)
         if not validation["valid"]:
@@ -195,8 +320,37 @@ class MCPClient:
                 "error": validation["error"]
             }
         
+        tool_name = request.get("tool_name")
+        # 转发规范化后的参数：合并的调用键相同，实际执行的参数也必须相同，不能取决于首个调用的原始写法
+        request = {**request, "parameters": canonicalize(request.get("parameters", {}))}
+        if not self.coalesce:
+            return await self._route_execute(request, wire_format, deadline)
+        key = make_cache_key(tool_name, request["parameters"])
+        try:
+            result = await self.single_flight.do(f"{wire_format}:{deadline_bucket(deadline)}:{key}",
+                                                 lambda: self._route_execute(request, wire_format, deadline), deadline)
+        except asyncio.TimeoutError:
+            return {
+                "request_id": request.get("request_id", ""),
+                "success": False,
+                "error": f"Tool execution timed out for {tool_name}"
+            }
+        if isinstance(result, bytes):
+            return result
+        # 合并的请求共享同一结果，带request_id的错误结果换成各自的request_id
+        if "request_id" in result:
+            result = {**result, "request_id": request.get("request_id", "")}
+        return result
+    
+    async def _route_execute(self, request: Dict[str, Any], wire_format: str = wire.SSE,
+                             deadline: Optional[float] = None) -> Union[Dict[str, Any], bytes]:
+        """选出副本并转发单个工具调用"""
         tool_name = request.get("tool_name")
         parameters = request.get("parameters", {})
+        # 没有持有全量数据的副本时，分片工具扇出到每个分片各一个副本
+        shard_count = self.scatter_shards(tool_name)
+        if shard_count:
+            return await self._scatter_gather(request, shard_count, deadline)
         server = self.find_server_for_tool(tool_name)
         
         if not server:
@@ -208,49 +362,19 @@ class MCPClient:
         
         logger.info(f"Forwarding tool request to {server.id}: {tool_name}({parameters})")
         try:
-            # 转发请求到服务器
-            async with self.session.post(
-                f"{server.base_url}/execute",
-                json=request,
-                timeout=60
-            ) as response:
-                if response.status != 200:
-                    error = await response.text()
-                    return {
-                        "request_id": request.get("request_id", ""),
-                        "success": False,
-                        "error": f"Server returned error ({response.status}): {error}"
-                    }
-                
-                # 根据Content-Type处理响应
-                content_type = response.headers.get('Content-Type', '')
-                
-                if 'text/event-stream' in content_type:
-                    # 处理SSE格式响应
-                    async for line in response.content:
-                        line = line.decode('utf-8').strip()
-                        if line.startswith('data:'):
-                            data = line[5:].strip()
-                            try:
-                                result = json.loads(data)
-                                return result
-                            except json.JSONDecodeError:
-                                logger.error(f"Failed to parse SSE data: {data}")
-                                return {
-                                    "request_id": request.get("request_id", ""),
-                                    "success": False,
-                                    "error": "Failed to parse server response"
-                                }
-                    # 如果没有找到有效数据
-                    return {
-                        "request_id": request.get("request_id", ""),
-                        "success": False,
-                        "error": "Empty SSE response from server"
-                    }
-                else:
-                    # 默认处理JSON响应
-                    return await response.json()
-                    
+            # 转发请求到服务器，期间计入该副本的在途请求数
+            with self.router.track(server):
+                result = await self._forward_execute(server, request, wire_format, deadline)
+            if not (isinstance(result, dict) and result.get("retry_after") is not None):
+                return result
+            # 副本过载拒绝：在下次心跳前按饱和处理，有其他副本时改发一次
+            server.load = {**(server.load or {}), "saturated": True}
+            retry = self.find_server_for_tool(tool_name)
+            if retry is None or retry is server:
+                return result
+            logger.info(f"{server.id} is overloaded, retrying on {retry.id}: {tool_name}")
+            with self.router.track(retry):
+                return await self._forward_execute(retry, request, wire_format, deadline)
         except asyncio.TimeoutError:
             return {
                 "request_id": request.get("request_id", ""),
@@ -265,6 +389,233 @@ class MCPClient:
                 "error": str(e)
             }
     
+    async def _scatter_gather(self, request: Dict[str, Any], shard_count: int,
+                              deadline: Optional[float] = None) -> Dict[str, Any]:
+        """把检索请求发给每个分片的一个副本，各分片返回前offset+limit个带排序分数的结果，按排序顺序合并"""
+        tool_name = request.get("tool_name")
+        parameters = request.get("parameters") or {}
+        try:
+            limit, offset = max(int(parameters.get("limit", 100)), 0), max(int(parameters.get("offset", 0)), 0)
+        except (TypeError, ValueError):
+            return {"success": False, "error": "limit and offset must be integers"}
+        shard_request = {**request, "parameters": {**parameters, "limit": offset + limit, "offset": 0, "ranked": True}}
+        
+        servers = [self.find_server_for_tool(shard_route(tool_name, index)) for index in range(shard_count)]
+        missing = [f"{index}/{shard_count}" for index, server in enumerate(servers) if server is None]
+        if missing:
+            return {
+                "request_id": request.get("request_id", ""),
+                "success": False,
+                "error": f"No online server available for shards: {', '.join(missing)}"
+            }
+        
+        async def call_shard(server: MCPServerInfo) -> Dict[str, Any]:
+            with self.router.track(server):
+                return await self._forward_execute(server, shard_request, deadline=deadline)
+        
+        logger.info(f"Scattering tool request to {shard_count} shards: {tool_name}({parameters})")
+        try:
+            responses = await asyncio.gather(*[call_shard(server) for server in servers])
+        except Exception as e:
+            logger.error(f"Shard execution error: {str(e)}", exc_info=True)
+            return {"request_id": request.get("request_id", ""), "success": False, "error": str(e)}
+        failed = [response for response in responses if not response.get("success")]
+        if failed:
+            return {"request_id": request.get("request_id", ""), "success": False,
+                    "error": failed[0].get("error") or "Shard execution failed"}
+        
+        return {
+            "tool_name": tool_name,
+            "parameters": parameters,
+            "result": merge_ranked([response.get("result") or {} for response in responses], offset=offset, limit=limit),
+            "success": True,
+            "error": None
+        }
+    
+    async def _forward_execute(self, server: MCPServerInfo, request: Dict[str, Any],
+                               wire_format: str = wire.SSE, deadline: Optional[float] = None) -> Union[Dict[str, Any], bytes]:
+        """把单个工具请求转发到服务器的/execute并解析响应；msgpack响应只切分帧，不解码"""
+        headers = {"Accept": wire_format}
+        timeout = time_left(deadline)
+        if timeout is not None:
+            if timeout <= 0:
+                return {
+                    "request_id": request.get("request_id", ""),
+                    "success": False,
+                    "error": f"Deadline exceeded before forwarding {request.get('tool_name')}"
+                }
+            headers[DEADLINE_HEADER] = f"{timeout:.3f}"
+        async with self.session.post(
+            f"{server.base_url}/execute",
+            json=request,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=timeout if timeout is not None else 60)
+        ) as response:
+            if response.status == 503 and response.headers.get("Retry-After"):
+                # 服务器过载，请求未执行
+                error = await response.text()
+                return {
+                    "request_id": request.get("request_id", ""),
+                    "success": False,
+                    "error": f"Server overloaded: {error}",
+                    "retry_after": int(response.headers["Retry-After"])
+                }
+            if response.status != 200:
+                error = await response.text()
+                return {
+                    "request_id": request.get("request_id", ""),
+                    "success": False,
+                    "error": f"Server returned error ({response.status}): {error}"
+                }
+            
+            # 根据Content-Type处理响应
+            content_type = response.headers.get('Content-Type', '')
+            
+            if wire.MSGPACK in content_type:
+                payload = next(wire.iter_payloads(await response.read()), None)
+                if payload is not None:
+                    return payload
+                return {
+                    "request_id": request.get("request_id", ""),
+                    "success": False,
+                    "error": "Empty msgpack response from server"
+                }
+            elif 'text/event-stream' in content_type:
+                # 处理SSE格式响应，取第一条data作为结果；读完整个响应，连接才能放回连接池复用
+                result = None
+                async for line in response.content:
+                    line = line.decode('utf-8').strip()
+                    if result is None and line.startswith('data:'):
+                        data = line[5:].strip()
+                        try:
+                            result = json.loads(data)
+                        except json.JSONDecodeError:
+                            logger.error(f"Failed to parse SSE data: {data}")
+                            result = {
+                                "request_id": request.get("request_id", ""),
+                                "success": False,
+                                "error": "Failed to parse server response"
+                            }
+                if result is not None:
+                    return result
+                # 如果没有找到有效数据
+                return {
+                    "request_id": request.get("request_id", ""),
+                    "success": False,
+                    "error": "Empty SSE response from server"
+                }
+            else:
+                # 默认处理JSON响应
+                return await response.json()
+    
+    async def execute_batch(self, requests: List[Dict[str, Any]], deadline: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """批量执行工具调用：按服务器分组，每台服务器一次/execute_batch请求，结果按完成顺序产出
+
+        需要扇出到各分片的分片工具不参与分组，与execute_tool一样单独执行后合并结果。
+        """
+        groups: Dict[str, Tuple[MCPServerInfo, List[Dict[str, Any]]]] = {}
+        scattered: List[Dict[str, Any]] = []
+        for i, request in enumerate(requests):
+            if not isinstance(request, dict):
+                yield {"request_id": generate_request_id({"index": i}), "success": False,
+                       "error": "request must be a JSON object"}
+                continue
+            # 未提供request_id的请求按位置生成，保证结果可以对应回请求
+            request_id = str(request.get("request_id") or generate_request_id({"index": i, **request}))
+            request = {**request, "request_id": request_id}
+            
+            validation = validate_tool_request(request)
+            if not validation["valid"]:
+                yield {"request_id": request_id, "success": False, "error": validation["error"]}
+                continue
+            
+            tool_name = request.get("tool_name")
+            if self.scatter_shards(tool_name):
+                scattered.append(request)
+                continue
+            server = self.find_server_for_tool(tool_name)
+            if not server:
+                yield {"request_id": request_id, "success": False,
+                       "error": f"No online server available for tool: {tool_name}"}
+                continue
+            groups.setdefault(server.id, (server, []))[1].append(request)
+        
+        if not groups and not scattered:
+            return
+        
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks = [
+            asyncio.create_task(self._forward_batch(server, items, queue, deadline))
+            for server, items in groups.values()
+        ] + [
+            asyncio.create_task(self._execute_to_queue(request, queue, deadline))
+            for request in scattered
+        ]
+        remaining = sum(len(items) for _, items in groups.values()) + len(scattered)
+        try:
+            while remaining:
+                yield await queue.get()
+                remaining -= 1
+            # 全部结果已返回，等待转发任务读完响应，连接才能放回连接池
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    async def _execute_to_queue(self, request: Dict[str, Any], queue: asyncio.Queue, deadline: Optional[float] = None):
+        """单独执行批量中的一个请求（经execute_tool，分片工具扇出合并），结果带上request_id放入队列"""
+        try:
+            result = await self.execute_tool(request, deadline=deadline)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Tool execution error: {str(e)}", exc_info=True)
+            result = {"success": False, "error": str(e)}
+        await queue.put({**result, "request_id": request["request_id"]})
+    
+    async def _forward_batch(self, server: MCPServerInfo, requests: List[Dict[str, Any]], queue: asyncio.Queue,
+                             deadline: Optional[float] = None):
+        """把同一服务器的请求转发到其/execute_batch，逐条读取SSE结果放入队列
+
+        连接失败或流提前结束时，为尚未返回的请求补充错误结果，保证每个请求恰好有一条结果。
+        """
+        pending = {request["request_id"] for request in requests}
+        error = "Empty SSE response from server"
+        logger.info(f"Forwarding {len(requests)} batched tool requests to {server.id}")
+        headers = {}
+        timeout = time_left(deadline)
+        if timeout is not None:
+            headers[DEADLINE_HEADER] = f"{max(timeout, 0):.3f}"
+        try:
+            if timeout is not None and timeout <= 0:
+                raise asyncio.TimeoutError()
+            with self.router.track(server, count=len(requests)):
+                async with self.session.post(
+                    f"{server.base_url}/execute_batch",
+                    json={"requests": requests},
+                    headers=headers,
+                    timeout=aiohttp.ClientTimeout(total=timeout if timeout is not None else 60)
+                ) as response:
+                    if response.status != 200:
+                        error = f"Server returned error ({response.status}): {await response.text()}"
+                    else:
+                        async for line in response.content:
+                            result = parse_sse_line(line.decode('utf-8'))
+                            if not result or result.get("request_id") not in pending:
+                                continue
+                            pending.discard(result["request_id"])
+                            await queue.put(result)
+        except asyncio.TimeoutError:
+            error = f"Batch tool execution timed out on {server.id}"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Batch tool execution error: {str(e)}", exc_info=True)
+            error = str(e)
+        
+        for request_id in pending:
+            await queue.put({"request_id": request_id, "success": False, "error": error})
+    
     async def sse_response(self, request_id: str, data: Dict[str, Any]):
         """生成SSE格式的响应数据，返回字节数据"""
         sse_data = {"request_id": request_id, "data": data}
@@ -276,7 +627,12 @@ class MCPClient:
             if request.method == 'POST' and request.path == '/execute':
                 data = await request.json()
                 logger.info(f"Received execute request: {format_message_for_logging(data)}")
-                result = await self.execute_tool(data)
+                wire_format = wire.negotiate(request.headers.get('Accept', ''))
+                deadline = deadline_after(parse_budget(request.headers.get(DEADLINE_HEADER)))
+                result = await self.execute_tool(data, wire_format, deadline)
+                if wire_format == wire.MSGPACK:
+                    payload = result if isinstance(result, bytes) else wire.pack(result)
+                    return web.Response(body=wire.envelope(data.get("request_id"), payload), content_type=wire.MSGPACK)
                 response = web.StreamResponse(
                     status=200,
                     headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
@@ -286,6 +642,33 @@ class MCPClient:
                 await response.write_eof()
                 return response
             
+            elif request.method == 'POST' and request.path == '/execute_batch':
+                data = await request.json()
+                items = data.get("requests") if isinstance(data, dict) else data
+                if not isinstance(items, list):
+                    return web.json_response({"error": "requests must be a JSON array"}, status=400)
+                logger.info(f"Received execute_batch request: {len(items)} tool calls")
+                wire_format = wire.negotiate(request.headers.get('Accept', ''))
+                response = web.StreamResponse(
+                    status=200,
+                    headers={"Content-Type": wire_format, "Cache-Control": "no-cache"}
+                )
+                await response.prepare(request)
+                # 每个结果完成即推送，帧格式与/execute相同；msgpack以响应结束表示完成
+                deadline = deadline_after(parse_budget(request.headers.get(DEADLINE_HEADER)))
+                async for result in self.execute_batch(items, deadline):
+                    await response.write(wire.encode({"request_id": result.get("request_id"), "data": result}, wire_format))
+                if wire_format == wire.SSE:
+                    await response.write(b'data: {"type": "done"}\n\n')
+                await response.write_eof()
+                return response
+            
+            elif request.method == 'POST' and request.path == '/heartbeat':
+                data = await request.json()
+                if not self.receive_heartbeat(data):
+                    return web.json_response({"status": "error", "message": "Unknown server, please register"}, status=404)
+                return web.json_response({"status": "success"})
+            
             elif request.method == 'POST' and request.path == '/register':
                 server_data = await request.json()
                 success = self.register_server(server_data)
@@ -303,6 +686,15 @@ class MCPClient:
             elif request.method == 'GET' and request.path == '/servers':
                 return web.json_response([s.to_dict() for s in self.servers.values()])
             
+            elif request.method == 'GET' and request.path == '/routing':
+                return web.json_response(self.router.stats())
+            
+            elif request.method == 'GET' and request.path == '/pool':
+                return web.json_response(self.pool.stats())
+            
+            elif request.method == 'GET' and request.path == '/coalescing':
+                return web.json_response(self.single_flight.stats())
+            
             return web.Response(text="Not Found", status=404)
         except Exception as e:
             logger.error(f"HTTP handler error: {str(e)}", exc_info=True)
@@ -317,13 +709,15 @@ class MCPClient:
         self.http_app.router.add_route('*', '/{path:.*}', self.http_handler)
         
         # 启动HTTP服务器
-        runner = web.AppRunner(self.http_app)
+        # 调用方断开时取消处理中的请求，转发到服务器的连接随之关闭，服务器端的工具调用也被取消
+        runner = web.AppRunner(self.http_app, handler_cancellation=True)
         await runner.setup()
         self.server = web.TCPSite(runner, self.host, self.port)
         await self.server.start()
         
         # 启动健康检查后台任务
         self.health_check_task = asyncio.create_task(self.periodic_health_check())
+        self.heartbeat_watch_task = asyncio.create_task(self.watch_heartbeats())
         
         logger.info(f"MCP Client started on http://{self.host}:{self.port}")
     
@@ -339,9 +733,17 @@ async def main():
     parser = argparse.ArgumentParser(description='MCP Client Service')
     parser.add_argument('--host', type=str, default='localhost', help='Bind host')
     parser.add_argument('--port', type=int, default=9000, help='Bind port')
+    parser.add_argument('--routing', type=str, default='least_outstanding', choices=ROUTING_STRATEGIES,
+                        help='Replica selection strategy for tools served by several servers')
+    parser.add_argument('--pool-size', type=int, default=100, help='Max pooled connections to tool servers')
+    parser.add_argument('--pool-per-host', type=int, default=20, help='Max pooled connections per tool server')
+    parser.add_argument('--keepalive-timeout', type=float, default=30.0, help='Idle pooled connection lifetime in seconds')
+    parser.add_argument('--no-coalesce', action='store_true', help='Forward identical concurrent tool calls separately')
     args = parser.parse_args()
     
-    client = MCPClient(host=args.host, port=args.port)
+    client = MCPClient(host=args.host, port=args.port, routing=args.routing, pool_size=args.pool_size,
+                       pool_per_host=args.pool_per_host, keepalive_timeout=args.keepalive_timeout,
+                       coalesce=not args.no_coalesce)
     try:
         await client.start()
         logger.info(f"Press Ctrl+C to stop the client")
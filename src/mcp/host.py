@@ -4,15 +4,30 @@ import time
 import asyncio
 import logging
 from typing import Dict, Any, List, Optional, Set
+import aiohttp
 from aiohttp import web
+from utils import ConnectionPool, parse_sse_line, DEADLINE_HEADER, parse_budget, deadline_after, time_left
 
 # 配置日志
 logger = logging.getLogger("mcp.host")
 
+DONE_FRAME = b'data: {"type": "done"}\n\n'
+
+
+def sse_frame(data: Dict[str, Any]) -> bytes:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8')
+
 class MCPHost:
-    def __init__(self, host: str = "localhost", port: int = 8080):
+    def __init__(self, host: str = "localhost", port: int = 8080,
+                 pool_size: int = 100, pool_per_host: int = 20, keepalive_timeout: float = 30.0,
+                 read_bufsize: int = 64 * 1024, read_timeout: float = 60.0):
         self.host = host
         self.port = port
+        # 上游响应的读缓冲上限：调用方读得慢时缓冲填满即停止读取上游，背压经TCP传回工具服务器
+        self.read_bufsize = read_bufsize
+        self.read_timeout = read_timeout  # 两次收到上游数据之间的最长等待（秒），不限制整个流的时长
+        # 到工具服务器的持久连接池，所有转发请求共用一个session
+        self.pool = ConnectionPool(limit=pool_size, limit_per_host=pool_per_host, keepalive_timeout=keepalive_timeout)
         self.servers: Dict[str, Dict[str, Any]] = {}  # 服务器ID -> 服务器信息
         self.tools: Dict[str, Dict[str, Any]] = {}    # 工具名称 -> 工具信息
         self.app = web.Application()
@@ -28,11 +43,16 @@ class MCPHost:
         self.app.router.add_get('/tools', self.list_tools)
         self.app.router.add_post('/register', self.register_server)
         self.app.router.add_post('/execute', self.execute_tool)
+        self.app.router.add_get('/pool', self.pool_stats)
         
     async def health_check(self, request):
         """健康检查端点"""
         return web.json_response({"status": "ok", "server_count": len(self.servers)})
     
+    async def pool_stats(self, request):
+        """连接池占用和复用统计"""
+        return web.json_response(self.pool.stats())
+    
     async def list_tools(self, request):
         """列出所有可用工具"""
         return web.json_response({
@@ -76,76 +96,119 @@ class MCPHost:
             return web.json_response({"status": "error", "message": str(e)}, status=500)
     
     async def execute_tool(self, request):
-        """执行工具并返回SSE流"""
+        """执行工具，把工具服务器的SSE帧边到达边转发给调用方"""
         try:
             data = await request.json()
-            tool_name = data.get("tool_name")
-            parameters = data.get("parameters", {})
-            
-            if not tool_name:
-                return web.json_response({"status": "error", "message": "Missing tool_name"}, status=400)
-            
-            # 检查工具是否存在
-            if tool_name not in self.tools:
-                return web.json_response({"status": "error", "message": f"Tool not found: {tool_name}"}, status=404)
-            
-            # 查找提供此工具的服务器
-            server_id = None
-            for sid, server in self.servers.items():
-                if tool_name in server["tools"]:
-                    server_id = sid
-                    break
-            
-            if not server_id:
-                return web.json_response({"status": "error", "message": f"No server available for tool: {tool_name}"}, status=503)
-            
-            server_url = self.servers[server_id]["url"]
-            logger.info(f"Executing tool {tool_name} on server {server_id}")
-            
-            # 转发请求到服务器并流式返回结果
-            async def generate():
-                try:
-                    async with web.ClientSession() as session:
-                        async with session.post(
-                            f"{server_url}/execute",
-                            json={"tool_name": tool_name, "parameters": parameters}
-                        ) as response:
-                            if response.status != 200:
-                                error_data = await response.json()
-                                yield f"data: {json.dumps({'type': 'error', 'content': error_data.get('message', 'Unknown error')})}\n\n"
-                                return
-                            
-                            # 流式读取服务器响应并转发
-                            async for line in response.content:
-                                line = line.decode('utf-8').strip()
-                                if line.startswith('data:'):
-                                    data_str = line[5:].strip()
-                                    yield f"data: {data_str}\n\n"
-                    
-                    # 发送完成信号
-                    yield "data: {\"type\": \"done\"}\n\n"
-                    
-                except Exception as e:
-                    logger.error(f"Error executing tool: {str(e)}")
-                    yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
-            
-            return web.Response(
-                body=generate(),
-                content_type='text/event-stream',
-                headers={
-                    'Cache-Control': 'no-cache',
-                    'Connection': 'keep-alive',
-                    'Transfer-Encoding': 'chunked'
-                }
-            )
-            
         except Exception as e:
             logger.error(f"Error handling execute request: {str(e)}")
-            return web.json_response({"status": "error", "message": str(e)}, status=500)
+            return web.json_response({"status": "error", "message": str(e)}, status=400)
+        
+        tool_name = data.get("tool_name")
+        parameters = data.get("parameters", {})
+        
+        if not tool_name:
+            return web.json_response({"status": "error", "message": "Missing tool_name"}, status=400)
+        
+        # 检查工具是否存在
+        if tool_name not in self.tools:
+            return web.json_response({"status": "error", "message": f"Tool not found: {tool_name}"}, status=404)
+        
+        # 查找提供此工具的服务器
+        server_id = None
+        for sid, server in self.servers.items():
+            if tool_name in server["tools"]:
+                server_id = sid
+                break
+        
+        if not server_id:
+            return web.json_response({"status": "error", "message": f"No server available for tool: {tool_name}"}, status=503)
+        
+        server_url = self.servers[server_id]["url"]
+        logger.info(f"Executing tool {tool_name} on server {server_id}")
+        
+        deadline = deadline_after(parse_budget(request.headers.get(DEADLINE_HEADER)))
+        upstream_request = {"tool_name": tool_name, "parameters": parameters}
+        if data.get("request_id"):
+            upstream_request["request_id"] = data["request_id"]
+        
+        response = web.StreamResponse(
+            status=200,
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        # 调用方的时间预算只把剩余部分传给工具服务器，同时作为整个上游请求的超时
+        timeout = time_left(deadline)
+        headers = {DEADLINE_HEADER: f"{timeout:.3f}"} if timeout is not None else {}
+        try:
+            if timeout is not None and timeout <= 0:
+                raise asyncio.TimeoutError()
+            async with self.pool.open().post(
+                f"{server_url}/execute",
+                json=upstream_request,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=timeout, sock_read=self.read_timeout),
+                read_bufsize=self.read_bufsize
+            ) as upstream:
+                if upstream.status != 200:
+                    await response.write(sse_frame({"type": "error", "content": await self._upstream_error(upstream)}))
+                else:
+                    await self._relay_frames(upstream, response)
+            await response.write(DONE_FRAME)
+        except ConnectionResetError:
+            # 调用方已断开，退出后上游连接随之关闭，工具服务器不再继续发送
+            logger.info(f"Caller disconnected while streaming {tool_name}")
+            return response
+        except asyncio.TimeoutError:
+            # 超过调用方的时间预算，或上游在read_timeout内没有发送数据
+            logger.warning(f"Timed out while streaming {tool_name}")
+            await response.write(sse_frame({"type": "error", "content": f"Tool execution timed out for {tool_name}"}))
+        except Exception as e:
+            logger.error(f"Error executing tool: {str(e)}")
+            await response.write(sse_frame({"type": "error", "content": str(e)}))
+        await response.write_eof()
+        return response
+    
+    async def _relay_frames(self, upstream: aiohttp.ClientResponse, response: web.StreamResponse):
+        """按SSE帧转发上游响应，去掉上游自己的done帧（由execute_tool统一发送）
+
+        response.write在发送缓冲区满时等待调用方读取，期间不再读取上游；
+        单帧超过read_bufsize时不再等待帧结束，直接转发已收到的部分，缓冲始终有界。
+        """
+        buffer = bytearray()
+        async for chunk in upstream.content.iter_any():
+            buffer += chunk
+            while True:
+                end = buffer.find(b"\n\n")
+                if end < 0:
+                    break
+                frame = bytes(buffer[:end + 2])
+                del buffer[:end + 2]
+                if not self._is_done_frame(frame):
+                    await response.write(frame)
+            if len(buffer) >= self.read_bufsize:
+                await response.write(bytes(buffer))
+                buffer.clear()
+        if buffer.strip():
+            await response.write(bytes(buffer) + b"\n\n")
+    
+    @staticmethod
+    def _is_done_frame(frame: bytes) -> bool:
+        if len(frame) > 64:
+            return False
+        data = parse_sse_line(frame.decode('utf-8', errors='ignore'))
+        return isinstance(data, dict) and data.get("type") == "done"
+    
+    @staticmethod
+    async def _upstream_error(upstream: aiohttp.ClientResponse) -> str:
+        body = await upstream.text()
+        try:
+            return json.loads(body).get("message", "Unknown error")
+        except (ValueError, AttributeError):
+            return body or f"Upstream returned {upstream.status}"
     
     async def start(self):
         """启动MCP主机服务"""
-        self.runner = web.AppRunner(self.app)
+        self.runner = web.AppRunner(self.app, handler_cancellation=True)
         await self.runner.setup()
         self.site = web.TCPSite(self.runner, self.host, self.port)
         await self.site.start()
@@ -160,6 +223,7 @@ class MCPHost:
             await self.site.stop()
         if self.runner:
             await self.runner.cleanup()
+        await self.pool.close()
         logger.info("MCP Host stopped")
     
     async def check_servers_health(self):
@@ -18,17 +18,18 @@ logging.basicConfig(
 
 logger = logging.getLogger("mcp.main")
 
-async def start_client(host: str = "localhost", port: int = 8080):
+async def start_client(host: str = "localhost", port: int = 8080, routing: str = "least_outstanding",
+                       pool_size: int = 100, keepalive_timeout: float = 30.0):
     """启动MCP客户端服务"""
     from client import MCPClient
-    client = MCPClient(host=host, port=port)
+    client = MCPClient(host=host, port=port, routing=routing, pool_size=pool_size, keepalive_timeout=keepalive_timeout)
     await client.start()
     return client
 
-async def start_server(host: str = "localhost", port: int = 8081, client_url: str = None):
+async def start_server(host: str = "localhost", port: int = 8081, client_url: str = None, workers: int = 0):
     """启动MCP服务器"""
     from server import MCPServer
-    server = MCPServer(host=host, port=port, client_url=client_url)
+    server = MCPServer(host=host, port=port, client_url=client_url, workers=workers)
     await server.start()
     return server
 
@@ -39,6 +40,8 @@ async def main():
     parser.add_argument('--server-host', type=str, default='localhost', help='Server host address')
     parser.add_argument('--server-port', type=int, default=8081, help='Server port')
     parser.add_argument('--embedded-server', action='store_true', help='Start embedded server')
+    parser.add_argument('--server-workers', type=int, default=None, help='Embedded server tool process pool size')
+    parser.add_argument('--routing', type=str, default=None, help='Replica selection strategy (least_outstanding or ewma)')
     parser.add_argument('--config', type=str, help='Path to configuration file')
     
     args = parser.parse_args()
@@ -59,10 +62,15 @@ async def main():
     server_host = args.server_host or config.get("server_host", "localhost")
     server_port = args.server_port or config.get("server_port", 8081)
     embedded_server = args.embedded_server or config.get("embedded_server", False)
+    server_workers = args.server_workers if args.server_workers is not None else config.get("server_workers", 0)
+    routing = args.routing or config.get("routing", "least_outstanding")
+    pool_size = config.get("client_pool_size", 100)
+    keepalive_timeout = config.get("client_keepalive_timeout", 30.0)
     
     # 启动MCP客户端服务
     logger.info(f"Starting MCP Client on {client_host}:{client_port}")
-    client = await start_client(host=client_host, port=client_port)
+    client = await start_client(host=client_host, port=client_port, routing=routing,
+                                pool_size=pool_size, keepalive_timeout=keepalive_timeout)
     
     # 启动嵌入式服务器（如果需要）
     server = None
@@ -72,7 +80,8 @@ async def main():
         server = await start_server(
             host=server_host,
             port=server_port,
-            client_url=client_url
+            client_url=client_url,
+            workers=server_workers
         )
     
     # 保持运行
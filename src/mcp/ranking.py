@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+# 可用的排序键（均为降序）
+RANK_KEYS = ('YEAR', 'DOUBAN_SCORE', 'DOUBAN_VOTES')
+BLEND = 'BLEND'
+
+# 排序键别名，方便大模型填写
+_ALIASES = {
+    'YEAR': 'YEAR',
+    'SCORE': 'DOUBAN_SCORE',
+    'DOUBAN_SCORE': 'DOUBAN_SCORE',
+    'VOTES': 'DOUBAN_VOTES',
+    'DOUBAN_VOTES': 'DOUBAN_VOTES',
+    'BLEND': BLEND,
+}
+
+DEFAULT_WEIGHTS = {'DOUBAN_SCORE': 0.5, 'DOUBAN_VOTES': 0.3, 'YEAR': 0.2}
+
+EMPTY_ROWS = np.empty(0, dtype=np.int32)
+
+
+def top_k(rows: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    """按分数降序选出前k行（部分选择，不对全部命中行排序）
+
+    NaN分数排在最后，分数相同时按行号升序，保证分页结果稳定。
+    """
+    if k <= 0 or len(rows) == 0:
+        return EMPTY_ROWS
+    keys = -np.asarray(scores, dtype=np.float64)
+    keys[np.isnan(keys)] = np.inf
+    if k < len(rows):
+        kth = np.partition(keys, k - 1)[k - 1]
+        better = np.flatnonzero(keys < kth)
+        ties = np.flatnonzero(keys == kth)[:k - len(better)]
+        selected = np.concatenate([better, ties])
+    else:
+        selected = np.arange(len(rows))
+    order = np.lexsort((rows[selected], keys[selected]))
+    return rows[selected[order]]
+
+
+class Ranker:
+    """search_medias的排序阶段，持有各排序键的数值列"""
+
+    def __init__(self, movies: pd.DataFrame, bounds: Optional[Dict[str, float]] = None):
+        self.keys = {key: movies[key].to_numpy(dtype=np.float64) for key in RANK_KEYS}
+
+        # 综合排序用的归一化分量，缺失值记0；分片模式下使用全量数据的归一化范围，各分片的分数可以直接比较
+        self.bounds = bounds or self.compute_bounds(movies)
+        year = self.keys['YEAR']
+        year_min, year_max = self.bounds['year_min'], self.bounds['year_max']
+        span = year_max - year_min if np.isfinite(year_max - year_min) and year_max > year_min else 1.0
+        votes = np.log1p(np.clip(self.keys['DOUBAN_VOTES'], 0, None))
+        votes_max = self.bounds['votes_max'] or 1.0
+        self.normalized = {
+            'YEAR': np.nan_to_num((year - year_min) / span),
+            'DOUBAN_SCORE': np.nan_to_num(self.keys['DOUBAN_SCORE'] / 10.0),
+            'DOUBAN_VOTES': np.nan_to_num(votes / votes_max),
+        }
+
+    @staticmethod
+    def compute_bounds(movies: pd.DataFrame) -> Dict[str, float]:
+        """综合排序的归一化范围：年份最小/最大值、log(1+评价人数)的最大值"""
+        year = movies['YEAR'].to_numpy(dtype=np.float64)
+        votes = np.log1p(np.clip(movies['DOUBAN_VOTES'].to_numpy(dtype=np.float64), 0, None))
+        return {
+            'year_min': float(np.nanmin(year, initial=np.inf)),
+            'year_max': float(np.nanmax(year, initial=-np.inf)),
+            'votes_max': float(np.nanmax(votes, initial=0.0)),
+        }
+
+    @staticmethod
+    def resolve(sort_by: str) -> str:
+        """解析排序键名称，未知名称抛出ValueError"""
+        key = _ALIASES.get(str(sort_by).strip().upper())
+        if key is None:
+            raise ValueError(f"Unknown sort_by: {sort_by}")
+        return key
+
+    def scores(self, rows: np.ndarray, sort_by: str = 'YEAR', weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """计算命中行的排序分数"""
+        key = self.resolve(sort_by)
+        if key != BLEND:
+            return self.keys[key][rows]
+        weights = weights or DEFAULT_WEIGHTS
+        scores = np.zeros(len(rows), dtype=np.float64)
+        for name, weight in weights.items():
+            scores += float(weight) * self.normalized[self.resolve(name)][rows]
+        return scores
+
+    def rank(self, rows: np.ndarray, k: int, sort_by: str = 'YEAR',
+             weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """返回按排序键降序的前k个行号"""
+        return top_k(rows, self.scores(rows, sort_by, weights), k)
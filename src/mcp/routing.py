@@ -0,0 +1,101 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+# 副本选择策略：最少在途请求 / 在途请求数加权的EWMA延迟
+ROUTING_STRATEGIES = ('least_outstanding', 'ewma')
+
+
+class ToolRouter:
+    """工具 -> 在线副本集合 的路由表，在注册和健康状态变化时维护
+
+    同一工具由多个server.py进程提供时，按策略选出负载最低的副本；
+    副本的在途请求数和EWMA延迟记录在服务器信息对象上（inflight / ewma_latency）。
+    """
+
+    def __init__(self, strategy: str = 'least_outstanding', ewma_alpha: float = 0.3, failure_penalty: float = 5.0):
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.strategy = strategy
+        self.ewma_alpha = ewma_alpha
+        self.failure_penalty = failure_penalty  # 调用异常时计入EWMA的延迟（秒）
+        self.replicas: Dict[str, Dict[str, Any]] = {}  # 工具名 -> {服务器ID: 服务器}
+        self.servers: Dict[str, Any] = {}
+        self.cursor = 0  # 负载相同的副本之间轮转
+
+    def add(self, server) -> None:
+        """添加或替换服务器，按其状态更新工具索引"""
+        self.remove(server.id)
+        self.servers[server.id] = server
+        self.update(server)
+
+    def remove(self, server_id: str) -> None:
+        self.servers.pop(server_id, None)
+        for tool_name in list(self.replicas):
+            self.replicas[tool_name].pop(server_id, None)
+            if not self.replicas[tool_name]:
+                del self.replicas[tool_name]
+
+    def update(self, server) -> None:
+        """服务器状态变化后调用：在线时加入其工具的副本集合，否则移出"""
+        if self.servers.get(server.id) is not server:
+            return
+        for tool_name in server.tool_names:
+            if server.status == "online":
+                self.replicas.setdefault(tool_name, {})[server.id] = server
+            elif tool_name in self.replicas:
+                self.replicas[tool_name].pop(server.id, None)
+                if not self.replicas[tool_name]:
+                    del self.replicas[tool_name]
+
+    def candidates(self, tool_name: str) -> List[Any]:
+        return list(self.replicas.get(tool_name, {}).values())
+
+    def _load(self, server) -> tuple:
+        """负载排序键：心跳报告饱和的副本排在最后；在途请求数取本地计数与服务器上报值的较大者"""
+        load = getattr(server, "load", None) or {}
+        saturated = bool(load.get("saturated"))
+        inflight = max(server.inflight, load.get("inflight", 0))
+        latency = server.ewma_latency or 0.0
+        if self.strategy == 'ewma':
+            return saturated, latency * (inflight + 1), inflight
+        return saturated, inflight, latency
+
+    def pick(self, tool_name: str) -> Optional[Any]:
+        """选出负载最低的在线副本，没有副本时返回None"""
+        servers = self.candidates(tool_name)
+        if not servers:
+            return None
+        start = self.cursor % len(servers)
+        self.cursor += 1
+        return min(servers[start:] + servers[:start], key=self._load)
+
+    def observe(self, server, latency: float) -> None:
+        """用一次调用的耗时更新副本的EWMA延迟"""
+        if server.ewma_latency is None:
+            server.ewma_latency = latency
+        else:
+            server.ewma_latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * server.ewma_latency
+
+    @contextmanager
+    def track(self, server, count: int = 1):
+        """记录一次转发：期间计入在途请求数，结束后更新延迟；异常按failure_penalty计入"""
+        server.inflight += count
+        server.requests += count
+        start = time.perf_counter()
+        try:
+            yield server
+        except Exception:
+            server.failures += count
+            self.observe(server, max(time.perf_counter() - start, self.failure_penalty))
+            raise
+        else:
+            self.observe(server, time.perf_counter() - start)
+        finally:
+            server.inflight -= count
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "strategy": self.strategy,
+            "tools": {tool_name: sorted(replicas) for tool_name, replicas in self.replicas.items()},
+        }
@@ -0,0 +1,738 @@
+import re
+import random
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 未安装pypinyin时容错索引只做字符级的编辑距离匹配
+    lazy_pinyin = None
+
+# 包含正则元字符的查询无法用n-gram索引精确回答，交给pandas扫描以保持str.contains语义
+_REGEX_META = frozenset('.^$*+?{}[]\\|()')
+
+EMPTY_ROWS = np.empty(0, dtype=np.int32)
+
+
+def build_csr(keys: np.ndarray, values: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """按key分组构建CSR倒排表，返回(indptr, indices)，同一key内保持values原有顺序"""
+    keys = np.asarray(keys, dtype=np.int64)
+    order = np.argsort(keys, kind='stable')
+    indices = np.asarray(values, dtype=np.int32)[order]
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=indptr[1:])
+    return indptr, indices
+
+
+def intersect_sorted(arrays: List[np.ndarray]) -> np.ndarray:
+    """求多个有序去重行号列表的交集，从最短的列表开始"""
+    if not arrays:
+        return EMPTY_ROWS
+    arrays = sorted(arrays, key=len)
+    result = arrays[0]
+    for arr in arrays[1:]:
+        if len(result) == 0:
+            break
+        result = np.intersect1d(result, arr, assume_unique=True)
+    return result
+
+
+def union_sorted(arrays: List[np.ndarray]) -> np.ndarray:
+    """求多个有序行号列表的并集"""
+    if not arrays:
+        return EMPTY_ROWS
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.unique(np.concatenate(arrays))
+
+
+def _can_match_literally(value: Any, sep: Optional[str] = None) -> bool:
+    """value能否按字面子串匹配（非正则、不跨越分隔符），否则需要回退到扫描"""
+    if not isinstance(value, str) or not value:
+        return False
+    return not any(c in _REGEX_META for c in value) and not (sep and sep in value)
+
+
+def check_bits(bitmap: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """检查打包位图中指定行是否置位，返回bool数组"""
+    rows = np.asarray(rows, dtype=np.int64)
+    return ((bitmap[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)
+
+
+def bitmap_rows(bitmap: np.ndarray, size: int) -> np.ndarray:
+    """打包位图 -> 有序行号"""
+    return np.flatnonzero(np.unpackbits(bitmap, count=size)).astype(np.int32)
+
+
+class FieldIndex:
+    """单个文本字段的倒排索引
+
+    字段值按分隔符切成词条（NAME这类单值字段整体作为一个词条），
+    词条 -> 行号 采用CSR存储；词条本身再建立单字/双字n-gram倒排，
+    子串查询先用n-gram求交得到候选词条，再用与str.contains相同的正则校验。
+    """
+
+    def __init__(self, tokens: List[str], indptr: np.ndarray, rows: np.ndarray, sep: Optional[str] = None,
+                 grams: Optional[Tuple[List[str], np.ndarray, np.ndarray]] = None):
+        self.tokens = tokens
+        self.indptr = indptr
+        self.rows = rows
+        self.sep = sep
+        if grams is None:
+            grams = self._build_grams(tokens)
+        self.gram_keys, self.gram_indptr, self.gram_tokens = grams
+        self.gram_ids = {gram: i for i, gram in enumerate(self.gram_keys)}
+
+    @classmethod
+    def from_series(cls, series: pd.Series, sep: Optional[str] = None) -> "FieldIndex":
+        """从DataFrame列构建索引，文本取值与pandas路径一致（astype(str)）"""
+        values = series.astype(str)
+        # astype(str)后缺失值可能仍为NaN，与str.contains(na=False)一致地视为不匹配
+        values = values[values.map(lambda v: isinstance(v, str))]
+        if sep:
+            values = values.str.split(sep, regex=False).explode()
+        pairs = pd.DataFrame({"row": values.index.to_numpy(dtype=np.int64), "token": values.to_numpy(dtype=object)})
+        pairs = pairs.drop_duplicates()
+        codes, uniques = pd.factorize(pairs["token"])
+        tokens = [str(t) for t in uniques]
+        indptr, rows = build_csr(codes, pairs["row"].to_numpy(), len(tokens))
+        return cls(tokens, indptr, rows, sep)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Any], sep: Optional[str] = None) -> "FieldIndex":
+        """从快照数组恢复索引，不重新计算n-gram"""
+        grams = (arrays["gram_keys"], arrays["gram_indptr"], arrays["gram_tokens"])
+        return cls(arrays["tokens"], arrays["indptr"], arrays["rows"], sep, grams=grams)
+
+    def to_arrays(self) -> Dict[str, Any]:
+        """导出为字符串列表和numpy数组，供快照持久化"""
+        return {
+            "tokens": self.tokens,
+            "indptr": self.indptr,
+            "rows": self.rows,
+            "gram_keys": self.gram_keys,
+            "gram_indptr": self.gram_indptr,
+            "gram_tokens": self.gram_tokens,
+        }
+
+    @staticmethod
+    def _build_grams(tokens: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """为词条建立单字和双字n-gram倒排（大小写折叠后），返回(grams, indptr, token_ids)"""
+        gram_list = []
+        token_ids = []
+        for token_id, token in enumerate(tokens):
+            folded = token.casefold()
+            grams = set(folded)
+            grams.update(folded[i:i + 2] for i in range(len(folded) - 1))
+            gram_list.extend(grams)
+            token_ids.extend([token_id] * len(grams))
+        codes, uniques = pd.factorize(pd.Series(gram_list, dtype=object))
+        indptr, indices = build_csr(codes, np.asarray(token_ids, dtype=np.int32), len(uniques))
+        return [str(g) for g in uniques], indptr, indices
+
+    def token_rows(self, token_id: int) -> np.ndarray:
+        """返回词条对应的有序行号"""
+        return self.rows[self.indptr[token_id]:self.indptr[token_id + 1]]
+
+    def lookup(self, value: Any) -> Optional[np.ndarray]:
+        """查找字段中包含value（忽略大小写）的行号
+
+        返回有序行号数组；无法用索引精确回答时返回None，由调用方回退到扫描。
+        """
+        if not _can_match_literally(value, self.sep):
+            return None
+        # 折叠后长度变化的字符（如ß）无法保证n-gram候选完整
+        if any(len(c.casefold()) != 1 for c in value):
+            return None
+
+        folded = value.casefold()
+        if len(folded) == 1:
+            grams = {folded}
+        else:
+            grams = {folded[i:i + 2] for i in range(len(folded) - 1)}
+
+        postings = []
+        for gram in grams:
+            gram_id = self.gram_ids.get(gram)
+            if gram_id is None:
+                return EMPTY_ROWS
+            postings.append(self.gram_tokens[self.gram_indptr[gram_id]:self.gram_indptr[gram_id + 1]])
+        candidates = intersect_sorted(postings)
+
+        pattern = re.compile(value, flags=re.IGNORECASE)
+        matched = [self.token_rows(t) for t in candidates if pattern.search(self.tokens[t])]
+        return union_sorted(matched)
+
+
+class FacetIndex:
+    """多值分类字段（类型/地区/语言）的位图分面
+
+    每个取值一个按行打包的位图，查询值按子串匹配取值表（取值通常只有几十到几百个），
+    命中取值的位图按位或，多个分面之间按位与。
+    """
+
+    def __init__(self, values: List[str], bitmaps: np.ndarray, size: int, sep: Optional[str] = '/'):
+        self.values = values
+        self.bitmaps = bitmaps
+        self.size = size
+        self.sep = sep
+        self.nbytes = (size + 7) // 8
+
+    @classmethod
+    def from_series(cls, series: pd.Series, sep: Optional[str] = '/') -> "FacetIndex":
+        """从DataFrame列构建分面位图，取值切分方式与FieldIndex一致"""
+        field = FieldIndex.from_series(series, sep=sep)
+        size = len(series)
+        bitmaps = np.zeros((len(field.tokens), (size + 7) // 8), dtype=np.uint8)
+        for token_id in range(len(field.tokens)):
+            bits = np.zeros(size, dtype=bool)
+            bits[field.token_rows(token_id)] = True
+            bitmaps[token_id] = np.packbits(bits)
+        return cls(field.tokens, bitmaps, size, sep)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Any], size: int, sep: Optional[str] = '/') -> "FacetIndex":
+        return cls(arrays["values"], arrays["bitmaps"], size, sep)
+
+    def to_arrays(self) -> Dict[str, Any]:
+        return {"values": self.values, "bitmaps": self.bitmaps}
+
+    def match(self, value: Any) -> Optional[np.ndarray]:
+        """返回包含value（忽略大小写）的行的位图，无法精确回答时返回None"""
+        if not _can_match_literally(value, self.sep):
+            return None
+        pattern = re.compile(value, flags=re.IGNORECASE)
+        bitmap = np.zeros(self.nbytes, dtype=np.uint8)
+        for value_id, facet_value in enumerate(self.values):
+            if pattern.search(facet_value):
+                np.bitwise_or(bitmap, self.bitmaps[value_id], out=bitmap)
+        return bitmap
+
+
+class YearFacet:
+    """年份分桶位图：每个年份一个累积位图（年份<=该年的行），区间查询只需两个位图运算"""
+
+    def __init__(self, years: np.ndarray, cumulative: np.ndarray, size: int):
+        self.years = years
+        self.cumulative = cumulative
+        self.size = size
+        self.nbytes = (size + 7) // 8
+
+    @classmethod
+    def from_series(cls, series: pd.Series) -> "YearFacet":
+        values = series.to_numpy(dtype=np.float64)
+        size = len(values)
+        years = np.unique(values[~np.isnan(values)])
+        cumulative = np.zeros((len(years), (size + 7) // 8), dtype=np.uint8)
+        bits = np.zeros(size, dtype=bool)
+        order = np.argsort(values, kind='stable')
+        sorted_values = values[order]
+        start = 0
+        for i, year in enumerate(years):
+            end = int(np.searchsorted(sorted_values, year, side='right'))
+            bits[order[start:end]] = True
+            cumulative[i] = np.packbits(bits)
+            start = end
+        return cls(years, cumulative, size)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Any], size: int) -> "YearFacet":
+        return cls(arrays["years"], arrays["cumulative"], size)
+
+    def to_arrays(self) -> Dict[str, Any]:
+        return {"years": self.years, "cumulative": self.cumulative}
+
+    def _at_most(self, year: float, side: str = 'right') -> np.ndarray:
+        """年份<=year（side='right'）或<year（side='left'）的行的位图"""
+        i = int(np.searchsorted(self.years, year, side=side)) - 1
+        if i < 0:
+            return np.zeros(self.nbytes, dtype=np.uint8)
+        return self.cumulative[i]
+
+    def range(self, min_year: Optional[int] = None, max_year: Optional[int] = None) -> np.ndarray:
+        """年份落在[min_year, max_year]内的行的位图，缺失年份不匹配"""
+        if max_year is None:
+            upper = self.cumulative[-1] if len(self.years) else np.zeros(self.nbytes, dtype=np.uint8)
+        else:
+            upper = self._at_most(max_year)
+        if min_year is None:
+            return upper
+        return upper & ~self._at_most(min_year, side='left')
+
+
+def _split_credits(series: pd.Series) -> pd.DataFrame:
+    """解析ACTOR_IDS/DIRECTOR_IDS（格式“姓名A:ID|姓名B:ID”），返回(row, name, person)三列"""
+    entries = series.dropna().astype(str).str.split('|', regex=False).explode()
+    entries = entries[entries.str.contains(':', regex=False, na=False)]
+    parts = entries.str.rsplit(':', n=1, expand=True)
+    credits = pd.DataFrame({
+        "row": entries.index.to_numpy(dtype=np.int64),
+        "name": parts[0].str.strip().to_numpy(dtype=object),
+        "person": parts[1].str.strip().to_numpy(dtype=object),
+    })
+    return credits[credits["person"] != ""]
+
+
+class PersonIndex:
+    """人名 -> PERSON_ID -> 影片行号 的连接索引
+
+    姓名和别名（NAME/NAME_EN/NAME_ZH，大小写折叠后）精确映射到PERSON_ID，
+    PERSON_ID -> 行号（导演或演员）采用CSR存储。命中字典时人名查询只需一次字典查找和posting读取。
+    """
+
+    # 参与连接的演职员ID列
+    CREDIT_COLUMNS = ('DIRECTOR_IDS', 'ACTOR_IDS')
+
+    def __init__(self, names: List[str], name_indptr: np.ndarray, name_persons: np.ndarray,
+                 persons: List[str], indptr: np.ndarray, rows: np.ndarray):
+        self.names = names
+        self.name_indptr = name_indptr
+        self.name_persons = name_persons
+        self.persons = persons
+        self.indptr = indptr
+        self.rows = rows
+        self.name_ids = {name: i for i, name in enumerate(names)}
+
+    @staticmethod
+    def fold(value: str) -> str:
+        return value.strip().casefold()
+
+    @classmethod
+    def from_frames(cls, movies: pd.DataFrame, people: Optional[pd.DataFrame] = None,
+                    positions: Optional[np.ndarray] = None) -> "PersonIndex":
+        """从影片的演职员ID列和person.csv（可选，提供别名）构建索引
+
+        分片时movies为全量数据，positions为分片各行在全量数据中的行号：字典覆盖全量数据中的人，
+        posting只保留分片内的行（映射为分片行号），使人名是否精确命中与不分片时一致。
+        """
+        credits = pd.concat([_split_credits(movies[column]) for column in cls.CREDIT_COLUMNS
+                             if column in movies.columns], ignore_index=True)
+        if credits.empty:
+            credits = pd.DataFrame({"row": np.empty(0, dtype=np.int64), "name": [], "person": []})
+
+        # 影片中出现的人才需要进入字典，别名只补充这些人
+        aliases = [credits[["name", "person"]]]
+        if people is not None:
+            people = people.dropna(subset=['PERSON_ID'])
+            people = people.assign(PERSON_ID=people['PERSON_ID'].astype(str).str.strip())
+            people = people[people['PERSON_ID'].isin(credits["person"])]
+            for column in ('NAME', 'NAME_EN', 'NAME_ZH'):
+                if column not in people.columns:
+                    continue
+                names = people[column].dropna().astype(str).str.split('/', regex=False).explode()
+                aliases.append(pd.DataFrame({
+                    "name": names.str.strip().to_numpy(dtype=object),
+                    "person": people.loc[names.index, 'PERSON_ID'].to_numpy(dtype=object),
+                }))
+        aliases = pd.concat(aliases, ignore_index=True)
+        aliases = aliases.assign(name=aliases["name"].map(cls.fold))
+        aliases = aliases[aliases["name"] != ""].drop_duplicates()
+
+        person_codes, persons = pd.factorize(credits["person"])
+        pairs = pd.DataFrame({"person": person_codes, "row": credits["row"].to_numpy()})
+        if positions is not None:
+            shard_rows = np.full(len(movies), -1, dtype=np.int64)
+            shard_rows[np.asarray(positions, dtype=np.int64)] = np.arange(len(positions))
+            pairs = pairs.assign(row=shard_rows[pairs["row"].to_numpy()])
+            pairs = pairs[pairs["row"] >= 0]
+        pairs = pairs.drop_duplicates().sort_values(["person", "row"])
+        indptr, rows = build_csr(pairs["person"].to_numpy(), pairs["row"].to_numpy(), len(persons))
+
+        alias_persons = pd.Index(persons).get_indexer(aliases["person"])
+        name_codes, names = pd.factorize(aliases["name"])
+        name_indptr, name_persons = build_csr(name_codes, alias_persons, len(names))
+        return cls([str(n) for n in names], name_indptr, name_persons, [str(p) for p in persons], indptr, rows)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Any]) -> "PersonIndex":
+        return cls(arrays["names"], arrays["name_indptr"], arrays["name_persons"],
+                   arrays["persons"], arrays["indptr"], arrays["rows"])
+
+    def to_arrays(self) -> Dict[str, Any]:
+        return {
+            "names": self.names,
+            "name_indptr": self.name_indptr,
+            "name_persons": self.name_persons,
+            "persons": self.persons,
+            "indptr": self.indptr,
+            "rows": self.rows,
+        }
+
+    def name_pairs(self) -> Tuple[pd.Series, np.ndarray]:
+        """展开为(姓名或别名, 行号)对，用于构建人名容错索引"""
+        names, rows = [], []
+        for name_id, name in enumerate(self.names):
+            codes = self.name_persons[self.name_indptr[name_id]:self.name_indptr[name_id + 1]]
+            for code in codes:
+                person_rows = self.rows[self.indptr[code]:self.indptr[code + 1]]
+                names.extend([name] * len(person_rows))
+                rows.append(person_rows)
+        rows = np.concatenate(rows) if rows else EMPTY_ROWS
+        return pd.Series(names, dtype=object), rows
+
+    def _person_codes(self, value: Any) -> Optional[np.ndarray]:
+        if not isinstance(value, str):
+            return None
+        name_id = self.name_ids.get(self.fold(value))
+        if name_id is None:
+            return None
+        return self.name_persons[self.name_indptr[name_id]:self.name_indptr[name_id + 1]]
+
+    def resolve(self, value: Any) -> Optional[List[str]]:
+        """姓名或别名 -> PERSON_ID列表，字典中没有时返回None"""
+        codes = self._person_codes(value)
+        if codes is None:
+            return None
+        return [self.persons[code] for code in codes]
+
+    def lookup(self, value: Any) -> Optional[np.ndarray]:
+        """返回该人（导演或演员）参与的影片的有序行号，字典中没有时返回None"""
+        codes = self._person_codes(value)
+        if codes is None:
+            return None
+        return union_sorted([self.rows[self.indptr[code]:self.indptr[code + 1]] for code in codes])
+
+
+# 容错键的生成方式，写入快照元数据，与加载时不一致的快照视为过期
+FUZZY_KEY_SCHEME = 'pinyin' if lazy_pinyin is not None else 'text'
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+# 参与编辑距离校验的候选上限，保证单次查询在几毫秒内完成
+FUZZY_CANDIDATES = 64
+
+
+def fuzzy_key(text: Any) -> str:
+    """容错匹配键：中文转为不带声调的拼音，与英文一起大小写折叠并去掉空白和标点
+
+    同音字得到相同的键（语音识别最常见的错误），中文名和拼音/英文写法也能互相命中。
+    """
+    if not isinstance(text, str):
+        return ""
+    if lazy_pinyin is not None:
+        text = ''.join(lazy_pinyin(text))
+    return _NON_WORD.sub('', text.casefold())
+
+
+def max_distance(key: str) -> int:
+    """按键长允许的编辑距离，过短的键只接受同音命中"""
+    if len(key) < 4:
+        return 0
+    if len(key) <= 8:
+        return 1
+    if len(key) <= 16:
+        return 2
+    return 3
+
+
+def _trigrams(key: str) -> List[str]:
+    padded = f"^{key}$"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein距离，超过limit时提前返回limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    """片名/人名的容错索引，精确检索无结果时使用
+
+    每个名称转换为拼音键，键 -> 行号 采用CSR存储；键本身再建立字母三元组倒排，
+    查询先按拼音键精确查找（同音字），未命中时用三元组计数筛出少量候选，再用编辑距离校验。
+    """
+
+    def __init__(self, keys: List[str], indptr: np.ndarray, rows: np.ndarray,
+                 grams: Optional[Tuple[List[str], np.ndarray, np.ndarray]] = None):
+        self.keys = keys
+        self.indptr = indptr
+        self.rows = rows
+        self.key_ids = {key: i for i, key in enumerate(keys)}
+        self.key_lengths = np.fromiter((len(key) for key in keys), dtype=np.int32, count=len(keys))
+        if grams is None:
+            grams = self._build_grams(keys)
+        self.gram_keys, self.gram_indptr, self.gram_ids = grams
+        self.gram_lookup = {gram: i for i, gram in enumerate(self.gram_keys)}
+
+    @classmethod
+    def from_pairs(cls, names: pd.Series, rows: np.ndarray) -> "FuzzyIndex":
+        """从(名称, 行号)对构建索引，名称相同拼音的行合并到同一个键"""
+        # 拼音转换较慢，只对去重后的名称计算一次
+        codes, uniques = pd.factorize(names)
+        keys = np.array([fuzzy_key(name) for name in uniques], dtype=object)[codes]
+        pairs = pd.DataFrame({"key": keys, "row": np.asarray(rows, dtype=np.int64)})
+        pairs = pairs[pairs["key"] != ""].drop_duplicates().sort_values(["key", "row"])
+        codes, uniques = pd.factorize(pairs["key"])
+        indptr, key_rows = build_csr(codes, pairs["row"].to_numpy(), len(uniques))
+        return cls([str(k) for k in uniques], indptr, key_rows)
+
+    @classmethod
+    def from_series(cls, series: pd.Series, sep: Optional[str] = None) -> "FuzzyIndex":
+        """从DataFrame列构建索引，多值字段按分隔符切分"""
+        values = series.dropna().astype(str)
+        if sep:
+            values = values.str.split(sep, regex=False).explode().str.strip()
+        return cls.from_pairs(values, values.index.to_numpy(dtype=np.int64))
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Any]) -> "FuzzyIndex":
+        grams = (arrays["gram_keys"], arrays["gram_indptr"], arrays["gram_ids"])
+        return cls(arrays["keys"], arrays["indptr"], arrays["rows"], grams=grams)
+
+    def to_arrays(self) -> Dict[str, Any]:
+        return {
+            "keys": self.keys,
+            "indptr": self.indptr,
+            "rows": self.rows,
+            "gram_keys": self.gram_keys,
+            "gram_indptr": self.gram_indptr,
+            "gram_ids": self.gram_ids,
+        }
+
+    @staticmethod
+    def _build_grams(keys: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        gram_list = []
+        key_ids = []
+        for key_id, key in enumerate(keys):
+            grams = set(_trigrams(key))
+            gram_list.extend(grams)
+            key_ids.extend([key_id] * len(grams))
+        codes, uniques = pd.factorize(pd.Series(gram_list, dtype=object))
+        indptr, indices = build_csr(codes, np.asarray(key_ids, dtype=np.int32), len(uniques))
+        return [str(g) for g in uniques], indptr, indices
+
+    def key_rows(self, key_id: int) -> np.ndarray:
+        return self.rows[self.indptr[key_id]:self.indptr[key_id + 1]]
+
+    def match(self, value: Any) -> Tuple[List[str], np.ndarray]:
+        """返回(命中的键, 有序行号)：同音键优先，否则取编辑距离最小的键"""
+        key = fuzzy_key(value)
+        if not key:
+            return [], EMPTY_ROWS
+        key_id = self.key_ids.get(key)
+        if key_id is not None:
+            return [key], self.key_rows(key_id)
+
+        limit = max_distance(key)
+        if limit == 0 or not self.keys:
+            return [], EMPTY_ROWS
+        grams = set(_trigrams(key))
+        postings = [self.gram_ids[self.gram_indptr[g]:self.gram_indptr[g + 1]]
+                    for g in (self.gram_lookup.get(gram) for gram in grams) if g is not None]
+        if not postings:
+            return [], EMPTY_ROWS
+
+        # 每处编辑最多破坏3个三元组，共享三元组过少的键不可能在距离内
+        counts = np.bincount(np.concatenate(postings), minlength=len(self.keys))
+        needed = max(len(grams) - 3 * limit, 1)
+        candidates = np.flatnonzero((counts >= needed) & (np.abs(self.key_lengths - len(key)) <= limit))
+        if len(candidates) > FUZZY_CANDIDATES:
+            best = np.argpartition(-counts[candidates], FUZZY_CANDIDATES - 1)[:FUZZY_CANDIDATES]
+            candidates = candidates[best]
+
+        best_distance, best_ids = limit + 1, []
+        for candidate in candidates:
+            distance = edit_distance(key, self.keys[candidate], min(limit, best_distance))
+            if distance < best_distance:
+                best_distance, best_ids = distance, [candidate]
+            elif distance == best_distance and distance <= limit:
+                best_ids.append(candidate)
+        if not best_ids:
+            return [], EMPTY_ROWS
+        best_ids.sort()
+        return [self.keys[i] for i in best_ids], union_sorted([self.key_rows(i) for i in best_ids])
+
+    def lookup(self, value: Any) -> np.ndarray:
+        """容错匹配的有序行号，没有足够接近的名称时为空"""
+        return self.match(value)[1]
+
+
+class MovieIndex:
+    """豆瓣电影表的检索索引，在加载数据时构建一次
+
+    片名和人名走n-gram倒排（得到有序行号），类型/地区/语言/年份走位图分面（按位与），
+    最后用行号在位图上测试合并两类条件。人名能精确对应到PERSON_ID时优先走人物连接索引。
+    片名或人名没有精确结果时，可以改用拼音/编辑距离容错索引重新筛选（filter的fuzzy参数）。
+    """
+
+    # 倒排索引名 -> (列名, 分隔符)
+    FIELDS = {
+        'name': ('NAME', None),
+        'directors': ('DIRECTORS', '/'),
+        'actors': ('ACTORS', '/'),
+    }
+
+    # 查询键 -> (列名, 分隔符)
+    FACETS = {
+        'genre': ('GENRES', '/'),
+        'region': ('REGIONS', '/'),
+        'language': ('LANGUAGES', '/'),
+    }
+
+    # 容错索引：片名和人名
+    FUZZY = ('name', 'person')
+
+    def __init__(self, movies: pd.DataFrame, fields: Optional[Dict[str, FieldIndex]] = None,
+                 facets: Optional[Dict[str, FacetIndex]] = None, years: Optional[YearFacet] = None,
+                 persons: Optional[PersonIndex] = None, people: Optional[pd.DataFrame] = None,
+                 fuzzy: Optional[Dict[str, FuzzyIndex]] = None):
+        self.size = len(movies)
+        if fields is None:
+            fields = {
+                key: FieldIndex.from_series(movies[column], sep=sep)
+                for key, (column, sep) in self.FIELDS.items()
+            }
+        if facets is None:
+            facets = {
+                key: FacetIndex.from_series(movies[column], sep=sep)
+                for key, (column, sep) in self.FACETS.items()
+            }
+        if years is None:
+            years = YearFacet.from_series(movies['YEAR'])
+        if persons is None:
+            persons = PersonIndex.from_frames(movies, people)
+        if fuzzy is None:
+            # 片名容错覆盖NAME和ALIAS，人名容错覆盖人物索引中的全部姓名和别名
+            titles = [movies['NAME'].dropna().astype(str)]
+            if 'ALIAS' in movies.columns:
+                titles.append(movies['ALIAS'].dropna().astype(str).str.split('/', regex=False).explode().str.strip())
+            titles = pd.concat(titles)
+            fuzzy = {
+                'name': FuzzyIndex.from_pairs(titles, titles.index.to_numpy(dtype=np.int64)),
+                'person': FuzzyIndex.from_pairs(*persons.name_pairs()),
+            }
+        self.fields = fields
+        self.facets = facets
+        self.years = years
+        self.persons = persons
+        self.fuzzy = fuzzy
+
+    @staticmethod
+    def _scan(movies: pd.DataFrame, columns: List[str], value: Any, rows: np.ndarray) -> np.ndarray:
+        """在候选行上用str.contains扫描（任一列包含即命中）"""
+        mask = np.zeros(len(rows), dtype=bool)
+        for column in columns:
+            matched = movies[column].iloc[rows].astype(str).str.contains(value, case=False, na=False)
+            mask |= matched.to_numpy(dtype=bool)
+        return rows[mask]
+
+    def filter(self, query: Dict[str, Any], movies: pd.DataFrame, fuzzy: bool = False) -> np.ndarray:
+        """按查询条件筛选，返回有序行号，语义与逐列str.contains筛选一致
+
+        fuzzy=True时，片名和人名条件没有精确结果的改用容错索引匹配（同音字、近似字）。
+        """
+        postings = []   # 倒排命中的有序行号
+        bitmap = None   # 分面条件按位与的结果
+        fallbacks = []  # 索引无法精确回答的条件：(列名列表, 查询值)
+
+        def restrict(facet_bitmap):
+            nonlocal bitmap
+            bitmap = facet_bitmap if bitmap is None else bitmap & facet_bitmap
+
+        for key, value in query.items():
+            if value is None or value == "":
+                continue
+
+            if key == 'name':
+                hits = self.fields['name'].lookup(value)
+                if fuzzy and (hits is None or len(hits) == 0):
+                    postings.append(self.fuzzy['name'].lookup(value))
+                elif hits is None:
+                    fallbacks.append((['NAME'], value))
+                else:
+                    postings.append(hits)
+            elif key == 'director' or key == 'actor':
+                # 姓名或别名精确命中时按PERSON_ID取该人导演或参演的影片
+                hits = self.persons.lookup(value)
+                if hits is None:
+                    # 否则按子串匹配：导演字段包含该人 OR 演员字段包含该人
+                    directed = self.fields['directors'].lookup(value)
+                    acted = self.fields['actors'].lookup(value)
+                    if directed is not None and acted is not None:
+                        hits = union_sorted([directed, acted])
+                if fuzzy and (hits is None or len(hits) == 0):
+                    postings.append(self.fuzzy['person'].lookup(value))
+                elif hits is None:
+                    fallbacks.append((['DIRECTORS', 'ACTORS'], value))
+                else:
+                    postings.append(hits)
+            elif key in self.FACETS:
+                facet_bitmap = self.facets[key].match(value)
+                if facet_bitmap is None:
+                    fallbacks.append(([self.FACETS[key][0]], value))
+                else:
+                    restrict(facet_bitmap)
+            elif key == 'min_year':
+                try:
+                    restrict(self.years.range(min_year=int(value)))
+                except ValueError:
+                    print(f"无效的年份值: {value}")
+            elif key == 'max_year':
+                try:
+                    restrict(self.years.range(max_year=int(value)))
+                except ValueError:
+                    print(f"无效的年份值: {value}")
+
+        if postings:
+            rows = intersect_sorted(postings)
+            if bitmap is not None:
+                rows = rows[check_bits(bitmap, rows)]
+        elif bitmap is not None:
+            rows = bitmap_rows(bitmap, self.size)
+        else:
+            rows = np.arange(self.size, dtype=np.int32)
+
+        for columns, value in fallbacks:
+            rows = self._scan(movies, columns, value, rows)
+        return rows
+
+
+def sample_queries(movies: pd.DataFrame, count: int = 200, seed: int = 0) -> List[Dict[str, Any]]:
+    """从数据中抽样生成查询（完整值、子串、组合条件），用于核对索引与扫描结果"""
+    rng = random.Random(seed)
+
+    def pick(column: str, sep: Optional[str] = None) -> str:
+        values = movies[column].dropna().astype(str)
+        if values.empty:
+            return ""
+        value = values.iloc[rng.randrange(len(values))]
+        if sep:
+            value = rng.choice(value.split(sep))
+        # 一半概率取子串
+        if len(value) > 1 and rng.random() < 0.5:
+            start = rng.randrange(len(value) - 1)
+            value = value[start:rng.randrange(start + 1, len(value) + 1)]
+        return value
+
+    queries = []
+    for _ in range(count):
+        query = {}
+        if rng.random() < 0.4:
+            query['name'] = pick('NAME')
+        if rng.random() < 0.5:
+            person = pick(rng.choice(['DIRECTORS', 'ACTORS']), sep='/')
+            query['director'] = person
+            query['actor'] = person
+        if rng.random() < 0.4:
+            query['genre'] = pick('GENRES', sep='/')
+        if rng.random() < 0.3:
+            query['region'] = pick('REGIONS', sep='/')
+        if rng.random() < 0.2:
+            query['language'] = pick('LANGUAGES', sep='/')
+        if rng.random() < 0.3:
+            query['min_year'] = str(rng.randint(1930, 2020))
+        if rng.random() < 0.3:
+            query['max_year'] = str(rng.randint(1930, 2020))
+        queries.append(query)
+    return queries
@@ -1,136 +1,320 @@
 import json
 import asyncio
 import aiohttp
+import aiohttp.web
 import argparse
 import time
 import pandas as pd
 import re
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, Any, List, Optional, Callable
-from utils import get_logger, generate_request_id, validate_mcp_request, format_message_for_logging
+from utils import get_logger, generate_request_id, validate_mcp_request, format_message_for_logging, ConnectionPool, encode_frame, read_frame
+from utils import DEADLINE_HEADER, DeadlineExceeded, parse_budget, deadline_after, time_left, earliest
+from search_index import sample_queries
+from snapshot import is_fresh, compile_snapshot, dataset_version, DEFAULT_CSV, DEFAULT_SNAPSHOT
+from catalog import MovieCatalog, HotRanking, DEFAULT_HOT_PATH
+from sharding import parse_shard, shard_snapshot_dir
+from cache import ResultCache, canonicalize, make_cache_key
+from admission import ToolGate, Overloaded
+import wire
+import worker
 
 logger = get_logger("mcp.server")
 
 class MCPServer:
     """MCP服务器实现，负责执行具体工具"""
     
-    def __init__(self, host: str = "localhost", port: int = 8081, client_url: str = None):
+    def __init__(self, host: str = "localhost", port: int = 8081, client_url: str = None,
+                 movies_csv: str = DEFAULT_CSV, snapshot_dir: str = DEFAULT_SNAPSHOT,
+                 workers: int = 0, queue_limit: int = 64, tool_concurrency: int = 0, max_queue_time: float = 2.0,
+                 hot_path: str = DEFAULT_HOT_PATH,
+                 cache_entries: int = 1024, cache_bytes: int = 64 * 1024 * 1024, cache_ttl: float = 300,
+                 heartbeat_interval: float = 0.5, uds_path: Optional[str] = None, shard: Optional[str] = None):
         self.host = host
         self.port = port
+        self.server_id = f"{host}:{port}"
         self.client_url = client_url
+        self.movies_csv = movies_csv
+        # 分片模式下只加载按MOVIE_ID一致性哈希属于本分片（"i/n"）的影片，快照按分片单独编译
+        self.shard = parse_shard(shard)
+        self.snapshot_dir = shard_snapshot_dir(snapshot_dir, self.shard)
         self.tools = {}
+        self.tool_options = {}
         self.running = False
         self.app = None
         self.runner = None
         self.site = None
         
+        # 工具进程池配置：workers为0时所有工具在事件循环内执行
+        self.workers = workers
+        self.pool = None
+        
+        # 准入控制：CPU密集型工具默认最多同时执行与工具进程数相同（无进程池时为1）的调用，
+        # 其余排队，排队数超过queue_limit或排队超过max_queue_time秒的请求快速返回503
+        self.queue_limit = queue_limit  # 每个工具默认的排队上限
+        self.tool_concurrency = tool_concurrency or max(workers, 1)
+        self.max_queue_time = max_queue_time
+        self.gates: Dict[str, ToolGate] = {}
+        self.inflight = 0  # 正在执行的工具调用数（不含缓存命中）
+        
+        # 向Client推送心跳及负载指标，间隔为0时不推送，仅依赖Client的健康检查
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_task = None
+        self.client_pool = ConnectionPool(limit=4, limit_per_host=4)
+        
+        # 同机部署时额外监听Unix域套接字，调用方以长度前缀帧直连，跳过HTTP和SSE编解码
+        self.uds_path = uds_path
+        self.uds_server = None
+        
+        # 热门排行启动时预先计算，数据文件变化由后台任务检测后重新加载
+        self.dataset_check_interval = 5  # 数据文件检查间隔（秒）
+        self.dataset_watch_task = None
+        
+        # 工具结果缓存，数据集变化时按工具失效
+        self.cache = ResultCache(max_entries=cache_entries, max_bytes=cache_bytes, default_ttl=cache_ttl)
+        
         # 注册内置工具
-        self.register_tool("hot_medias", self.hot_medias)
-        self.register_tool("search_medias", self.search_medias)
+        self.register_tool("hot_medias", self.hot_medias, cache_ttl=60)
+        self.register_tool("search_medias", self.search_medias, cpu_bound=True, cache_ttl=600)
         
-        self.movies = self._preprocess_movies()
+        self.catalog = self._preprocess_movies()
+        self.hot_ranking = HotRanking(hot_path)
 
-    def _preprocess_movies(self):
-        df = pd.read_csv('douban/movies.csv')
-        # 预处理年份（只执行一次）
-        if 'YEAR' in df.columns:
-            df['YEAR'] = df['YEAR'].astype(str).str.extract(r'(\d+)').astype(float)
-        return df
-    
-    def register_tool(self, name: str, func: Callable):
-        """注册工具函数"""
+    def _preprocess_movies(self) -> MovieCatalog:
+        # 进程池模式下工具进程通过mmap共享快照，先确保快照是最新的
+        if self.workers > 0 and not is_fresh(self.snapshot_dir, self.movies_csv, self.shard):
+            compile_snapshot(self.movies_csv, self.snapshot_dir, self.shard)
+        # 优先加载预编译快照（已预处理年份并含检索索引），过期时回退到CSV
+        return MovieCatalog.load(self.movies_csv, self.snapshot_dir, self.shard)
+    
+    def register_tool(self, name: str, func: Callable, cpu_bound: bool = False, max_queue: Optional[int] = None,
+                      max_concurrency: Optional[int] = None, cache_ttl: Optional[float] = None):
+        """注册工具函数
+
+        cpu_bound为True的工具在启用进程池时交给工具进程执行，由MovieCatalog的同名方法实现；
+        max_concurrency为同时执行的调用上限，CPU密集型工具默认tool_concurrency，其他工具默认不限制；
+        max_queue为等待执行的调用上限，默认使用queue_limit；
+        cache_ttl为结果缓存有效期（秒），None使用缓存默认值，0表示不缓存。
+        """
         self.tools[name] = func
+        self.tool_options[name] = {"cpu_bound": cpu_bound, "max_queue": max_queue}
+        if max_concurrency is None and cpu_bound:
+            max_concurrency = self.tool_concurrency
+        self.gates[name] = ToolGate(name, max_concurrency=max_concurrency, max_queue=max_queue or self.queue_limit,
+                                    max_queue_time=self.max_queue_time)
+        self.cache.set_ttl(name, cache_ttl)
         logger.info(f"Tool registered: {name}")
     
-    async def hot_medias(self, query: str) -> List[Dict[str, Any]]:
-        excel_file = pd.ExcelFile('movie.xlsx')
-        # 获取指定工作表中的数据
-        df = excel_file.parse('Sheet1')
-
-        # 将票房列转换为数值类型
-        df['票房数值'] = df['票房'].str.extract(r'(\d+\.?\d*)').astype(float)
-
-        # 按照票房数值降序排序
-        sorted_df = df.sort_values(by='票房数值', ascending=False)
-
-        # 获取前 top_n 个影片
-        top_n = 10
-        top_movies = sorted_df.head(top_n)
-
-        result = []
-        for index, row in top_movies.iterrows():
-            movie_info = {
-                "id": index + 1,
-                "title": row['title'],
-                "票房": row['票房']
-            }
-            result.append(movie_info)
-
-        return result
+    async def hot_medias(self, query: str, top_n: int = 10) -> List[Dict[str, Any]]:
+        # 只读取预先排好序的缓存
+        return self.hot_ranking.top(top_n)
     
-    async def search_medias(self, query: dict):
-        try:
-             # 筛选逻辑
-            results = self.movies.copy()
-            
-            # 遍历query中的所有键值对，动态应用筛选条件
-            for key, value in query.items():
-                # 确保值不为空
-                if value is None or value == "":
-                    continue
-                    
-                # 根据不同的键应用不同的筛选逻辑
-                if key == 'name':
-                    results = results[results['NAME'].astype(str).str.contains(value, case=False, na=False)]
-                elif key == 'director' or key == 'actor':
-                    # 导演字段包含该人 OR 演员字段包含该人
-                    is_director = results['DIRECTORS'].astype(str).str.contains(value, case=False, na=False)
-                    is_actor = results['ACTORS'].astype(str).str.contains(value, case=False, na=False)
-                    results = results[is_director | is_actor]  # 取两者的并集
-                elif key == 'genre':
-                    results = results[results['GENRES'].astype(str).str.contains(value, case=False, na=False)]
-                elif key == 'min_year':
-                    try:
-                        min_year = int(value)
-                        results = results[results['YEAR'] >= min_year]
-                    except ValueError:
-                        print(f"无效的年份值: {value}")
-                elif key == 'max_year':
-                    try:
-                        max_year = int(value)
-                        results = results[results['YEAR'] <= max_year]
-                    except ValueError:
-                        print(f"无效的年份值: {value}")
-                # 可以在这里添加更多字段的筛选逻辑
-                # elif key == '其他字段':
-                #     对应的筛选逻辑
-            
-            # 转换为字典列表并返回, 返回前100个
-            results = results.sort_values('YEAR', ascending=False)
-            name_list = results['NAME'].tolist()[:100]
-            print(name_list)
-            return name_list
-            
-        except Exception as e:
-            print(f"操作出错: {e}")
-            return []
+    async def search_medias(self, query: dict, limit: int = 100, offset: int = 0,
+                            sort_by: str = 'YEAR', weights: Optional[Dict[str, float]] = None, ranked: bool = False):
+        # 未启用进程池时在线程中检索，事件循环仍能及时响应/health和心跳
+        return await asyncio.to_thread(self.catalog.search_medias, query, limit=limit, offset=offset,
+                                       sort_by=sort_by, weights=weights, ranked=ranked)
+    
+    async def start_pool(self):
+        """启动工具进程池并预热，每个工具进程加载一次数据集"""
+        if self.workers <= 0:
+            return
+        # spawn而非fork，避免复制已运行的事件循环和线程状态
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=worker.init_worker,
+            initargs=(self.movies_csv, self.snapshot_dir, self.shard)
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.pool, worker.ping) for _ in range(self.workers)])
+        logger.info(f"Tool process pool started: {self.workers} workers")
     
-    async def execute_tool(self, tool_name: str, parameters: Dict[str, Any]) -> Any:
-        """执行工具并返回结果"""
+    async def run_in_pool(self, tool_name: str, parameters: Dict[str, Any], deadline: Optional[float] = None) -> Any:
+        """在进程池中执行工具，同时提交的任务数由准入控制限制；取消时尚未开始的任务不再执行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, worker.run_tool, tool_name, parameters, deadline)
+    
+    async def execute_tool(self, tool_name: str, parameters: Dict[str, Any], deadline: Optional[float] = None) -> Any:
+        """执行工具并返回结果
+
+        未命中缓存且工具过载时抛出Overloaded；截止时间（time.time()）已过时抛出DeadlineExceeded。
+        超时时排队中的调用直接放弃，协程工具随之取消；CPU密集型工具在线程或工具进程中执行，无法中途停止，
+        会继续执行到结束（结果照常写入缓存），期间一直占用执行名额，准入控制仍能限制实际的CPU占用。
+        """
         if tool_name not in self.tools:
             raise ValueError(f"Tool not found: {tool_name}")
         
         logger.info(f"Executing tool: {tool_name}, parameters: {format_message_for_logging(parameters)}")
         
-        # 执行工具
+        # 按规范化后的参数执行，保证缓存键相同的调用得到相同的结果；命中缓存直接返回
+        parameters = canonicalize(parameters)
+        cache_key = make_cache_key(tool_name, parameters)
+        hit, cached = self.cache.get(cache_key)
+        if hit:
+            return {"success": True, "result": cached}
+        
+        timeout = time_left(deadline)
+        if timeout is None:
+            return await self._run_tool(tool_name, parameters, cache_key)
+        if timeout <= 0:
+            raise DeadlineExceeded(f"Deadline exceeded before executing {tool_name}")
+        try:
+            return await asyncio.wait_for(self._run_tool(tool_name, parameters, cache_key, deadline), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Deadline exceeded while executing {tool_name}")
+    
+    async def _run_tool(self, tool_name: str, parameters: Dict[str, Any], cache_key: str,
+                        deadline: Optional[float] = None) -> Any:
+        gate = self.gates[tool_name]
+        await gate.acquire()
+        start = time.perf_counter()
+        self.inflight += 1
+        # 执行工具，CPU密集型工具在启用进程池时交给工具进程，否则在线程中执行
+        cpu_bound = self.tool_options[tool_name]["cpu_bound"]
         try:
-            result = await self.tools[tool_name](**parameters)
+            if self.pool and cpu_bound:
+                work = asyncio.ensure_future(self.run_in_pool(tool_name, parameters, deadline))
+            else:
+                work = asyncio.ensure_future(self.tools[tool_name](**parameters))
+        except Exception as e:
+            # 参数不匹配等同步抛出的错误：工具没有开始执行，立即归还名额
+            self.inflight -= 1
+            gate.release()
+            return {"success": False, "error": str(e)}
+
+        def finished(work: asyncio.Future):
+            # 工具真正结束时才释放名额，调用方已超时放弃的结果也写入缓存
+            self.inflight -= 1
+            gate.observe(time.perf_counter() - start)
+            gate.release()
+            if not work.cancelled() and work.exception() is None:
+                self.cache.put(cache_key, tool_name, work.result())
+
+        work.add_done_callback(finished)
+        try:
+            # CPU密集型工具的线程/进程无法取消，调用方被取消时只放弃等待（shield），不提前释放名额
+            result = await (asyncio.shield(work) if cpu_bound else work)
             return {"success": True, "result": result}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def load_metrics(self) -> Dict[str, Any]:
+        """当前负载：在途调用数、排队深度、累计拒绝数，以及是否有工具排队已满（saturated）"""
+        return {
+            "inflight": self.inflight,
+            "queue_depth": sum(len(gate.waiters) for gate in self.gates.values()),
+            "saturated": any(gate.saturated for gate in self.gates.values()),
+            "shed": sum(gate.shed_queue_full + gate.shed_timeout for gate in self.gates.values()),
+            "pending": {name: gate.depth for name, gate in self.gates.items()}
+        }
+    
+    async def reload_catalog_if_changed(self) -> bool:
+        """快照或CSV版本变化时在线程中重新加载数据集，并重建工具进程池"""
+        version = await asyncio.to_thread(dataset_version, self.movies_csv, self.snapshot_dir, self.shard)
+        if version == self.catalog.version:
+            return False
+        self.catalog = await asyncio.to_thread(self._preprocess_movies)
+        if self.pool:
+            old_pool = self.pool
+            await self.start_pool()
+            old_pool.shutdown(wait=False)
+        self.cache.invalidate("search_medias")
+        logger.info(f"Movie catalog reloaded: {self.catalog.version}")
+        return True
+    
+    async def reload_hot_ranking(self, force: bool = False) -> bool:
+        """热门排行文件变化（或force）时在线程中重新加载"""
+        if force:
+            await asyncio.to_thread(self.hot_ranking.reload)
+        elif not await asyncio.to_thread(self.hot_ranking.reload_if_changed):
+            return False
+        self.cache.invalidate("hot_medias")
+        logger.info(f"Hot ranking reloaded: {self.hot_ranking.path}")
+        return True
+    
+    async def watch_datasets(self):
+        """定期检查数据文件的版本，变化时重新加载并使相关缓存失效"""
+        try:
+            while self.running:
+                await asyncio.sleep(self.dataset_check_interval)
+                try:
+                    await self.reload_hot_ranking()
+                    await self.reload_catalog_if_changed()
+                except Exception as e:
+                    logger.error(f"Error reloading datasets: {str(e)}")
+        except asyncio.CancelledError:
+            pass
+    
+    async def reload_handler(self, request):
+        """强制重新加载热门排行，数据集快照有变化时一并重新加载"""
+        try:
+            await self.reload_hot_ranking(force=True)
+            catalog_reloaded = await self.reload_catalog_if_changed()
+            return aiohttp.web.json_response({
+                "status": "success",
+                "count": len(self.hot_ranking.ranking),
+                "catalog_reloaded": catalog_reloaded,
+                "catalog_version": self.catalog.version
+            })
+        except Exception as e:
+            logger.error(f"Error reloading datasets: {str(e)}")
+            return aiohttp.web.json_response({"status": "error", "message": str(e)}, status=500)
+    
+    async def stats_handler(self, request):
+        """运行统计端点"""
+        return aiohttp.web.json_response({
+            "cache": self.cache.stats(),
+            "load": self.load_metrics(),
+            "admission": {name: gate.stats() for name, gate in self.gates.items()},
+            "shard": str(self.shard) if self.shard else None,
+            "rows": len(self.catalog.movies),
+            "catalog_version": self.catalog.version
+        })
+    
     async def health_check(self, request):
         """健康检查端点"""
-        return aiohttp.web.json_response({"status": "ok"})
+        load = self.load_metrics()
+        return aiohttp.web.json_response({"status": "ok", "pending": load["pending"], "load": load})
+    
+    @staticmethod
+    def _parse_parameters(parameters: Any) -> Optional[Dict[str, Any]]:
+        """强制parameters为字典类型，JSON字符串会被解析，无法解析时返回None"""
+        if isinstance(parameters, dict):
+            return parameters
+        try:
+            parameters = json.loads(parameters)
+        except (json.JSONDecodeError, TypeError):
+            logger.error(f"Invalid parameters type: {type(parameters)}")
+            return None
+        return parameters if isinstance(parameters, dict) else None
+    
+    @staticmethod
+    def _tool_response(tool_name: str, parameters: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """构建大模型友好的响应格式"""
+        return {
+            "tool_name": tool_name,
+            "parameters": parameters,
+            "result": result.get("result", None),
+            "success": result.get("success", False),
+            "error": result.get("error", None)
+        }
+    
+    @staticmethod
+    async def _prepare_sse(request) -> aiohttp.web.StreamResponse:
+        response = aiohttp.web.StreamResponse(
+            status=200,
+            reason='OK',
+            headers={
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'Connection': 'keep-alive'
+            }
+        )
+        await response.prepare(request)
+        return response
     
     async def execute_handler(self, request):
         """处理工具执行请求"""
@@ -147,43 +331,36 @@ class MCPServer:
                 )
             
             tool_name = data.get("tool_name")
-            parameters = data.get("parameters", {})
-            # 关键：强制parameters为字典类型
-            if not isinstance(parameters, dict):
-                try:
-                    parameters = json.loads(parameters)
-                except (json.JSONDecodeError, TypeError):
-                    logger.error(f"Invalid parameters type: {type(parameters)}")
-                    return aiohttp.web.json_response(
-                        {"status": "error", "message": "parameters must be a JSON object"},
-                        status=400
-                    )
+            parameters = self._parse_parameters(data.get("parameters", {}))
+            if parameters is None:
+                return aiohttp.web.json_response(
+                    {"status": "error", "message": "parameters must be a JSON object"},
+                    status=400
+                )
             print(tool_name, parameters)
             
-            # 执行工具
-            result = await self.execute_tool(tool_name, parameters)
+            # 执行工具，过载时快速返回503，由调用方稍后重试或换一个副本；超过调用方的时间预算返回504
+            deadline = deadline_after(parse_budget(request.headers.get(DEADLINE_HEADER)))
+            try:
+                result = await self.execute_tool(tool_name, parameters, deadline)
+            except Overloaded as e:
+                logger.warning(str(e))
+                return aiohttp.web.json_response(
+                    {"status": "error", "message": str(e), "retry_after": e.retry_after},
+                    status=503,
+                    headers={"Retry-After": str(e.retry_after)}
+                )
+            except DeadlineExceeded as e:
+                logger.warning(str(e))
+                return aiohttp.web.json_response({"status": "error", "message": str(e)}, status=504)
             
             # 构建大模型友好的响应格式
-            response_data = {
-                "tool_name": tool_name,
-                "parameters": parameters,
-                "result": result.get("result", None),
-                "success": result.get("success", False),
-                "error": result.get("error", None)
-            }
+            response_data = self._tool_response(tool_name, parameters, result)
             
-            # 使用SSE格式返回结果
-            response = aiohttp.web.StreamResponse(
-                status=200,
-                reason='OK',
-                headers={
-                    'Content-Type': 'text/event-stream',
-                    'Cache-Control': 'no-cache',
-                    'Connection': 'keep-alive'
-                }
-            )
-            
-            await response.prepare(request)
+            # 调用方接受msgpack时返回单个二进制帧，否则使用SSE格式
+            if wire.negotiate(request.headers.get('Accept', '')) == wire.MSGPACK:
+                return aiohttp.web.Response(body=wire.encode(response_data, wire.MSGPACK), content_type=wire.MSGPACK)
+            response = await self._prepare_sse(request)
             
             # 发送结果
             await response.write(f"data: {json.dumps(response_data)}\n\n".encode())
@@ -199,31 +376,183 @@ class MCPServer:
                 status=500
             )
     
-    async def register_with_client(self):
-        """向MCP Client注册此服务器"""
+    async def execute_request(self, request_id: str, item: Any, deadline: Optional[float] = None) -> Dict[str, Any]:
+        """执行一项工具请求（批量请求中的一项、Unix域套接字帧或进程内调用），返回带request_id的响应，错误不影响其他项
+
+        截止时间取deadline与该项"timeout"字段（剩余秒数）中较早的一个。
+        """
+        if not isinstance(item, dict):
+            return {"request_id": request_id, "success": False, "error": "request must be a JSON object"}
+        validation = validate_mcp_request(item)
+        if not validation["valid"]:
+            return {"request_id": request_id, "tool_name": item.get("tool_name"),
+                    "success": False, "error": validation["error"]}
+        tool_name = item.get("tool_name")
+        parameters = self._parse_parameters(item.get("parameters", {}))
+        if parameters is None:
+            return {"request_id": request_id, "tool_name": tool_name,
+                    "success": False, "error": "parameters must be a JSON object"}
+        deadline = earliest(deadline, deadline_after(parse_budget(item.get("timeout"))))
+        try:
+            result = await self.execute_tool(tool_name, parameters, deadline)
+        except Overloaded as e:
+            logger.warning(str(e))
+            return {"request_id": request_id, **self._tool_response(tool_name, parameters, {"error": str(e)}),
+                    "retry_after": e.retry_after}
+        except DeadlineExceeded as e:
+            logger.warning(str(e))
+            result = {"success": False, "error": str(e)}
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        return {"request_id": request_id, **self._tool_response(tool_name, parameters, result)}
+    
+    async def execute_batch_handler(self, request):
+        """批量执行工具：各请求并发执行，按完成顺序逐条以SSE返回，每条带request_id"""
+        try:
+            data = await request.json()
+            logger.info(f"Received execute_batch request: {format_message_for_logging(data if isinstance(data, dict) else {'requests': data})}")
+            
+            items = data.get("requests") if isinstance(data, dict) else data
+            if not isinstance(items, list):
+                return aiohttp.web.json_response(
+                    {"status": "error", "message": "requests must be a JSON array"},
+                    status=400
+                )
+            
+            # 未提供request_id的请求按位置生成，保证结果可以对应回请求
+            request_ids = [
+                str(item.get("request_id") or generate_request_id({"index": i, **item}))
+                if isinstance(item, dict) else generate_request_id({"index": i})
+                for i, item in enumerate(items)
+            ]
+            deadline = deadline_after(parse_budget(request.headers.get(DEADLINE_HEADER)))
+            tasks = [
+                asyncio.create_task(self.execute_request(request_id, item, deadline))
+                for request_id, item in zip(request_ids, items)
+            ]
+            
+            # msgpack格式逐项写出长度前缀帧，以响应结束表示完成，不发送done帧
+            wire_format = wire.negotiate(request.headers.get('Accept', ''))
+            if wire_format == wire.MSGPACK:
+                response = aiohttp.web.StreamResponse(headers={'Content-Type': wire.MSGPACK})
+                await response.prepare(request)
+            else:
+                response = await self._prepare_sse(request)
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    response_data = await next_done
+                    await response.write(wire.encode(response_data, wire_format))
+            finally:
+                # 客户端断开时取消尚未完成的请求
+                for task in tasks:
+                    task.cancel()
+            if wire_format == wire.SSE:
+                await response.write("data: {\"type\": \"done\"}\n\n".encode())
+            
+            await response.write_eof()
+            return response
+            
+        except Exception as e:
+            logger.error(f"Error handling execute_batch request: {str(e)}")
+            return aiohttp.web.json_response(
+                {"status": "error", "message": str(e)},
+                status=500
+            )
+    
+    async def handle_uds_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个Unix域套接字连接：每帧一个工具请求，并发执行，响应帧按完成顺序写回，以request_id对应"""
+        write_lock = asyncio.Lock()
+        tasks = set()
+        
+        async def serve(request_id: str, item: Any):
+            response_data = await self.execute_request(request_id, item)
+            async with write_lock:
+                writer.write(encode_frame(response_data))
+                await writer.drain()
+        
+        try:
+            while True:
+                item = await read_frame(reader)
+                if item is None:
+                    break
+                request_id = str(item.get("request_id") or "") if isinstance(item, dict) else ""
+                task = asyncio.create_task(serve(request_id, item))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (ValueError, ConnectionError) as e:
+            logger.error(f"Error handling UDS connection: {str(e)}")
+        finally:
+            # 连接已关闭，尚未完成的请求无法再返回结果，取消以释放执行名额
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+    
+    async def start_uds(self):
+        if os.path.exists(self.uds_path):
+            os.unlink(self.uds_path)  # 清理上次异常退出留下的套接字文件
+        self.uds_server = await asyncio.start_unix_server(self.handle_uds_connection, path=self.uds_path)
+        logger.info(f"MCP Server listening on unix:{self.uds_path}")
+    
+    async def register_with_client(self) -> bool:
+        """向MCP Client注册此服务器，返回是否注册成功"""
         if not self.client_url:
             logger.warning("No client URL provided, skipping registration")
-            return
+            return False
         
         try:
             tool_info = [{"name": name, "parameters": {} } for name in self.tools.keys()]
             server_info = {
-                "id": f"{self.host}:{self.port}",
+                "id": self.server_id,
                 "host": self.host,
                 "port": self.port,
                 "tools": tool_info,
                 "status": "online",
-                "last_heartbeat": time.time()
+                "last_heartbeat": time.time(),
+                "heartbeat_interval": self.heartbeat_interval or None,
+                "load": self.load_metrics(),
+                "shard": str(self.shard) if self.shard else None
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(f"{self.client_url}/register", json=server_info) as response:
-                    if response.status == 200:
-                        logger.info("Successfully registered with MCP Client")
-                    else:
-                        logger.error(f"Failed to register with MCP Client: {response.status}")
+            async with self.client_pool.open().post(f"{self.client_url}/register", json=server_info) as response:
+                await response.read()
+                if response.status == 200:
+                    logger.info("Successfully registered with MCP Client")
+                    return True
+                logger.error(f"Failed to register with MCP Client: {response.status}")
         except Exception as e:
             logger.error(f"Error registering with MCP Client: {str(e)}")
+        return False
+    
+    async def send_heartbeats(self):
+        """定期向Client推送心跳和负载指标；Client不认识此服务器（如Client重启）时重新注册"""
+        timeout = aiohttp.ClientTimeout(total=max(self.heartbeat_interval, 1.0))
+        failing = False
+        try:
+            while self.running:
+                await asyncio.sleep(self.heartbeat_interval)
+                try:
+                    heartbeat = {"id": self.server_id, "load": self.load_metrics()}
+                    async with self.client_pool.open().post(f"{self.client_url}/heartbeat", json=heartbeat,
+                                                            timeout=timeout) as response:
+                        await response.read()
+                        status = response.status
+                    if status == 404:
+                        logger.info("MCP Client does not know this server, registering again")
+                        await self.register_with_client()
+                    elif status != 200:
+                        raise RuntimeError(f"status {status}")
+                    if failing:
+                        logger.info("Heartbeat to MCP Client restored")
+                    failing = False
+                except (asyncio.TimeoutError, aiohttp.ClientError, RuntimeError) as e:
+                    # 只在首次失败时告警，避免Client不可用期间刷屏
+                    if not failing:
+                        logger.warning(f"Heartbeat to MCP Client failed: {str(e) or type(e).__name__}")
+                    failing = True
+        except asyncio.CancelledError:
+            pass
     
     async def setup(self):
         """设置服务器"""
@@ -233,13 +562,27 @@ class MCPServer:
         self.app = aiohttp.web.Application()
         self.app.router.add_get('/health', self.health_check)
         self.app.router.add_post('/execute', self.execute_handler)
+        self.app.router.add_post('/execute_batch', self.execute_batch_handler)
+        self.app.router.add_post('/reload', self.reload_handler)
+        self.app.router.add_get('/stats', self.stats_handler)
+    
+    async def start_in_process(self):
+        """只启动工具执行所需的后台任务（进程池、数据文件检查），供调用方在自己的事件循环中直接调用execute_request"""
+        self.running = True
+        await self.start_pool()
+        self.dataset_watch_task = asyncio.create_task(self.watch_datasets())
     
     async def start(self):
         """启动MCP服务器"""
         await self.setup()
+        await self.start_pool()
+        self.dataset_watch_task = asyncio.create_task(self.watch_datasets())
+        if self.uds_path:
+            await self.start_uds()
         
         # 启动服务器
-        self.runner = aiohttp.web.AppRunner(self.app)
+        # 调用方断开（如TV端放弃、上游超时）时取消处理中的请求，排队和执行中的工具调用随之取消
+        self.runner = aiohttp.web.AppRunner(self.app, handler_cancellation=True)
         await self.runner.setup()
         self.site = aiohttp.web.TCPSite(runner=self.runner, host=self.host, port=self.port)
         await self.site.start()
@@ -248,12 +591,28 @@ class MCPServer:
         
         # 向Client注册
         await self.register_with_client()
+        if self.client_url and self.heartbeat_interval:
+            self.heartbeat_task = asyncio.create_task(self.send_heartbeats())
     
     async def stop(self):
         """停止MCP服务器"""
         self.running = False
+        if self.dataset_watch_task:
+            self.dataset_watch_task.cancel()
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        await self.client_pool.close()
+        if self.uds_server:
+            self.uds_server.close()
+            await self.uds_server.wait_closed()
+            self.uds_server = None
+            if os.path.exists(self.uds_path):
+                os.unlink(self.uds_path)
         if self.runner:
             await self.runner.cleanup()
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
         logger.info("MCP Server stopped")
 
 async def main():
@@ -261,15 +620,49 @@ async def main():
     parser.add_argument('--host', type=str, default='localhost', help='Server host')
     parser.add_argument('--port', type=int, default=8081, help='Server port')
     parser.add_argument('--client-url', type=str, help='MCP Client URL')
+    parser.add_argument('--movies-csv', type=str, default=DEFAULT_CSV, help='Path to douban movies.csv')
+    parser.add_argument('--snapshot', type=str, default=DEFAULT_SNAPSHOT, help='Path to compiled movies snapshot')
+    parser.add_argument('--hot-path', type=str, default=DEFAULT_HOT_PATH, help='Path to hot medias spreadsheet')
+    parser.add_argument('--cache-entries', type=int, default=1024, help='Max cached tool results')
+    parser.add_argument('--cache-bytes', type=int, default=64 * 1024 * 1024, help='Max cached tool result bytes')
+    parser.add_argument('--cache-ttl', type=float, default=300, help='Default cache TTL in seconds')
+    parser.add_argument('--workers', type=int, default=0, help='Tool process pool size (0 runs tools on the event loop)')
+    parser.add_argument('--queue-limit', type=int, default=64, help='Max queued calls per tool before shedding with 503')
+    parser.add_argument('--tool-concurrency', type=int, default=0, help='Max concurrent calls per CPU-bound tool (0 uses the worker count, or 1 without a pool)')
+    parser.add_argument('--max-queue-time', type=float, default=2.0, help='Seconds a call may wait for a slot before shedding with 503')
+    parser.add_argument('--heartbeat-interval', type=float, default=0.5, help='Seconds between heartbeats to the client (0 disables)')
+    parser.add_argument('--shard', type=str, help='Serve only shard i/n of the movie dataset (consistent hashing on MOVIE_ID)')
+    parser.add_argument('--uds', type=str, help='Also serve tool calls on this Unix domain socket path')
+    parser.add_argument('--verify-index', type=int, metavar='N', help='Compare index and scan results on N sampled queries, then exit')
     
     args = parser.parse_args()
     
     server = MCPServer(
         host=args.host,
         port=args.port,
-        client_url=args.client_url
+        client_url=args.client_url,
+        movies_csv=args.movies_csv,
+        snapshot_dir=args.snapshot,
+        workers=args.workers,
+        queue_limit=args.queue_limit,
+        tool_concurrency=args.tool_concurrency,
+        max_queue_time=args.max_queue_time,
+        hot_path=args.hot_path,
+        cache_entries=args.cache_entries,
+        cache_bytes=args.cache_bytes,
+        cache_ttl=args.cache_ttl,
+        heartbeat_interval=args.heartbeat_interval,
+        uds_path=args.uds,
+        shard=args.shard
     )
     
+    if args.verify_index:
+        mismatches = server.catalog.verify_search_index(sample_queries(server.catalog.movies, count=args.verify_index))
+        for mismatch in mismatches:
+            logger.error(f"Index mismatch: {json.dumps(mismatch, ensure_ascii=False)}")
+        logger.info(f"Index verification finished: {args.verify_index} queries, {len(mismatches)} mismatches")
+        return
+    
     await server.start()
     
     # 保持运行
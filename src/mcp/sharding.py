@@ -0,0 +1,97 @@
+import math
+import heapq
+import hashlib
+import itertools
+from typing import Any, Dict, List, NamedTuple, Optional
+import numpy as np
+import pandas as pd
+
+# 分片模式下按分片拆分执行、由MCPClient合并结果的工具
+SHARDED_TOOLS = ('search_medias',)
+
+# 每个分片在哈希环上的虚拟节点数，越多各分片的数据量越均匀
+VIRTUAL_NODES = 64
+
+
+class Shard(NamedTuple):
+    index: int
+    count: int
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def parse_shard(spec: Any) -> Optional[Shard]:
+    """解析"i/n"格式的分片编号（0 <= i < n），空值表示不分片"""
+    if not spec:
+        return None
+    try:
+        index, count = (int(part) for part in str(spec).split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard: {spec} (expected i/n)")
+    if count <= 0 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard: {spec} (expected 0 <= i < n)")
+    return Shard(index, count)
+
+
+def shard_route(tool_name: str, index: int) -> str:
+    """分片工具在路由表中的名称，同一分片的副本之间按负载选择"""
+    return f"{tool_name}#{index}"
+
+
+def shard_snapshot_dir(snapshot_dir: str, shard: Optional[Shard]) -> str:
+    """每个分片单独编译快照"""
+    if shard is None:
+        return snapshot_dir
+    return f"{snapshot_dir}.shard{shard.index}-of-{shard.count}"
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """一致性哈希环：影片按MOVIE_ID落到顺时针方向最近的虚拟节点所属的分片
+
+    分片数从n变为n+1时只有约1/(n+1)的影片需要迁移，已有分片的数据基本不变。
+    """
+
+    def __init__(self, count: int, vnodes: int = VIRTUAL_NODES):
+        points = sorted((_hash(f"shard-{shard}#{vnode}"), shard) for shard in range(count) for vnode in range(vnodes))
+        self.hashes = np.array([point for point, _ in points], dtype=np.uint64)
+        self.shards = np.array([shard for _, shard in points], dtype=np.int32)
+
+    def shard_of(self, key: Any) -> int:
+        position = np.searchsorted(self.hashes, np.uint64(_hash(str(key))), side='right') % len(self.hashes)
+        return int(self.shards[position])
+
+    def assign(self, keys: pd.Series) -> np.ndarray:
+        """批量计算每个键所属的分片"""
+        hashes = np.fromiter((_hash(str(key)) for key in keys), dtype=np.uint64, count=len(keys))
+        return self.shards[np.searchsorted(self.hashes, hashes, side='right') % len(self.hashes)]
+
+
+def select_shard(movies: pd.DataFrame, shard: Shard) -> pd.DataFrame:
+    """保留属于该分片的影片，POSITION列记录原始行号，供跨分片合并时按全量数据的顺序打破平局"""
+    mask = HashRing(shard.count).assign(movies['MOVIE_ID']) == shard.index
+    selected = movies.loc[mask].reset_index(drop=True)
+    selected['POSITION'] = np.flatnonzero(mask).astype(np.float64)
+    return selected
+
+
+def merge_ranked(shard_results: List[Dict[str, Any]], offset: int = 0, limit: int = 100) -> List[str]:
+    """合并各分片按排序分数降序的前k结果，返回第offset到offset+limit个片名
+
+    每项为[片名, 分数, 原始行号]，分数为None（缺失）时排在最后，分数相同按原始行号升序，与不分片时的顺序一致。
+    只有部分分片走了容错匹配时，说明其他分片有精确命中，丢弃容错结果。
+    """
+    exact = [result for result in shard_results if not result.get("fuzzy")]
+    if any(result.get("items") for result in exact):
+        shard_results = exact
+
+    def key(item):
+        _, score, position = item
+        return (math.inf if score is None else -score, position)
+
+    merged = heapq.merge(*[result.get("items") or [] for result in shard_results], key=key)
+    return [item[0] for item in itertools.islice(merged, offset, offset + limit)]
@@ -0,0 +1,371 @@
+import os
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional, Tuple
+from utils import get_logger
+from search_index import FieldIndex, FacetIndex, YearFacet, PersonIndex, FuzzyIndex, MovieIndex, FUZZY_KEY_SCHEME
+from ranking import Ranker
+from sharding import Shard, select_shard, parse_shard, shard_snapshot_dir
+
+logger = get_logger("mcp.snapshot")
+
+# 快照格式版本，列或索引结构变化时递增，旧快照自动视为过期
+SNAPSHOT_VERSION = 5
+
+# 检索需要的列及其类型，其余列不进入快照
+SNAPSHOT_COLUMNS = {
+    'NAME': 'str',
+    'DIRECTORS': 'str',
+    'ACTORS': 'str',
+    'GENRES': 'str',
+    'REGIONS': 'str',
+    'LANGUAGES': 'str',
+    'YEAR': 'float',
+    'DOUBAN_SCORE': 'float',
+    'DOUBAN_VOTES': 'float',
+    'DIRECTOR_IDS': 'str',
+    'ACTOR_IDS': 'str',
+}
+
+# 只用于构建索引、不进入快照的列
+INDEX_ONLY_COLUMNS = ['ALIAS']
+
+# 分片快照额外保存的列：影片在全量数据中的行号
+SHARD_COLUMNS = {'POSITION': 'float'}
+
+# person.csv中用于人名别名的列
+PERSON_COLUMNS = ['PERSON_ID', 'NAME', 'NAME_EN', 'NAME_ZH']
+
+DEFAULT_CSV = 'douban/movies.csv'
+DEFAULT_SNAPSHOT = 'douban/movies.snapshot'
+
+# 字符串缓冲区中每个条目末尾的分隔符，字符串本身不能包含该字符
+_STRING_SEP = '\0'
+
+
+def load_movies_csv(csv_path: str = DEFAULT_CSV, shard: Optional[Shard] = None) -> pd.DataFrame:
+    """读取CSV并预处理，只保留检索需要的列
+
+    指定分片时多读MOVIE_ID列，供select_shard按一致性哈希选出该分片的影片。
+    """
+    if shard is None:
+        df = pd.read_csv(csv_path, usecols=list(SNAPSHOT_COLUMNS) + INDEX_ONLY_COLUMNS)
+    else:
+        df = pd.read_csv(csv_path, usecols=['MOVIE_ID'] + list(SNAPSHOT_COLUMNS) + INDEX_ONLY_COLUMNS, dtype={'MOVIE_ID': str})
+    # 预处理年份（只执行一次）
+    df['YEAR'] = df['YEAR'].astype(str).str.extract(r'(\d+)').astype(float)
+    # 排序用的数值列
+    for column in ('DOUBAN_SCORE', 'DOUBAN_VOTES'):
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype(float)
+    return df
+
+
+def parse_movies(csv_path: str = DEFAULT_CSV, shard: Optional[Shard] = None) -> Tuple[pd.DataFrame, MovieIndex]:
+    """解析CSV并构建检索索引
+
+    指定分片时只保留属于该分片的影片，全量数据的排序归一化范围记在attrs['rank_bounds']，
+    人名字典按全量数据构建（见PersonIndex.from_frames的positions参数）。
+    """
+    people = load_people_csv(person_csv_path(csv_path))
+    movies = load_movies_csv(csv_path, shard)
+    if shard is None:
+        return movies, MovieIndex(movies, people=people)
+
+    selected = select_shard(movies, shard).drop(columns=['MOVIE_ID'])
+    selected.attrs['rank_bounds'] = Ranker.compute_bounds(movies)
+    persons = PersonIndex.from_frames(movies, people, positions=selected['POSITION'].to_numpy(dtype=np.int64))
+    return selected, MovieIndex(selected, persons=persons)
+
+
+def person_csv_path(csv_path: str = DEFAULT_CSV) -> str:
+    """person.csv与movies.csv随数据集一起发布，位于同一目录"""
+    return os.path.join(os.path.dirname(csv_path), 'person.csv')
+
+
+def load_people_csv(person_csv: str) -> Optional[pd.DataFrame]:
+    """读取person.csv的姓名和别名列，文件不存在时返回None（只用影片中的演职员名）"""
+    if not os.path.exists(person_csv):
+        return None
+    return pd.read_csv(person_csv, usecols=lambda c: c in PERSON_COLUMNS, dtype=str)
+
+
+def _write_strings(path: str, values: List[Any]) -> None:
+    """写入偏移编码的字符串列：utf-8缓冲区 + 字节偏移 + 缺失值掩码"""
+    nulls = np.array([not isinstance(v, str) for v in values], dtype=bool)
+    texts = ["" if null else v for v, null in zip(values, nulls)]
+    if any(_STRING_SEP in text for text in texts):
+        raise ValueError(f"String column contains NUL character: {path}")
+    encoded = [(text + _STRING_SEP).encode('utf-8') for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(f"{path}.buf.npy", np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    np.save(f"{path}.offsets.npy", offsets)
+    if nulls.any():
+        np.save(f"{path}.null.npy", nulls)
+
+
+def _read_strings(path: str) -> List[Any]:
+    """读取字符串列，缺失值还原为NaN
+
+    按字节偏移直接从mmap的缓冲区逐项解码，不复制整个缓冲区，也不生成中间的整列字符串。
+    """
+    buf = memoryview(np.load(f"{path}.buf.npy", mmap_mode='r'))
+    offsets = np.load(f"{path}.offsets.npy").tolist()
+    # 每项末尾的NUL分隔符不属于字符串本身
+    values = [str(buf[start:end - 1], 'utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+    if os.path.exists(f"{path}.null.npy"):
+        nulls = np.load(f"{path}.null.npy")
+        for i in np.flatnonzero(nulls):
+            values[i] = np.nan
+    return values
+
+
+def _write_arrays(directory: str, prefix: str, arrays: Dict[str, Any]) -> None:
+    """写入一组数组，字符串列表按偏移编码保存"""
+    for name, value in arrays.items():
+        path = os.path.join(directory, f"{prefix}.{name}")
+        if isinstance(value, list):
+            _write_strings(path, value)
+        else:
+            np.save(f"{path}.npy", np.asarray(value))
+
+
+def _read_arrays(directory: str, prefix: str, names: Dict[str, str]) -> Dict[str, Any]:
+    """按{名称: 类型}读取一组数组，数值数组以mmap方式打开"""
+    arrays = {}
+    for name, kind in names.items():
+        path = os.path.join(directory, f"{prefix}.{name}")
+        if kind == 'str':
+            arrays[name] = _read_strings(path)
+        else:
+            arrays[name] = np.load(f"{path}.npy", mmap_mode='r')
+    return arrays
+
+
+_FIELD_ARRAYS = {
+    "tokens": 'str',
+    "indptr": 'array',
+    "rows": 'array',
+    "gram_keys": 'str',
+    "gram_indptr": 'array',
+    "gram_tokens": 'array',
+}
+
+_FACET_ARRAYS = {
+    "values": 'str',
+    "bitmaps": 'array',
+}
+
+_YEAR_ARRAYS = {
+    "years": 'array',
+    "cumulative": 'array',
+}
+
+_FUZZY_ARRAYS = {
+    "keys": 'str',
+    "indptr": 'array',
+    "rows": 'array',
+    "gram_keys": 'str',
+    "gram_indptr": 'array',
+    "gram_ids": 'array',
+}
+
+_PERSON_ARRAYS = {
+    "names": 'str',
+    "name_indptr": 'array',
+    "name_persons": 'array',
+    "persons": 'str',
+    "indptr": 'array',
+    "rows": 'array',
+}
+
+
+def _source_info(csv_path: str) -> Dict[str, Any]:
+    """CSV源文件的大小和修改时间，用于判断快照是否过期"""
+    stat = os.stat(csv_path)
+    return {"path": os.path.abspath(csv_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _people_info(csv_path: str) -> Optional[Dict[str, Any]]:
+    """person.csv的源文件信息，不存在时为None"""
+    person_csv = person_csv_path(csv_path)
+    return _source_info(person_csv) if os.path.exists(person_csv) else None
+
+
+def compile_snapshot(csv_path: str = DEFAULT_CSV, snapshot_dir: str = DEFAULT_SNAPSHOT,
+                     shard: Optional[Shard] = None) -> Dict[str, Any]:
+    """把movies.csv编译为列式快照目录（预处理后的列 + 检索索引），指定分片时只包含该分片的影片"""
+    start = time.perf_counter()
+    source = _source_info(csv_path)
+    people_source = _people_info(csv_path)
+    movies, index = parse_movies(csv_path, shard)
+
+    # 先写临时目录，完成后整体替换，避免服务读到写了一半的快照
+    tmp_dir = f"{snapshot_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = {**SNAPSHOT_COLUMNS, **(SHARD_COLUMNS if shard is not None else {})}
+    for column, kind in columns.items():
+        path = os.path.join(tmp_dir, f"column.{column}")
+        if kind == 'str':
+            _write_strings(path, movies[column].tolist())
+        else:
+            np.save(f"{path}.npy", movies[column].to_numpy(dtype=np.float64))
+    for key, field in index.fields.items():
+        _write_arrays(tmp_dir, f"index.{key}", field.to_arrays())
+    for key, facet in index.facets.items():
+        _write_arrays(tmp_dir, f"facet.{key}", facet.to_arrays())
+    _write_arrays(tmp_dir, "facet.year", index.years.to_arrays())
+    _write_arrays(tmp_dir, "persons", index.persons.to_arrays())
+    for key, fuzzy in index.fuzzy.items():
+        _write_arrays(tmp_dir, f"fuzzy.{key}", fuzzy.to_arrays())
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "columns": SNAPSHOT_COLUMNS,
+        "fuzzy_keys": FUZZY_KEY_SCHEME,
+        "rows": len(movies),
+        "source": source,
+        "people": people_source,
+        "shard": list(shard) if shard is not None else None,
+        "rank_bounds": movies.attrs.get('rank_bounds'),
+        "created": time.time(),
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.rename(tmp_dir, snapshot_dir)
+    logger.info(f"Snapshot compiled to {snapshot_dir}: {len(movies)} rows in {time.perf_counter() - start:.2f}s")
+    return meta
+
+
+def read_meta(snapshot_dir: str = DEFAULT_SNAPSHOT) -> Optional[Dict[str, Any]]:
+    """读取快照元数据，不存在或损坏时返回None"""
+    try:
+        with open(os.path.join(snapshot_dir, "meta.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def is_fresh(snapshot_dir: str = DEFAULT_SNAPSHOT, csv_path: str = DEFAULT_CSV, shard: Optional[Shard] = None) -> bool:
+    """快照存在、格式匹配且与CSV源文件一致时返回True；CSV不存在时以快照为准"""
+    meta = read_meta(snapshot_dir)
+    if not meta:
+        return False
+    if meta.get("version") != SNAPSHOT_VERSION or meta.get("columns") != SNAPSHOT_COLUMNS:
+        return False
+    if meta.get("shard") != (list(shard) if shard is not None else None):
+        return False
+    # 容错键生成方式（是否安装pypinyin）不同，快照中的键无法与查询键对应
+    if meta.get("fuzzy_keys") != FUZZY_KEY_SCHEME:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    source = _source_info(csv_path)
+    recorded = meta.get("source", {})
+    if recorded.get("size") != source["size"] or recorded.get("mtime_ns") != source["mtime_ns"]:
+        return False
+    # person.csv新增、删除或修改都需要重建人物索引
+    people_source = _people_info(csv_path)
+    recorded = meta.get("people")
+    if people_source is None or recorded is None:
+        return people_source is None and recorded is None
+    return recorded.get("size") == people_source["size"] and recorded.get("mtime_ns") == people_source["mtime_ns"]
+
+
+def dataset_version(csv_path: str = DEFAULT_CSV, snapshot_dir: str = DEFAULT_SNAPSHOT,
+                    shard: Optional[Shard] = None) -> str:
+    """当前数据集的版本标识：快照有效时取快照编译时间，否则取CSV的修改时间和大小"""
+    if is_fresh(snapshot_dir, csv_path, shard):
+        return f"snapshot:{read_meta(snapshot_dir).get('created')}"
+    try:
+        source = _source_info(csv_path)
+    except OSError:
+        return "missing"
+    people_source = _people_info(csv_path)
+    if people_source is not None:
+        return f"csv:{source['mtime_ns']}:{source['size']}:{people_source['mtime_ns']}"
+    return f"csv:{source['mtime_ns']}:{source['size']}"
+
+
+def load_snapshot(snapshot_dir: str = DEFAULT_SNAPSHOT) -> Tuple[pd.DataFrame, MovieIndex]:
+    """加载快照，返回(movies, index)；数值列和索引的数值数组以mmap方式映射，工具进程间共享物理页"""
+    meta = read_meta(snapshot_dir) or {}
+    columns = {}
+    for column, kind in {**SNAPSHOT_COLUMNS, **(SHARD_COLUMNS if meta.get("shard") else {})}.items():
+        path = os.path.join(snapshot_dir, f"column.{column}")
+        if kind == 'str':
+            columns[column] = pd.Series(_read_strings(path), dtype=object)
+        else:
+            columns[column] = pd.Series(np.load(f"{path}.npy", mmap_mode='r'), dtype=np.float64, copy=False)
+    # copy=False：DataFrame直接引用mmap数组，不合并复制数值列
+    movies = pd.DataFrame(columns, copy=False)
+    if meta.get("rank_bounds"):
+        movies.attrs['rank_bounds'] = meta["rank_bounds"]
+
+    fields = {
+        key: FieldIndex.from_arrays(_read_arrays(snapshot_dir, f"index.{key}", _FIELD_ARRAYS), sep=sep)
+        for key, (_, sep) in MovieIndex.FIELDS.items()
+    }
+    facets = {
+        key: FacetIndex.from_arrays(_read_arrays(snapshot_dir, f"facet.{key}", _FACET_ARRAYS), len(movies), sep=sep)
+        for key, (_, sep) in MovieIndex.FACETS.items()
+    }
+    years = YearFacet.from_arrays(_read_arrays(snapshot_dir, "facet.year", _YEAR_ARRAYS), len(movies))
+    persons = PersonIndex.from_arrays(_read_arrays(snapshot_dir, "persons", _PERSON_ARRAYS))
+    fuzzy = {
+        key: FuzzyIndex.from_arrays(_read_arrays(snapshot_dir, f"fuzzy.{key}", _FUZZY_ARRAYS))
+        for key in MovieIndex.FUZZY
+    }
+    return movies, MovieIndex(movies, fields=fields, facets=facets, years=years, persons=persons, fuzzy=fuzzy)
+
+
+def load_movies(csv_path: str = DEFAULT_CSV, snapshot_dir: str = DEFAULT_SNAPSHOT,
+                shard: Optional[Shard] = None) -> Tuple[pd.DataFrame, MovieIndex]:
+    """优先加载快照，快照缺失或过期时回退到解析CSV"""
+    start = time.perf_counter()
+    if is_fresh(snapshot_dir, csv_path, shard):
+        movies, index = load_snapshot(snapshot_dir)
+        logger.info(f"Movies loaded from snapshot {snapshot_dir} in {time.perf_counter() - start:.2f}s, rows: {len(movies)}")
+        return movies, index
+
+    logger.warning(f"Snapshot {snapshot_dir} missing or stale, parsing {csv_path} (run 'python snapshot.py compile' to speed up startup)")
+    movies, index = parse_movies(csv_path, shard)
+    logger.info(f"Movies loaded from CSV in {time.perf_counter() - start:.2f}s, rows: {len(movies)}")
+    return movies, index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Douban movie snapshot tool')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compile_parser = subparsers.add_parser('compile', help='Compile movies.csv into a columnar snapshot')
+    compile_parser.add_argument('--csv', type=str, default=DEFAULT_CSV, help='Path to movies.csv')
+    compile_parser.add_argument('--out', type=str, default=DEFAULT_SNAPSHOT, help='Snapshot directory')
+    compile_parser.add_argument('--shard', type=str, help='Compile only shard i/n (written to <out>.shard<i>-of-<n>)')
+
+    check_parser = subparsers.add_parser('check', help='Check whether a snapshot is up to date')
+    check_parser.add_argument('--csv', type=str, default=DEFAULT_CSV, help='Path to movies.csv')
+    check_parser.add_argument('--out', type=str, default=DEFAULT_SNAPSHOT, help='Snapshot directory')
+    check_parser.add_argument('--shard', type=str, help='Check the snapshot of shard i/n')
+
+    args = parser.parse_args()
+    shard = parse_shard(args.shard)
+    snapshot_dir = shard_snapshot_dir(args.out, shard)
+    if args.command == 'compile':
+        compile_snapshot(args.csv, snapshot_dir, shard)
+    elif args.command == 'check':
+        fresh = is_fresh(snapshot_dir, args.csv, shard)
+        logger.info(f"Snapshot {snapshot_dir} is {'fresh' if fresh else 'stale'}")
+        raise SystemExit(0 if fresh else 1)
+
+
+if __name__ == "__main__":
+    main()
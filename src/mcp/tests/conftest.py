@@ -0,0 +1,5 @@
+import os
+import sys
+
+# MCP服务端模块按目录平铺导入（与server.py相同）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,92 @@
+"""索引路径（MovieIndex.filter / MovieCatalog.search_medias）与str.contains扫描路径（scan_movies）结果一致"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog import MovieCatalog
+from search_index import MovieIndex, sample_queries
+
+# 含捕获组的查询由str.contains按正则解释，pandas对此给出的提示与本测试无关
+pytestmark = pytest.mark.filterwarnings("ignore:This pattern is interpreted as a regular expression")
+
+NAN = np.nan
+
+MOVIES = pd.DataFrame([
+    # NAME, ALIAS, DIRECTORS, ACTORS, DIRECTOR_IDS, ACTOR_IDS, GENRES, REGIONS, LANGUAGES, YEAR, SCORE, VOTES
+    ["星际穿越", "Interstellar/星际启示录", "克里斯托弗·诺兰/Christopher Nolan", "马修·麦康纳/安妮·海瑟薇",
+     "克里斯托弗·诺兰:1001", "马修·麦康纳:2001|安妮·海瑟薇:2002", "科幻/冒险", "美国/英国", "英语", 2014, 9.4, 1.8e6],
+    ["盗梦空间", "Inception", "克里斯托弗·诺兰", "莱昂纳多·迪卡普里奥/渡边谦",
+     "克里斯托弗·诺兰:1001", "莱昂纳多·迪卡普里奥:2003|渡边谦:2004", "科幻/悬疑", "美国/英国", "英语/日语", 2010, 9.4, 2.0e6],
+    ["C++ Primer: The (Movie)", NAN, "A.B. Smith", "Jane Doe",
+     "A.B. Smith:1002", "Jane Doe:2005", "纪录片", "美国", "英语", 2001, NAN, 12],
+    ["a.b.c", NAN, "AxB Smith", "John Roe", NAN, NAN, "剧情", "加拿大", "英语/法语", 1999, 6.1, 300],
+    [NAN, NAN, NAN, NAN, NAN, NAN, NAN, NAN, NAN, NAN, NAN, NAN],
+    ["Straße der Träume", NAN, "Fritz Lang", "ÉDITH Piaf/édith piaf",
+     "Fritz Lang:1003", "ÉDITH Piaf:2006", "剧情/音乐", "德国/法国", "德语", 1961, 7.0, 1500],
+    ["繁花", "Blossoms Shanghai", "王家卫", "胡歌/马伊琍/唐嫣",
+     "王家卫:1004", "胡歌:2007|马伊琍:2008|唐嫣:2009", "剧情", "中国大陆", "汉语普通话/上海话", 2023, 8.7, 5.0e5],
+    ["赌圣", NAN, "元奎/刘镇伟", "周星驰/吴孟达",
+     "元奎:1005|刘镇伟:1006", "周星驰:2010|吴孟达:2011", "喜剧", "中国香港", "粤语", 1990, 7.9, 3.0e5],
+    ["英雄", "Hero", "张艺谋", "李连杰/梁朝伟/张曼玉/陈道明",
+     "张艺谋:1007", "李连杰:2012|梁朝伟:2013|张曼玉:2014|陈道明:2015", "剧情/动作/武侠", "中国大陆/中国香港", "汉语普通话", 2002, 7.7, 4.0e5],
+    ["一个都不能少", NAN, "张艺谋", "魏敏芝", "张艺谋:1007", "魏敏芝:2016", "剧情", "中国大陆", "汉语普通话", 1999, 8.1, 1.0e5],
+    ["空", "", "", "", "", "", "", "", "", 1980, 5.0, 10],
+], columns=["NAME", "ALIAS", "DIRECTORS", "ACTORS", "DIRECTOR_IDS", "ACTOR_IDS", "GENRES", "REGIONS",
+            "LANGUAGES", "YEAR", "DOUBAN_SCORE", "DOUBAN_VOTES"])
+
+QUERIES = [
+    # 子串与完整值
+    {"name": "星际"}, {"name": "穿越"}, {"name": "繁花"}, {"name": "不存在"},
+    # 正则元字符：str.contains按正则解释，索引需回退到扫描
+    {"name": "a.b"}, {"name": "."}, {"name": "(Movie)"}, {"name": r"C\+\+"}, {"name": "^盗"},
+    {"name": "空间$"}, {"name": "星|繁"}, {"director": "A.B."}, {"actor": "[胡马]"},
+    # 跨越分隔符的值
+    {"director": "诺兰/Christopher"}, {"genre": "科幻/冒险"}, {"region": "国/英"}, {"language": "普通话/上"},
+    # 大小写折叠
+    {"name": "A.B.C"}, {"name": "STRASSE"}, {"name": "straße"}, {"director": "christopher nolan"},
+    {"actor": "édith"}, {"actor": "ÉDITH PIAF"}, {"name": "c++ primer".replace("+", r"\+")},
+    # 人名：精确命中走PERSON_ID，否则按子串
+    {"director": "张艺谋"}, {"actor": "张艺谋"}, {"actor": "陈道明"}, {"director": "张"}, {"actor": "周星"},
+    # 分面和年份
+    {"genre": "剧情"}, {"genre": "科"}, {"region": "中国"}, {"language": "英语"}, {"language": "粤"},
+    {"min_year": "2010"}, {"max_year": 2000}, {"min_year": "1990", "max_year": "2005"}, {"min_year": "abc"},
+    # 空值与组合条件
+    {"name": ""}, {"name": None}, {}, {"genre": "剧情", "region": "中国大陆", "min_year": 1995},
+    {"director": "张艺谋", "actor": "李连杰"}, {"name": "英", "genre": "武侠"}, {"actor": "渡边", "language": "日"},
+]
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    movies = MOVIES.copy()
+    return MovieCatalog(movies, MovieIndex(movies))
+
+
+def query_id(query):
+    return repr(query)
+
+
+@pytest.mark.parametrize("query", QUERIES, ids=query_id)
+def test_filter_matches_scan(catalog, query):
+    expected = catalog.scan_movies(query).index.to_numpy(dtype=np.int64)
+    actual = catalog.index.filter(query, catalog.movies)
+    assert actual.tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("sort_by", ["YEAR", "DOUBAN_SCORE", "DOUBAN_VOTES", "BLEND"])
+@pytest.mark.parametrize("query", QUERIES, ids=query_id)
+def test_search_medias_matches_scan(catalog, query, sort_by):
+    expected_rows = catalog.scan_movies(query).index.to_numpy(dtype=np.int64)
+    if len(expected_rows) == 0:
+        pytest.skip("no exact match, search_medias falls back to fuzzy matching")
+    expected = catalog._rank_names(expected_rows, limit=5, sort_by=sort_by)
+    assert catalog.search_medias(query, limit=5, sort_by=sort_by) == expected
+
+
+def test_queries_exercise_matches(catalog):
+    hits = [len(catalog.scan_movies(query)) for query in QUERIES]
+    assert sum(1 for count in hits if count) > len(QUERIES) // 2
+
+
+def test_sampled_queries(catalog):
+    assert catalog.verify_search_index(sample_queries(catalog.movies, count=300)) == []
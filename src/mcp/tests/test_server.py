@@ -0,0 +1,41 @@
+"""MCPServer工具执行：准入名额在各种失败路径上都会归还"""
+import asyncio
+import os
+
+import pytest
+
+from cache import make_cache_key
+from server import MCPServer
+from test_search_index import MOVIES
+
+HOT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'movie.xlsx')
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("douban")
+    csv_path = str(directory / "movies.csv")
+    MOVIES.to_csv(csv_path, index=False)
+    return MCPServer(movies_csv=csv_path, snapshot_dir=str(directory / "movies.snapshot"),
+                     hot_path=HOT_PATH, heartbeat_interval=0)
+
+
+def test_bad_kwargs_release_the_gate(server):
+    async def calls():
+        bad = await server.execute_tool("search_medias", {"query": {"name": "繁花"}, "bogus": 1})
+        good = await server.execute_tool("search_medias", {"query": {"name": "繁花"}})
+        return bad, good
+
+    bad, good = asyncio.run(calls())
+    assert bad["success"] is False and "bogus" in bad["error"]
+    assert good == {"success": True, "result": ["繁花"]}
+    assert server.gates["search_medias"].running == 0
+    assert server.inflight == 0
+
+
+def test_invalid_sort_by_is_an_error_not_cached(server):
+    parameters = {"query": {"genre": "剧情"}, "sort_by": "RATING"}
+    result = asyncio.run(server.execute_tool("search_medias", parameters))
+    assert result["success"] is False and "RATING" in result["error"]
+    hit, _ = server.cache.get(make_cache_key("search_medias", parameters))
+    assert not hit
@@ -0,0 +1,51 @@
+"""快照往返：load_snapshot加载的数据集和索引与直接解析CSV的结果一致"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from catalog import MovieCatalog
+from snapshot import SNAPSHOT_COLUMNS, compile_snapshot, load_snapshot, parse_movies
+from test_search_index import MOVIES, QUERIES
+
+pytestmark = pytest.mark.filterwarnings("ignore:This pattern is interpreted as a regular expression")
+
+
+@pytest.fixture(scope="module")
+def paths(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("douban")
+    csv_path = str(directory / "movies.csv")
+    MOVIES.to_csv(csv_path, index=False)
+    snapshot_dir = str(directory / "movies.snapshot")
+    compile_snapshot(csv_path, snapshot_dir)
+    return csv_path, snapshot_dir
+
+
+def test_columns_round_trip(paths):
+    csv_path, snapshot_dir = paths
+    parsed, _ = parse_movies(csv_path)
+    loaded, _ = load_snapshot(snapshot_dir)
+    pd.testing.assert_frame_equal(loaded, parsed[list(SNAPSHOT_COLUMNS)], check_dtype=False)
+
+
+def mapped(array):
+    """数组（或其视图的底层数组）来自np.memmap"""
+    while array is not None and not isinstance(array, np.memmap):
+        array = getattr(array, 'base', None)
+    return array is not None
+
+
+def test_numeric_columns_are_mapped(paths):
+    _, snapshot_dir = paths
+    loaded, _ = load_snapshot(snapshot_dir)
+    for column, kind in SNAPSHOT_COLUMNS.items():
+        if kind == 'float':
+            assert mapped(loaded[column].to_numpy()), column
+
+
+def test_snapshot_search_matches_csv(paths):
+    csv_path, snapshot_dir = paths
+    parsed = MovieCatalog(*parse_movies(csv_path))
+    loaded = MovieCatalog(*load_snapshot(snapshot_dir))
+    for query in QUERIES:
+        assert loaded.search_medias(query) == parsed.search_medias(query), query
+    assert loaded.verify_search_index(QUERIES) == []
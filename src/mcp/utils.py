@@ -1,8 +1,11 @@
 import json
 import time
+import struct
 import hashlib
+import asyncio
 import logging
-from typing import Dict, Any, Optional
+import aiohttp
+from typing import Dict, Any, Optional, Callable, Awaitable
 
 # 配置日志
 logging.basicConfig(
@@ -67,3 +70,164 @@ def validate_tool_request(request: Dict[str, Any]) -> Dict[str, Any]:
             return {"valid": False, "error": f"Missing required field: {field}"}
     
     return {"valid": True}
+
+# 请求剩余时间预算（秒）的请求头：每一跳把收到请求时的预算换算成本地截止时间，
+# 向下游转发时只传递剩余的部分；Unix域套接字和批量请求的每一项以"timeout"字段携带
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+class DeadlineExceeded(Exception):
+    """请求的截止时间已过，未完成的工作被取消"""
+
+def parse_budget(value: Any) -> Optional[float]:
+    """解析时间预算（秒），缺失或无效时返回None（不限时）"""
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        return None
+    return budget if budget == budget else None
+
+def deadline_after(budget: Optional[float]) -> Optional[float]:
+    """把时间预算换算为截止时间（time.time()，进程池中的工具进程也能比较）"""
+    return None if budget is None else time.time() + budget
+
+def time_left(deadline: Optional[float]) -> Optional[float]:
+    """距截止时间的剩余秒数，不限时为None"""
+    return None if deadline is None else deadline - time.time()
+
+def deadline_bucket(deadline: Optional[float], width: float = 0.5) -> str:
+    """截止时间所在的时间段（宽width秒），合并调用时只合并同一时间段内的截止时间"""
+    return "-" if deadline is None else str(int(deadline // width))
+
+def earliest(*deadlines: Optional[float]) -> Optional[float]:
+    """多个截止时间中最早的一个"""
+    deadlines = [deadline for deadline in deadlines if deadline is not None]
+    return min(deadlines) if deadlines else None
+
+# Unix域套接字的帧格式：4字节大端长度 + UTF-8 JSON
+FRAME_HEADER = struct.Struct('>I')
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+def encode_frame(data: Any) -> bytes:
+    """编码一帧：紧凑JSON加长度前缀"""
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return FRAME_HEADER.pack(len(body)) + body
+
+async def read_frame(reader: asyncio.StreamReader) -> Optional[Any]:
+    """读取一帧并解码，对端关闭连接时返回None"""
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame too large: {length} bytes")
+    return json.loads(await reader.readexactly(length))
+
+class ConnectionPool:
+    """持久连接池：复用到下游服务的TCP连接，并统计连接新建与复用次数
+
+    session需在事件循环中通过open()创建；keepalive_timeout应小于下游服务端的空闲超时（aiohttp默认75秒）。
+    """
+    
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, keepalive_timeout: float = 30.0):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.created = 0  # 新建的连接数
+        self.reused = 0   # 复用空闲连接的请求数
+    
+    async def _on_connection_create(self, session, context, params):
+        self.created += 1
+    
+    async def _on_connection_reuse(self, session, context, params):
+        self.reused += 1
+    
+    def open(self) -> aiohttp.ClientSession:
+        """创建（或返回已有的）ClientSession"""
+        if self.session is None or self.session.closed:
+            trace = aiohttp.TraceConfig()
+            trace.on_connection_create_end.append(self._on_connection_create)
+            trace.on_connection_reuseconn.append(self._on_connection_reuse)
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,                          # 最大连接数
+                limit_per_host=self.limit_per_host,        # 每个主机的最大连接数
+                keepalive_timeout=self.keepalive_timeout,  # 空闲连接保留时间
+                enable_cleanup_closed=True                 # 自动清理关闭的连接
+            )
+            self.session = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+        return self.session
+    
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+    
+    def stats(self) -> Dict[str, Any]:
+        """连接池占用和复用统计"""
+        connector = self.session.connector if self.session and not self.session.closed else None
+        # aiohttp没有公开连接池占用的接口，读取TCPConnector的内部状态
+        idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values()) if connector else 0
+        acquired = len(getattr(connector, "_acquired", ())) if connector else 0
+        connections = self.created + self.reused
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "keepalive_timeout": self.keepalive_timeout,
+            "acquired": acquired,
+            "idle": idle,
+            "created": self.created,
+            "reused": self.reused,
+            "reuse_rate": self.reused / connections if connections else 0.0
+        }
+
+class SingleFlight:
+    """合并并发的相同调用：某个键的调用执行期间，后到的相同调用等待同一个结果，不再重复执行
+
+    上游调用在独立的任务中运行，某个发起者被取消（如TV端断开）不会影响其他等待者；
+    每个等待者最多等到自己的截止时间，超时抛出asyncio.TimeoutError；
+    所有等待者都已离开（断开或截止时间已过）时取消上游调用并移除该键，后到的相同调用重新执行。
+    """
+    
+    def __init__(self):
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.waiters: Dict[asyncio.Future, int] = {}  # 上游调用 -> 等待者数
+        self.executed = 0   # 实际执行的调用数
+        self.coalesced = 0  # 合并到已有调用上的请求数
+        self.abandoned = 0  # 因无人等待而取消的调用数
+    
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Any:
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self.calls.pop(key, None) if self.calls.get(key) is done else None)
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        self.waiters[task] = self.waiters.get(task, 0) + 1
+        try:
+            timeout = time_left(deadline)
+            if timeout is None:
+                return await asyncio.shield(task)
+            return await asyncio.wait_for(asyncio.shield(task), max(timeout, 0))
+        finally:
+            self.waiters[task] -= 1
+            if not self.waiters[task]:
+                del self.waiters[task]
+                if not task.done():
+                    # 先移除键，避免后到的调用合并到已取消的任务上
+                    if self.calls.get(key) is task:
+                        del self.calls[key]
+                    task.cancel()
+                    self.abandoned += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        requests = self.executed + self.coalesced
+        return {
+            "inflight": len(self.calls),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "coalesce_rate": self.coalesced / requests if requests else 0.0
+        }
@@ -0,0 +1,127 @@
+import json
+import time
+import argparse
+from typing import Any, Dict, Iterator, List
+from utils import FRAME_HEADER
+
+# msgpack为可选依赖，未安装时只提供JSON/SSE格式
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 工具结果的传输格式，按请求的Accept头协商，默认JSON-in-SSE
+SSE = 'text/event-stream'
+MSGPACK = 'application/x-msgpack'  # 长度前缀帧序列：4字节大端长度 + msgpack编码的数据
+
+
+def negotiate(accept: str) -> str:
+    """Accept中包含msgpack且已安装msgpack时使用二进制帧，否则使用SSE"""
+    if msgpack is not None and MSGPACK in (accept or ''):
+        return MSGPACK
+    return SSE
+
+
+def pack(data: Any) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def encode(data: Any, wire_format: str = SSE) -> bytes:
+    """按传输格式编码一帧"""
+    if wire_format == MSGPACK:
+        body = pack(data)
+        return FRAME_HEADER.pack(len(body)) + body
+    return f"data: {json.dumps(data)}\n\n".encode('utf-8')
+
+
+def envelope(request_id: Any, payload: bytes) -> bytes:
+    """把已编码的msgpack数据直接包进 {"request_id": ..., "data": ...} 帧，转发时无需解码再编码"""
+    body = b'\x82' + pack("request_id") + pack(request_id) + pack("data") + payload
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def iter_payloads(body: bytes) -> Iterator[bytes]:
+    """按长度前缀切分帧，逐个返回未解码的msgpack数据"""
+    offset = 0
+    while offset + FRAME_HEADER.size <= len(body):
+        (length,) = FRAME_HEADER.unpack_from(body, offset)
+        offset += FRAME_HEADER.size
+        yield body[offset:offset + length]
+        offset += length
+
+
+def decode_frames(body: bytes) -> List[Any]:
+    return [msgpack.unpackb(payload, raw=False) for payload in iter_payloads(body)]
+
+
+def _sample_results() -> Dict[str, Dict[str, Any]]:
+    """基准测试用的典型工具响应：一页片名和热门排行"""
+    names = [f"影片{i:03d}：一个中等长度的片名" for i in range(100)]
+    hot = [{"id": i, "title": f"热门影片{i}", "票房": f"{9000 - i * 7}万"} for i in range(50)]
+
+    def response(tool_name, parameters, result):
+        return {"tool_name": tool_name, "parameters": parameters, "result": result, "success": True, "error": None}
+
+    return {
+        "search_medias(100)": response("search_medias", {"query": {"genre": "科幻"}, "limit": 100}, names),
+        "hot_medias(50)": response("hot_medias", {"query": "hot", "top_n": 50}, hot),
+    }
+
+
+def _timeit(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def bench(repeat: int = 2000) -> List[Dict[str, Any]]:
+    """对比每一跳的CPU耗时（微秒）和字节数
+
+    server: 编码工具响应；client: SSE需解析后重新包装，msgpack只拼接帧头；django: 解码最终响应。
+    """
+    rows = []
+    for name, data in _sample_results().items():
+        server_sse = encode(data)
+        client_sse = encode({"request_id": "r1", "data": data})
+        row = {
+            "result": name,
+            "sse_bytes": len(client_sse),
+            "sse_server_us": _timeit(lambda: encode(data), repeat),
+            "sse_client_us": _timeit(lambda: encode({"request_id": "r1", "data": json.loads(server_sse[5:].strip())}), repeat),
+            "sse_django_us": _timeit(lambda: json.loads(client_sse[5:].strip()), repeat),
+        }
+        if msgpack is not None:
+            server_frame = encode(data, MSGPACK)
+            client_frame = envelope("r1", server_frame[FRAME_HEADER.size:])
+            assert decode_frames(client_frame)[0] == {"request_id": "r1", "data": data}
+            row.update({
+                "msgpack_bytes": len(client_frame),
+                "msgpack_server_us": _timeit(lambda: encode(data, MSGPACK), repeat),
+                "msgpack_client_us": _timeit(lambda: envelope("r1", next(iter_payloads(server_frame))), repeat),
+                "msgpack_django_us": _timeit(lambda: decode_frames(client_frame), repeat),
+            })
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MCP wire format benchmark')
+    parser.add_argument('--repeat', type=int, default=2000, help='Iterations per measurement')
+    args = parser.parse_args()
+
+    if msgpack is None:
+        print("msgpack is not installed, only JSON/SSE is measured")
+    for row in bench(args.repeat):
+        print(row["result"])
+        for wire_format in ('sse', 'msgpack'):
+            if f"{wire_format}_bytes" not in row:
+                continue
+            print(f"  {wire_format:8s} {row[f'{wire_format}_bytes']:6d} bytes  "
+                  f"server {row[f'{wire_format}_server_us']:7.1f}us  "
+                  f"client {row[f'{wire_format}_client_us']:7.1f}us  "
+                  f"django {row[f'{wire_format}_django_us']:7.1f}us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+import os
+import time
+from typing import Dict, Any, Optional
+from catalog import MovieCatalog
+
+# 每个工具进程各自持有一份数据集，快照中的数值数组通过mmap在进程间共享物理页
+_catalog = None
+
+
+def init_worker(movies_csv: str, snapshot_dir: str, shard=None) -> None:
+    """进程池initializer：在工具进程中加载数据集（分片模式下只加载本分片）"""
+    global _catalog
+    _catalog = MovieCatalog.load(movies_csv, snapshot_dir, shard)
+
+
+def ping() -> int:
+    """预热用空任务，返回工具进程pid"""
+    return os.getpid()
+
+
+def run_tool(tool_name: str, parameters: Dict[str, Any], deadline: Optional[float] = None) -> Any:
+    """在工具进程中执行CPU密集型工具，工具名对应MovieCatalog的同名方法
+
+    deadline（time.time()）已过说明调用方已放弃，不再执行。
+    """
+    if deadline is not None and time.time() >= deadline:
+        raise TimeoutError(f"Deadline exceeded before running {tool_name}")
+    return getattr(_catalog, tool_name)(**parameters)